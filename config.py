@@ -1,5 +1,6 @@
 import os
 import sys
+import tempfile
 import threading
 import time
 
@@ -169,14 +170,100 @@ FILE_ORDERS = os.path.join(BASE_DIR, "db_orders.csv")
 FILE_LOGS = os.path.join(BASE_DIR, "db_logs.csv")
 FILE_LINE_STATUS = os.path.join(BASE_DIR, "db_line_status.json")
 
+# 持久連線（詳見 db_pool.py）：每個程序保留數條讀取/寫入連線重複使用
+DB_PERSISTENT_CONNECTIONS = True
+# 連線閒置超過幾秒，下次使用前先檢查連線是否正常
+DB_HEALTH_CHECK_SECONDS = 30
+# 每個程序的讀取 / 寫入連線數（多個 session 同時查詢時各自使用一條，不必排隊）
+DB_POOL_READERS = 4
+DB_POOL_WRITERS = 2
+# 所有連線都在使用中時，等待其他 session 歸還的上限（秒），逾時改用臨時連線
+DB_POOL_WAIT_SECONDS = 5
+
+# 本機寫入日誌（詳見 write_journal.py）
+# True = PASS/NG 紀錄先寫入本機日誌立即返回，由背景執行緒同步到共用資料庫（網路磁碟慢或鎖定時不影響作業）
+WRITE_JOURNAL_ENABLED = False
+JOURNAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_journal.sqlite")
+
+# 本班紀錄（get_session_logs）在畫面上沿用的秒數；本機 PASS/NG/撤銷會立即更新，
+# 逾時後才重新向資料庫查詢（反映其他平板的寫入）
+SESSION_LOGS_REFRESH_SECONDS = 10
+
+# 產品目錄快取（詳見 product_catalog.py）：程序內所有 session 共用一份，
+# 每隔幾秒檢查一次資料庫中的版本號，有變動才重新載入
+PRODUCT_CATALOG_CHECK_SECONDS = 5
+
+# 生產紀錄工作範圍：每個 session 只載入最近幾天（今天往前 N 天的 00:00 起）的紀錄，
+# 較舊的紀錄由 data_loader.load_older_logs() 分頁載入，報表直接以 get_logs_between() 查詢
+PRODUCTION_LOGS_WINDOW_DAYS = 1
+
+# 資料庫後端（詳見 db_service.py）
+# "sqlite" = 各平板直接開啟共用資料庫檔案；"service" = PASS/NG 紀錄送到單一寫入者資料庫服務
+# 注意："service" 只涵蓋秤重紀錄的寫入（PASS/NG、本機日誌同步、撤銷紀錄與對應的工單完成數量）；
+#       工單/產品的載入與存檔、新增工單、變更工單狀態、本班紀錄與班別統計查詢、後台報表
+#       仍直接開啟共用資料庫檔案，因此平板仍需能存取伺服器上的資料庫
+DB_BACKEND = "sqlite"
+# 資料庫服務位址（在伺服器上執行 python db_service.py，平板填伺服器 IP）
+DB_SERVICE_ADDRESS = "tcp://127.0.0.1:8765"
+
 # ==========================================
 # 3. ⚖️ 磅秤硬體設定 (關鍵修改區)
 # ==========================================
 # 設定您剛剛測試出來的正確 Port
-SCALE_PORT = "COM5"
+# （可用環境變數 SCALE_PORT 覆寫，例如指向 scale_simulator.py 建立的虛擬磅秤）
+SCALE_PORT = os.environ.get("SCALE_PORT", "COM5")
 
 # 傳輸速率 (通常是 9600，如果亂碼改 2400)
-SCALE_BAUDRATE = 9600 
+SCALE_BAUDRATE = 9600
+
+# 磅秤通訊協定（依儀表輸出格式選擇，詳見 scale_protocols.py）
+# "generic" = 任意文字，取第一個小數（舊版行為，無穩定旗標）
+# "csv"     = ST,GS,+0025.30kg 格式
+# "and"     = A&D 格式，例如 ST,+00025.30  kg
+# "toledo"  = Mettler Toledo 連續輸出
+SCALE_PROTOCOL = "generic"
+
+# 穩定判斷來源
+# "auto"     = 儀表有回報 ST/US 穩定旗標時直接採用（立即鎖定重量），沒有時才用軟體判斷
+# "software" = 一律使用軟體判斷（stability.py 穩定判斷引擎）
+SCALE_STABLE_SOURCE = "auto"
+
+# 本機磅秤所屬產線（用於套用下方該產線的穩定判斷參數，None = 使用 default）
+SCALE_LINE = None
+
+# 穩定判斷引擎參數（可依產線覆寫，未列出的項目使用 stability.DEFAULT_SETTINGS）
+# window_seconds: 時間窗長度（秒）；tolerance: 窗內最大最小差（kg）
+# min_samples: 窗內最少讀數筆數；min_weight: 低於此重量視為空秤
+STABILITY_SETTINGS = {
+    "default": {"window_seconds": 0.3, "tolerance": 0.15, "min_samples": 3},
+    # "Line 2": {"tolerance": 0.1},
+}
+
+# 多磅秤讀取來源（主管站總覽模式顯示各產線即時重量，詳見 multi_scale_reader.py）
+# {產線: 來源}，來源可為串口（"COM6"、"/dev/ttyUSB0"）或串口轉網路（"tcp://IP:埠號"）
+# 未列出的產線在總覽模式不顯示重量；鎖定產線若列於此處，也改由多磅秤服務讀取
+SCALE_SOURCES = {
+    # "Line 1": "tcp://172.16.3.161:4001",
+    # "Line 2": "COM6",
+}
+
+# 背景讀取器的環狀緩衝區大小（保留最近 N 筆讀數，20Hz 約 12 秒）
+SCALE_BUFFER_SIZE = 256
+
+# 最新讀數超過幾秒未更新即視為「無數據」（避免顯示過期重量）
+SCALE_STALE_SECONDS = 2.0
+
+# 同一台電腦上多個程序共用一個磅秤（詳見 shared_weight.py）
+# True = 只有一個程序開啟串口，讀數透過共享記憶體提供給其他程序
+SCALE_SHARED_ENABLED = True
+SCALE_SHARED_FILE = os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "scale_weight.shm"
+)
+
+# 是否記錄磅秤原始重量軌跡（供 PASS/NG 爭議時回放，詳見 trace_recorder.py）
+# 檔案只寫入本機目錄，不會寫入共用資料庫
+TRACE_RECORDER_ENABLED = False
+TRACE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scale_traces")
 
 # ⚠️ 是否使用模擬模式？
 # True  = 顯示拉條，手動拉重量 (測試用)
@@ -205,6 +292,10 @@ SHIFT_OPTIONS = ["早班", "中班", "晚班"]
 GROUP_OPTIONS = ["A", "B", "C", "D"]
 TEMP_OPTIONS = ["1260", "1200", "1300", "1400", "1500", "BIOSTAR"]
 
+# 預設開啟「自動記錄良品」的產線（作業員仍可在畫面上逐線切換）
+# 開啟後，磅秤穩定判斷鎖定的重量落在產品上下限內即自動記錄 PASS，物品移除後重新待命
+AUTO_RECORD_LINES = []
+
 # ==========================================
 # 6. 產品規格與密度邏輯
 # ==========================================
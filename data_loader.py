@@ -6,46 +6,50 @@
 
 import pandas as pd
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import streamlit as st
 import sqlite3
+import time
 import config
 import data_manager as dm
-from db_schema import get_connection, init_database
+from db_schema import (
+    content_event_id, delete_log, get_connection, init_database, insert_log_if_absent, log_time_columns,
+    new_event_id, to_epoch,
+)
+from db_service import DbServiceClient
+from models import LogBatch, LogEntry, WorkOrderBatch
+from product_catalog import PRODUCT_COLUMNS, ProductCatalog, build_index
+from write_journal import WriteJournal
 
-PRODUCT_COLUMNS = [
-    "產品ID", "客戶名", "溫度等級", "品種", "密度", "長", "寬", "高",
-    "下限", "準重", "上限", "備註1", "備註2", "備註3"
-]
+# 生產紀錄在 session 中額外保存的識別欄位（撤銷時以此刪除單筆）
+LOG_KEY_COLUMNS = ["id", "event_id"]
+# 班別統計（shift_summary）的數值欄位
+SHIFT_SUMMARY_FIELDS = ["良品數", "實重合計", "準重合計", "NG數", "粒子重"]
+
+
+@st.cache_resource
+def get_product_catalog():
+    """程序共用的產品目錄快取（詳見 product_catalog.py）"""
+    return ProductCatalog(lambda: get_connection(readonly=True))
+
+
+def get_products(force_check=False):
+    """
+    取得產品目錄並放入 st.session_state.products_db（所有 session 共用同一份，請勿直接修改）
+
+    參數:
+        force_check: 立即比對資料庫版本號（本程序剛寫入 products 時使用）
+    """
+    init_database()
+    df = get_product_catalog().get(force_check=force_check)
+    st.session_state.products_db = df
+    return df
 
 
 def reload_products():
     """從資料庫重新載入 products 到 session_state（避免用記憶體資料覆蓋 DB）"""
     try:
-        init_database()
-        conn = get_connection()
-        try:
-            query = f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products"
-            st.session_state.products_db = pd.read_sql_query(query, conn)
-
-            # 清理備註欄位中的 HTML 標籤（防止從 Excel 複製貼上時帶入 HTML）
-            import re
-
-            def clean_note_field(val):
-                if pd.isna(val) or str(val).lower() == 'none':
-                    return ""
-                val_str = str(val)
-                # 先移除所有 HTML 標籤（包括 </div>、<div> 等）
-                val_str = re.sub(r'<[^>]+>', '', val_str)
-                # 移除所有殘留的 < 和 > 字符（處理不完整的標籤）
-                val_str = val_str.replace('<', '').replace('>', '')
-                return val_str.strip()
-
-            for note_col in ['備註1', '備註2', '備註3']:
-                if note_col in st.session_state.products_db.columns:
-                    st.session_state.products_db[note_col] = st.session_state.products_db[note_col].apply(clean_note_field)
-        finally:
-            conn.close()
+        get_products(force_check=True)
     except Exception as e:
         # 如果載入失敗，至少確保有一個空的 DataFrame
         print(f"⚠️ 重新載入產品資料時發生錯誤：{e}")
@@ -54,6 +58,63 @@ def reload_products():
         raise
 
 
+# ==========================================
+# 產品 / 工單查詢索引（取代逐列比對）
+# ==========================================
+def get_product(product_id):
+    """
+    依產品ID取得產品資料（models.Product，共用，請勿修改），找不到回傳 None
+
+    [優化] 以字典索引查詢，取代 products_db[products_db["產品ID"] == pid].iloc[0] 的逐列比對；
+    索引隨產品目錄版本建立一次（程序共用），session 中另行修改過的產品表則只在該 session 建立
+    """
+    df = st.session_state.get('products_db')
+    if df is None or df.empty:
+        return None
+    index = get_product_catalog().index(df)
+    if index is None:
+        cached = st.session_state.get('products_index')
+        if cached is None or cached[0] is not df:
+            cached = (df, build_index(df))
+            st.session_state['products_index'] = cached
+        index = cached[1]
+    return index.get(product_id)
+
+
+def touch_work_orders():
+    """就地修改 work_orders_db（例如 df.at[...] = ...）後呼叫，讓依版本快取的索引與畫面重新建立"""
+    st.session_state['work_orders_version'] = st.session_state.get('work_orders_version', 0) + 1
+
+
+def work_orders_version():
+    """
+    目前 session 工單資料的版本：work_orders_db 被替換（載入、正規化排序等）或 touch_work_orders() 時改變
+    快取時請一併保存 DataFrame 本身並以 is 比對，避免舊物件被回收後 id 重複
+    """
+    return (id(st.session_state.get('work_orders_db')), st.session_state.get('work_orders_version', 0))
+
+
+def get_work_order(wo_id):
+    """
+    依工單號碼取得工單（models.WorkOrder），找不到回傳 None
+
+    [優化] 以 {工單號碼: WorkOrder} 索引查詢，工單資料版本改變時才重建；
+    工單號碼重複時以第一筆為準（與 df[df["工單號碼"] == x].iloc[0] 相同）
+    """
+    df = st.session_state.get('work_orders_db')
+    if df is None or df.empty:
+        return None
+    version = work_orders_version()
+    cached = st.session_state.get('work_orders_index')
+    if cached is None or cached[0] is not df or cached[1] != version:
+        index = {}
+        for order in WorkOrderBatch.from_frame(df):
+            index.setdefault(order.wo_id, order)
+        cached = (df, version, index)
+        st.session_state['work_orders_index'] = cached
+    return cached[2].get(wo_id)
+
+
 def upsert_products(df_products: pd.DataFrame):
     """
     將產品資料增量寫入資料庫：
@@ -111,6 +172,7 @@ def upsert_products(df_products: pd.DataFrame):
             conn.commit()
         finally:
             conn.close()
+        get_product_catalog().invalidate()
     except Exception as e:
         print(f"⚠️ 儲存產品資料時發生錯誤：{e}")
         # 重新檢查連線狀態
@@ -133,6 +195,337 @@ def delete_products(product_ids: list[str]):
         conn.commit()
     finally:
         conn.close()
+    get_product_catalog().invalidate()
+
+
+# ==========================================
+# 本機寫入日誌（秤重紀錄先寫本機，再由背景執行緒同步到共用資料庫）
+# ==========================================
+def _apply_journal_batch(items):
+    """
+    將一批日誌項目寫入共用資料庫（單一交易，冪等，見 db_schema.insert_log_if_absent）
+    使用資料庫服務時改由服務端寫入
+    """
+    pieces = []
+    for kind, payload in items:
+        if kind != "piece":
+            print(f"⚠️ 未知的日誌項目類型，已略過：{kind}")
+            continue
+        pieces.append(payload)
+
+    client = get_db_service_client()
+    if client is not None:
+        client.record_logs(pieces)
+        return
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        for payload in pieces:
+            insert_log_if_absent(cursor, payload["log"], payload.get("order"))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+@st.cache_resource
+def get_db_service_client():
+    """
+    取得資料庫服務客戶端（config.DB_BACKEND 不是 "service" 時回傳 None）
+    只用於秤重紀錄的寫入與撤銷；其他讀寫仍直接使用 get_connection()
+    """
+    if config.DB_BACKEND != "service":
+        return None
+    return DbServiceClient(config.DB_SERVICE_ADDRESS)
+
+
+@st.cache_resource
+def get_write_journal():
+    """取得本機寫入日誌（每個程序一個，未啟用時回傳 None）"""
+    if not config.WRITE_JOURNAL_ENABLED:
+        return None
+    try:
+        journal = WriteJournal(config.JOURNAL_FILE, _apply_journal_batch)
+        journal.start()
+        return journal
+    except Exception as e:
+        print(f"⚠️ 建立本機寫入日誌失敗，改為直接寫入資料庫：{e}")
+        return None
+
+
+def _existing_event_ids(conn, event_ids):
+    """
+    event_ids 中已寫入 production_logs 的事件 ID
+
+    本機日誌寫入資料庫後、標記為已同步前，同一筆紀錄會同時出現在資料庫與日誌中，
+    以此排除，避免重複計算
+    """
+    event_ids = [e for e in event_ids if e]
+    existing = set()
+    # 分段查詢，避免超過 SQLite 的參數數量上限
+    for i in range(0, len(event_ids), 500):
+        chunk = event_ids[i:i + 500]
+        rows = conn.execute(
+            f"SELECT event_id FROM production_logs WHERE event_id IN ({', '.join('?' * len(chunk))})", chunk
+        ).fetchall()
+        existing.update(row[0] for row in rows)
+    return existing
+
+
+def _pending_order_deltas(conn):
+    """
+    本機日誌中尚未寫入資料庫的工單完成數量增量 {(產線, 工單號碼): delta}
+    conn 為共用資料庫連線，用於排除已寫入資料庫的日誌紀錄
+    """
+    journal = get_write_journal()
+    if journal is None:
+        return {}
+    pending = [payload for _, _, payload in journal.pending("piece")]
+    try:
+        synced = _existing_event_ids(conn, [payload["log"].get("event_id") for payload in pending])
+    except Exception as e:
+        print(f"⚠️ 比對本機日誌與資料庫紀錄時發生錯誤：{e}")
+        synced = set()
+    deltas = {}
+    for payload in pending:
+        order = payload.get("order")
+        if payload["log"].get("event_id") in synced:
+            continue
+        if order and order.get("delta"):
+            key = (order["產線"], order["工單號碼"])
+            deltas[key] = deltas.get(key, 0) + order["delta"]
+    return deltas
+
+
+def _apply_pending_order_deltas(df_orders, conn):
+    """把尚未同步的完成數量加回工單資料（從共用資料庫重新載入後仍看得到自己的紀錄）"""
+    if df_orders.empty:
+        return df_orders
+    for (line, wo_id), delta in _pending_order_deltas(conn).items():
+        mask = (df_orders["產線"] == line) & (df_orders["工單號碼"] == wo_id)
+        df_orders.loc[mask, "已完成數量"] += delta
+    return df_orders
+
+
+def record_piece(line, wo, product, weight, result, reason="", shift="", group="", operator=""):
+    """
+    記錄一筆秤重結果（PASS / NG / 下班結算的 PARTICLE）
+
+    [優化] 一個 INSERT production_logs，PASS 時再加一個
+    UPDATE work_orders SET 已完成數量 = 已完成數量 + 1，同一交易完成；
+    不經過 save_data() 的差異比對與重複檢查，兩台平板同時累加也不會互相覆蓋計數
+    啟用本機寫入日誌時寫入本機日誌（背景同步），使用資料庫服務時送到服務端寫入
+    [關鍵修正] 啟用本機日誌時整個流程不碰共用資料庫：不呼叫 save_data()，也不使本班紀錄快取失效
+
+    寫入成功後同步更新 session_state（production_logs、work_orders_db 及工單快照）
+
+    參數:
+        line, wo, product: 產線、工單號碼、產品ID
+        weight: 實測重（kg）
+        result: "PASS"、"NG" 或 "PARTICLE"（下班結算的粒子重量）
+        reason, shift, group, operator: NG原因、班別、組別、操作員
+
+    回傳:
+        新紀錄的 id；寫入本機日誌（尚未同步）或重複紀錄時回傳 None
+    """
+    # 事件 ID 隨紀錄一起送出（本機日誌、資料庫服務重送時沿用），資料庫以唯一索引去除重複
+    entry = LogEntry(
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"), line, wo, product, weight,
+        result, reason, group, shift, operator, new_event_id(), None,
+    )
+    log_row = entry.to_log()
+    order = None
+    if result == "PASS":
+        order = {"產線": line, "工單號碼": wo, "delta": 1, "status": "生產中"}
+
+    journal = get_write_journal()
+    client = get_db_service_client()
+    rowid = None
+    if journal is not None:
+        journal.append("piece", {"log": log_row, "order": order})
+    elif client is not None:
+        rowid = client.record_logs([{"log": log_row, "order": order}])[0]["rowid"]
+    else:
+        try:
+            conn = get_connection()
+            cursor = conn.cursor()
+            try:
+                rowid = insert_log_if_absent(cursor, log_row, order)
+                if rowid is None:
+                    print(f"⚠️ 跳過重複記錄：{log_row['時間']} - {line} - {wo} - {weight} kg")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"⚠️ 記錄秤重結果時發生錯誤：{e}")
+            # 重新檢查連線狀態
+            config.refresh_connection()
+            raise
+
+    entry.id = rowid
+    _apply_piece_to_session(entry, order)
+    return rowid
+
+
+def _apply_piece_to_session(entry, order):
+    """將已寫入的紀錄（LogEntry）反映到 session_state（不觸發任何資料庫讀寫）"""
+    _remember_session_piece(entry)
+    if 'production_logs' in st.session_state:
+        # [優化] 先累積在 LogBatch（連同紀錄 id / 事件 ID，撤銷時據此刪除單筆），
+        # 需要 DataFrame 時才由 get_production_logs() 一次合併，每筆不再複製整個 production_logs
+        st.session_state.setdefault('production_logs_tail', LogBatch()).append(entry)
+    if order is not None:
+        _apply_order_delta_to_session(order)
+
+
+def get_production_logs():
+    """
+    session 中的生產紀錄 DataFrame（合併 record_piece() 累積的新紀錄）
+    讀取或修改 st.session_state.production_logs 前請先呼叫；尚未載入時回傳 None
+    """
+    logs = st.session_state.get('production_logs')
+    tail = st.session_state.get('production_logs_tail')
+    if logs is None or not tail:
+        return logs
+    # 累積的紀錄都已寫入資料庫（或日誌）；原本就全部儲存時計數器一併前進
+    fully_saved = st.session_state.get('production_logs_saved_count', 0) == len(logs)
+    logs = pd.concat([logs, tail.to_frame(config.LOG_COLUMNS + LOG_KEY_COLUMNS)], ignore_index=True)
+    tail.clear()
+    st.session_state.production_logs = logs
+    if fully_saved:
+        st.session_state['production_logs_saved_count'] = len(logs)
+    return logs
+
+
+def _apply_order_delta_to_session(order):
+    """將已寫入的工單完成數量增量反映到 work_orders_db 與快照"""
+    if 'work_orders_db' in st.session_state:
+        df = st.session_state.work_orders_db
+        mask = (df["產線"] == order["產線"]) & (df["工單號碼"] == order["工單號碼"])
+        if mask.any():
+            idx = df[mask].index[0]
+            df.at[idx, "已完成數量"] = max(df.at[idx, "已完成數量"] + order["delta"], 0)
+            df.at[idx, "狀態"] = order["status"]
+            touch_work_orders()
+    # 這筆增量已寫入資料庫（或日誌），快照同步更新，之後的 save_data() 不會再以絕對值覆寫
+    snapshot = st.session_state.get('work_orders_snapshot')
+    if snapshot is not None:
+        row = snapshot.get((order["產線"], order["工單號碼"]))
+        if row is not None:
+            row["已完成數量"] = max((row["已完成數量"] or 0) + order["delta"], 0)
+            row["狀態"] = order["status"]
+
+
+def _log_key(value):
+    """session 中的 id / event_id（NaN 視為沒有）"""
+    if value is None or pd.isna(value):
+        return None
+    return int(value) if isinstance(value, (int, float)) or hasattr(value, 'item') else value
+
+
+def _drop_session_log(rowid, event_id, log_values):
+    """從 session 中的 production_logs 移除已撤銷的紀錄（依 id、事件 ID，最後以內容比對）"""
+    logs = get_production_logs()
+    if logs is None or logs.empty:
+        return
+    mask = None
+    if rowid is not None and "id" in logs.columns:
+        mask = logs["id"] == rowid
+    if (mask is None or not mask.any()) and event_id is not None and "event_id" in logs.columns:
+        mask = logs["event_id"] == event_id
+    if mask is None or not mask.any():
+        mask = (logs["時間"] == log_values["時間"]) & (logs["產線"] == log_values["產線"]) & (logs["工單號"] == log_values["工單號"])
+    if not mask.any():
+        return
+    log_index = logs.index[mask][-1]
+    saved_count = st.session_state.get('production_logs_saved_count', 0)
+    st.session_state.production_logs = logs.drop(log_index)
+    if logs.index.get_loc(log_index) < saved_count:
+        st.session_state['production_logs_saved_count'] = saved_count - 1
+
+
+def _cancel_journal_piece(journal, event_id):
+    """
+    從本機日誌取消尚未同步的紀錄
+
+    回傳:
+        是否已取消（日誌中沒有這一筆，即已同步到資料庫時回傳 False）
+    """
+    for seq, _, payload in journal.pending("piece"):
+        if payload["log"].get("event_id") == event_id:
+            cancelled = journal.cancel(seq)
+            if cancelled is None:
+                raise Exception("本機日誌正在同步到伺服器，請稍後再試")
+            return cancelled
+    return False
+
+
+def undo_piece(log):
+    """
+    撤銷一筆秤重紀錄
+
+    [優化] 以紀錄 id 刪除單筆（DELETE ... WHERE id = ?），PASS 時在同一交易中
+    將工單完成數量減 1；不再掃描整個生產紀錄表，也不會刪到其他平板的紀錄
+    沒有 id 的紀錄（本機日誌寫入、尚未重新載入）改以事件 ID 或內容以索引查出該筆
+    [優化] 還在本機日誌中尚未同步的紀錄直接從日誌取消，不需等待伺服器
+
+    參數:
+        log: 要撤銷的紀錄（get_session_logs() 的一列，含 id、event_id）
+
+    回傳:
+        是否已從資料庫刪除（找不到對應紀錄時只從畫面移除）
+    """
+    rowid = _log_key(log.get("id"))
+    event_id = _log_key(log.get("event_id"))
+    log_values = {col: convert_value_to_sqlite_compatible(log.get(col)) for col in config.LOG_COLUMNS}
+    order = None
+    if log["判定結果"] == "PASS":
+        order = {"產線": log["產線"], "工單號碼": log["工單號"], "delta": -1, "status": "生產中"}
+
+    journal = get_write_journal()
+    if journal is not None and event_id is not None and _cancel_journal_piece(journal, event_id):
+        _forget_session_piece(event_id)
+        _drop_session_log(rowid, event_id, log_values)
+        if order is not None:
+            _apply_order_delta_to_session(order)
+        return True
+
+    client = get_db_service_client()
+    if client is not None:
+        deleted = client.delete_log(rowid, event_id, log_values, order)
+    else:
+        try:
+            conn = get_connection()
+            cursor = conn.cursor()
+            try:
+                deleted = delete_log(cursor, rowid, event_id, log_values, order)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"⚠️ 撤銷紀錄時發生錯誤：{e}")
+            # 重新檢查連線狀態
+            config.refresh_connection()
+            raise
+
+    invalidate_session_logs()
+    _forget_session_piece(event_id)
+    _drop_session_log(rowid, event_id, log_values)
+    if not deleted:
+        print(f"⚠️ 資料庫中找不到要撤銷的紀錄：{log_values['時間']} - {log_values['產線']} - {log_values['工單號']}")
+        return False
+    if order is not None:
+        _apply_order_delta_to_session(order)
+    return True
 
 
 def load_data():
@@ -140,42 +533,25 @@ def load_data():
     # 初始化資料庫（如果不存在）
     init_database()
     
-    conn = get_connection()
+    conn = get_connection(readonly=True)
     
     # 載入產品資料庫
-    if 'products_db' not in st.session_state:
-        try:
-            query = f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products"
-            st.session_state.products_db = pd.read_sql_query(query, conn)
-            
-            # 清理備註欄位中的 HTML 標籤（防止從 Excel 複製貼上時帶入 HTML）
-            import re
-            def clean_note_field(val):
-                """清理備註欄位中的 HTML 標籤"""
-                if pd.isna(val) or str(val).lower() == 'none':
-                    return ""
-                val_str = str(val)
-                # 移除 HTML 標籤
-                val_str = re.sub(r'<[^>]+>', '', val_str)
-                # 移除多餘的空白字符
-                return val_str.strip()
-            
-            for note_col in ['備註1', '備註2', '備註3']:
-                if note_col in st.session_state.products_db.columns:
-                    st.session_state.products_db[note_col] = st.session_state.products_db[note_col].apply(clean_note_field)
-        except Exception as e:
-            print(f"載入產品資料時發生錯誤: {e}")
-            st.session_state.products_db = pd.DataFrame(columns=[
-                "產品ID", "客戶名", "溫度等級", "品種", "密度", "長", "寬", "高", 
-                "下限", "準重", "上限", "備註1", "備註2", "備註3"
-            ])
-    
+    # [優化] 使用程序共用的產品目錄，只有資料庫版本號改變時才重新讀取
+    try:
+        get_products()
+    except Exception as e:
+        print(f"載入產品資料時發生錯誤: {e}")
+        if 'products_db' not in st.session_state:
+            st.session_state.products_db = pd.DataFrame(columns=PRODUCT_COLUMNS)
+
     # 載入工單資料庫
     # [修正] 每次載入時都從資料庫重新讀取，確保資料同步
     try:
         query = f"SELECT {', '.join(config.ORDER_COLUMNS)} FROM work_orders ORDER BY 產線, 排程順序"
         st.session_state.work_orders_db = pd.read_sql_query(query, conn)
+        orders_loaded = True
     except Exception as e:
+        orders_loaded = False
         print(f"載入工單資料時發生錯誤: {e}")
         # 如果載入失敗，確保至少有一個空的 DataFrame
         if 'work_orders_db' not in st.session_state:
@@ -193,27 +569,77 @@ def load_data():
                 st.session_state.work_orders_db[col], errors='coerce'
             ).fillna(0).astype(int)
     
+    # 加回本機尚未同步的完成數量
+    st.session_state.work_orders_db = _apply_pending_order_deltas(st.session_state.work_orders_db, conn)
+
     # 正規化排序
     st.session_state.work_orders_db = dm.normalize_sequences(st.session_state.work_orders_db)
+    if orders_loaded:
+        snapshot_work_orders()
+    else:
+        # 無法確認資料庫內容時，儲存前改為直接與資料庫比對
+        st.session_state.pop('work_orders_snapshot', None)
 
     # 載入生產紀錄
+    # [優化] 只載入最近的工作範圍，記憶體與載入時間不隨歷史紀錄增加
+    load_log_window(conn)
+    
+    conn.close()
+
+
+# ==========================================
+# 生產紀錄工作範圍（session 只保留最近幾天的紀錄）
+# ==========================================
+def _log_window_start(now=None):
+    """工作範圍起點：今天往前 PRODUCTION_LOGS_WINDOW_DAYS 天的 00:00（涵蓋跨午夜的晚班）"""
+    now = now or datetime.now()
+    return (now - timedelta(days=config.PRODUCTION_LOGS_WINDOW_DAYS)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _read_log_range(conn, start, end=None):
+    """以 ts_epoch 索引讀取 start <= 時間 < end 的紀錄（新到舊）"""
+    sql = f"SELECT {', '.join(config.LOG_COLUMNS + LOG_KEY_COLUMNS)} FROM production_logs WHERE ts_epoch >= ?"
+    params = [to_epoch(start)]
+    if end is not None:
+        sql += " AND ts_epoch < ?"
+        params.append(to_epoch(end))
+    return pd.read_sql_query(sql + " ORDER BY 時間 DESC", conn, params=params)
+
+
+def load_log_window(conn):
+    """
+    確保 st.session_state.production_logs 為目前的工作範圍
+
+    - 首次載入：只讀取 _log_window_start() 之後的紀錄
+    - 跨日後：移除已同步且早於新起點的紀錄（尚未儲存的紀錄保留在最後，不影響增量儲存）
+    較舊的紀錄請用 load_older_logs() 分頁載入，報表請用 get_logs_between()
+    """
+    window_start = _log_window_start()
     if 'production_logs' not in st.session_state:
         try:
-            query = f"SELECT {', '.join(config.LOG_COLUMNS)} FROM production_logs ORDER BY 時間 DESC"
-            st.session_state.production_logs = pd.read_sql_query(query, conn)
+            st.session_state.production_logs = _read_log_range(conn, window_start)
         except Exception as e:
             print(f"載入生產紀錄時發生錯誤: {e}")
             st.session_state.production_logs = pd.DataFrame(columns=config.LOG_COLUMNS)
-    
+        st.session_state['production_logs_window_start'] = window_start
+        st.session_state['production_logs_loaded_from'] = window_start
+    elif window_start > st.session_state.get('production_logs_window_start', window_start):
+        logs = get_production_logs()
+        saved_count = st.session_state.get('production_logs_saved_count', len(logs))
+        cutoff = window_start.strftime("%Y-%m-%d %H:%M:%S")
+        stale = (logs["時間"].astype(str) < cutoff).to_numpy() & (pd.RangeIndex(len(logs)) < saved_count)
+        if stale.any():
+            st.session_state.production_logs = logs[~stale].reset_index(drop=True)
+            if 'production_logs_saved_count' in st.session_state:
+                st.session_state['production_logs_saved_count'] = saved_count - int(stale.sum())
+        st.session_state['production_logs_window_start'] = window_start
+        st.session_state['production_logs_loaded_from'] = window_start
+
     # 確保所有必要欄位存在並設定預設值
     for col in config.LOG_COLUMNS:
         if col not in st.session_state.production_logs.columns: 
             if col == "組別": 
                 st.session_state.production_logs[col] = "A"
-            elif col == "班別": 
-                st.session_state.production_logs[col] = ""
-            elif col == "操作員": 
-                st.session_state.production_logs[col] = ""
             else: 
                 st.session_state.production_logs[col] = ""
     
@@ -221,19 +647,143 @@ def load_data():
     # 當從資料庫載入資料時，所有記錄都已經保存，所以計數器等於記錄數量
     if 'production_logs_saved_count' not in st.session_state:
         st.session_state['production_logs_saved_count'] = len(st.session_state.production_logs)
-    
-    conn.close()
+
+
+def load_older_logs(days=None):
+    """
+    將工作範圍往前延伸 days 天（預設 PRODUCTION_LOGS_WINDOW_DAYS），回傳新載入的筆數
+
+    較舊的紀錄放在最前面，已保存計數器同步增加，尚未儲存的紀錄仍在最後；下次跨日時再移除
+    """
+    if 'production_logs' not in st.session_state:
+        load_data()
+    get_production_logs()
+    loaded_from = st.session_state.get('production_logs_loaded_from') or _log_window_start()
+    new_start = loaded_from - timedelta(days=days or config.PRODUCTION_LOGS_WINDOW_DAYS)
+    init_database()
+    conn = get_connection(readonly=True)
+    try:
+        older = _read_log_range(conn, new_start, loaded_from)
+    finally:
+        conn.close()
+    st.session_state['production_logs_loaded_from'] = new_start
+    if older.empty:
+        return 0
+    st.session_state.production_logs = pd.concat(
+        [older, st.session_state.production_logs], ignore_index=True
+    )
+    st.session_state['production_logs_saved_count'] = st.session_state.get('production_logs_saved_count', 0) + len(older)
+    return len(older)
+
+
+def convert_value_to_sqlite_compatible(value):
+    """將單個值轉換為 SQLite 相容的類型"""
+    if value is None or (not isinstance(value, (list, tuple, dict)) and pd.isna(value)):
+        return None
+    elif isinstance(value, (pd.Timestamp, datetime)):
+        # 轉換為字符串格式
+        return str(value)
+    elif isinstance(value, bool):
+        # SQLite 支援 INTEGER (0/1) 表示布林值
+        return 1 if value else 0
+    elif isinstance(value, (int, float, str)):
+        return value
+    elif hasattr(value, 'item'):
+        # numpy 數值型別轉回 Python 型別（直接寫入會被存成 BLOB）
+        return value.item()
+    else:
+        try:
+            return str(value)
+        except Exception:
+            return None
+
+
+# ==========================================
+# 工單增量寫入（只寫入與快照不同的工單）
+# ==========================================
+def _order_rows(df_orders):
+    """工單 DataFrame → {(產線, 工單號碼): {欄位: 值}}，欄位同 config.ORDER_COLUMNS"""
+    rows = {}
+    if df_orders is None or df_orders.empty:
+        return rows
+    df = df_orders.reindex(columns=config.ORDER_COLUMNS)
+    for values in df.itertuples(index=False, name=None):
+        row = dict(zip(config.ORDER_COLUMNS, (convert_value_to_sqlite_compatible(v) for v in values)))
+        rows[(row["產線"], row["工單號碼"])] = row
+    return rows
+
+
+def _order_rows_from_db(cursor):
+    cursor.execute(f"SELECT {', '.join(config.ORDER_COLUMNS)} FROM work_orders")
+    rows = {}
+    for values in cursor.fetchall():
+        row = dict(zip(config.ORDER_COLUMNS, values))
+        rows[(row["產線"], row["工單號碼"])] = row
+    return rows
+
+
+def snapshot_work_orders():
+    """
+    記錄目前 work_orders_db 為「已與資料庫一致」的狀態
+    從資料庫載入工單或儲存成功後呼叫，save_data() 只寫入與此快照不同的工單
+    """
+    if 'work_orders_db' in st.session_state:
+        st.session_state['work_orders_snapshot'] = _order_rows(st.session_state.work_orders_db)
+    else:
+        st.session_state.pop('work_orders_snapshot', None)
+
+
+def _write_order_changes(cursor, before, after):
+    """
+    以 UPDATE / INSERT / DELETE 寫入兩份工單狀態的差異（由呼叫端負責交易）
+    UPDATE 只寫入有變動的欄位，不會覆蓋其他平板同時更新的欄位
+
+    回傳:
+        (更新筆數, 新增筆數, 刪除筆數)
+    """
+    deleted = [key for key in before if key not in after]
+    for line, wo_id in deleted:
+        cursor.execute("DELETE FROM work_orders WHERE 產線 = ? AND 工單號碼 = ?", (line, wo_id))
+
+    updated = inserted = 0
+    insert_cols = config.ORDER_COLUMNS
+    for key, row in after.items():
+        old = before.get(key)
+        if old is None:
+            cursor.execute(f"""
+                INSERT INTO work_orders ({', '.join(insert_cols)})
+                VALUES ({', '.join(['?'] * len(insert_cols))})
+                ON CONFLICT(產線, 工單號碼) DO UPDATE SET
+                    {', '.join(f'{c}=excluded.{c}' for c in insert_cols)},
+                    updated_at=CURRENT_TIMESTAMP
+            """, [row[c] for c in insert_cols])
+            inserted += 1
+            continue
+        changed = [c for c in insert_cols if row[c] != old.get(c)]
+        if changed:
+            cursor.execute(f"""
+                UPDATE work_orders
+                SET {', '.join(f'{c} = ?' for c in changed)}, updated_at = CURRENT_TIMESTAMP
+                WHERE 產線 = ? AND 工單號碼 = ?
+            """, [row[c] for c in changed] + list(key))
+            updated += 1
+    return updated, inserted, len(deleted)
 
 
 def save_data():
-    """儲存所有資料到 SQL 資料庫（優化版：使用增量更新提升效能）"""
+    """
+    儲存所有資料到 SQL 資料庫（優化版：使用增量更新提升效能）
+
+    [關鍵修正] 不等待本機日誌同步：日誌中的紀錄（含工單完成數量）只由日誌寫入，這裡略過
+    """
+    journal = get_write_journal()
+
     try:
         conn = get_connection()
         cursor = conn.cursor()
     except Exception as e:
         print(f"⚠️ 建立資料庫連線時發生錯誤：{e}")
         # 重新檢查連線狀態
-        import config
         config.refresh_connection()
         raise
     
@@ -260,87 +810,35 @@ def save_data():
                     pass
         return df
     
-    def convert_value_to_sqlite_compatible(value):
-        """將單個值轉換為 SQLite 相容的類型"""
-        if pd.isna(value) or value is None:
-            return None
-        elif isinstance(value, pd.Timestamp):
-            # 轉換為字符串格式
-            return str(value)
-        elif isinstance(value, datetime):
-            # 轉換為字符串格式
-            return str(value)
-        elif isinstance(value, (int, float, str)):
-            return value
-        elif isinstance(value, bool):
-            # SQLite 支援 INTEGER (0/1) 表示布林值
-            return 1 if value else 0
-        else:
-            # 對於其他類型（如 numpy 類型），轉換為字符串
-            try:
-                return str(value)
-            except Exception:
-                return None
-    
     try:
         # ⚠️ 注意：products 不在這裡儲存！
         # 產品資料改為在後台以 upsert_products/delete_products 直接對 DB 增量寫入，
         # 避免任何一台/任何 session 以空的 products_db 觸發全表刪除造成資料消失。
         
-        # 儲存工單資料（使用全量替換：先刪除所有，再插入新的，確保刪除操作能正確反映）
+        # [優化] 儲存工單資料：只寫入與快照（上次載入/儲存時的狀態）不同的工單，
+        # 不再整表刪除後重新插入；寫入量與工單總數無關，也保留 id / created_at
+        current_orders = None
         if 'work_orders_db' in st.session_state:
-            # [關鍵修正] 先刪除所有舊資料，然後插入新資料
-            # 這樣可以確保刪除操作能正確反映到資料庫中
-            cursor.execute("DELETE FROM work_orders")
-            
-            if not st.session_state.work_orders_db.empty:
-                # 準備資料（移除 id 和自動生成的時間戳欄位）
-                df_orders = st.session_state.work_orders_db.copy()
-                if 'id' in df_orders.columns:
-                    df_orders = df_orders.drop(columns=['id'])
-                # 移除自動生成的時間戳欄位（由資料庫自動處理）
-                for col in ['created_at', 'updated_at']:
-                    if col in df_orders.columns:
-                        df_orders = df_orders.drop(columns=[col])
-                # 轉換任何 Timestamp 類型欄位
-                df_orders = convert_timestamps_to_string(df_orders)
-                
-                # 插入所有工單
-                for _, row in df_orders.iterrows():
-                    cursor.execute("""
-                        INSERT INTO work_orders (
-                            產線, 排程順序, 工單號碼, 產品ID, 顯示內容, 品種, 密度,
-                            準重, 預計數量, 已完成數量, 狀態, 建立時間, 詳細規格字串
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        row['產線'], row['排程順序'], row['工單號碼'], row['產品ID'], row['顯示內容'],
-                        row['品種'], row['密度'], row['準重'], row['預計數量'], row['已完成數量'],
-                        row['狀態'], row['建立時間'], row['詳細規格字串']
-                    ))
+            current_orders = _order_rows(st.session_state.work_orders_db)
+            snapshot = st.session_state.get('work_orders_snapshot')
+            if snapshot is None:
+                snapshot = _order_rows_from_db(cursor)
+                # 資料庫的完成數量尚未包含本機日誌的增量（畫面上已加入），先補上再比對，
+                # 避免以含增量的絕對值寫入後，日誌同步時又再累加一次
+                for key, delta in _pending_order_deltas(conn).items():
+                    if key in snapshot:
+                        snapshot[key]["已完成數量"] = (snapshot[key]["已完成數量"] or 0) + delta
+            _write_order_changes(cursor, snapshot, current_orders)
         
         # [關鍵優化] 儲存生產紀錄：只插入新記錄，不刪除舊記錄
         # 這樣可以大幅提升效能，特別是當記錄數量很大時
-        if 'production_logs' in st.session_state:
+        if get_production_logs() is not None:
             saved_count_key = 'production_logs_saved_count'
             saved_count = st.session_state.get(saved_count_key, 0)
             current_count = len(st.session_state.production_logs) if not st.session_state.production_logs.empty else 0
             
-            # 處理記錄數量減少的情況（撤銷操作）
+            # 記錄數量減少：撤銷已由 undo_piece() 直接刪除資料庫中的單筆，這裡只同步計數器
             if current_count < saved_count:
-                # 如果記錄數量減少，需要從資料庫中刪除對應的記錄
-                # 由於撤銷操作會刪除最後一筆記錄，我們需要找到並刪除資料庫中對應的記錄
-                # 這裡使用時間戳來匹配（取 session_state 中最後一筆記錄的時間作為參考）
-                if not st.session_state.production_logs.empty:
-                    # 獲取 session_state 中所有記錄的時間戳
-                    saved_times = set(st.session_state.production_logs['時間'].astype(str).tolist())
-                    # 刪除資料庫中不在 saved_times 中的記錄（這些是被撤銷的記錄）
-                    cursor.execute("SELECT 時間 FROM production_logs")
-                    db_times = [row[0] for row in cursor.fetchall()]
-                    times_to_delete = [t for t in db_times if t not in saved_times]
-                    if times_to_delete:
-                        placeholders = ','.join(['?' for _ in times_to_delete])
-                        cursor.execute(f"DELETE FROM production_logs WHERE 時間 IN ({placeholders})", times_to_delete)
-                # 更新已保存的記錄數量
                 st.session_state[saved_count_key] = current_count
             # 處理新增記錄的情況
             elif current_count > saved_count and not st.session_state.production_logs.empty:
@@ -355,37 +853,29 @@ def save_data():
                 # 轉換任何 Timestamp 類型欄位
                 new_logs = convert_timestamps_to_string(new_logs)
                 
-                # [改進] 檢查資料庫中是否已存在相同記錄（防止重複寫入）
-                if not new_logs.empty:
-                    filtered_logs = []
-                    for _, row in new_logs.iterrows():
-                        # 檢查是否存在相同的記錄（時間、產線、工單號、重量）
-                        cursor.execute("""
-                            SELECT COUNT(*) FROM production_logs 
-                            WHERE 時間 = ? AND 產線 = ? AND 工單號 = ? 
-                            AND ABS(實測重 - ?) < 0.01
-                        """, (row['時間'], row['產線'], row['工單號'], row['實測重']))
-                        exists = cursor.fetchone()[0] > 0
-                        
-                        if not exists:
-                            filtered_logs.append(row)
-                        else:
-                            print(f"⚠️ 跳過重複記錄：{row['時間']} - {row['產線']} - {row['工單號']} - {row['實測重']} kg")
-                    
-                    # 只插入不重複的記錄
-                    if filtered_logs:
-                        filtered_df = pd.DataFrame(filtered_logs)
-                        filtered_df.to_sql('production_logs', conn, if_exists='append', index=False)
-                        # 更新已保存的記錄數量（只計算實際插入的記錄數）
-                        st.session_state[saved_count_key] = saved_count + len(filtered_logs)
-                    else:
-                        # 如果所有記錄都是重複的，仍然更新計數器（避免無限循環）
-                        st.session_state[saved_count_key] = current_count
-                else:
-                    # 更新已保存的記錄數量
-                    st.session_state[saved_count_key] = current_count
+                # [改進] 以事件 ID 唯一索引去除重複（INSERT ... ON CONFLICT DO NOTHING，單次索引查詢）
+                # 沒有事件 ID 的紀錄依內容推導；同一批中內容相同的多筆以出現順序區分，不會被誤判為重複
+                occurrences = {}
+                columns = config.LOG_COLUMNS + ["event_id"]
+                # 本機日誌中的紀錄由日誌同步（同時累加工單完成數量），這裡寫入會使該增量遺失
+                journal_ids = {payload["log"].get("event_id") for _, _, payload in journal.pending("piece")} \
+                    if journal is not None else set()
+                for values in new_logs.reindex(columns=columns).itertuples(index=False, name=None):
+                    row = dict(zip(columns, (convert_value_to_sqlite_compatible(v) for v in values)))
+                    key = (row['時間'], row['產線'], row['工單號'], row['判定結果'], row['實測重'])
+                    if not row['event_id']:
+                        row['event_id'] = content_event_id(row, occurrences.get(key, 0))
+                    occurrences[key] = occurrences.get(key, 0) + 1
+                    if row['event_id'] in journal_ids:
+                        continue
+                    if not insert_log_if_absent(cursor, row):
+                        print(f"⚠️ 跳過重複記錄：{row['時間']} - {row['產線']} - {row['工單號']} - {row['實測重']} kg")
+                # 更新已保存的記錄數量
+                st.session_state[saved_count_key] = current_count
         
         conn.commit()
+        if current_orders is not None:
+            st.session_state['work_orders_snapshot'] = current_orders
     except Exception as e:
         import traceback
         error_detail = str(e)
@@ -397,7 +887,6 @@ def save_data():
         except:
             pass
         # 重新檢查連線狀態
-        import config
         config.refresh_connection()
         # 重新拋出異常，讓調用端能夠處理
         raise Exception(f"儲存資料時發生錯誤: {error_detail}")
@@ -470,7 +959,7 @@ def get_next_work_order_sequence():
     工單號碼格式：WO-{MMDD}-{序號:04d}
     此函數會查詢今天的所有工單，找出最大的序號，然後加 1
     """
-    conn = get_connection()
+    conn = get_connection(readonly=True)
     cursor = conn.cursor()
     
     try:
@@ -513,9 +1002,233 @@ def get_next_work_order_sequence():
         conn.close()
 
 
+def get_logs_between(start, end, line=None):
+    """
+    讀取時間範圍內的生產紀錄（start <= 時間 < end），以 ts_epoch 索引在資料庫中篩選，
+    不再把全部紀錄載入後逐筆解析時間字串
+
+    參數:
+        start, end: datetime（本地時間）
+        line: 只讀取指定產線（None 表示全部）
+
+    回傳:
+        DataFrame：欄位同 config.LOG_COLUMNS，另含 id、event_id、shift_date 及 datetime（由 ts_epoch 轉換）
+    """
+    sql = f"""
+        SELECT {', '.join(config.LOG_COLUMNS + LOG_KEY_COLUMNS)}, ts_epoch, shift_date
+        FROM production_logs
+        WHERE ts_epoch >= ? AND ts_epoch < ?
+    """
+    params = [to_epoch(start), to_epoch(end)]
+    if line is not None:
+        sql += " AND 產線 = ?"
+        params.append(line)
+    init_database()
+    conn = get_connection(readonly=True)
+    try:
+        df = pd.read_sql_query(sql + " ORDER BY ts_epoch", conn, params=params)
+    finally:
+        conn.close()
+    df['datetime'] = pd.to_datetime(df['ts_epoch'], unit='s')
+    return df
+
+
+def get_session_logs(line, shift, group, shift_date=None):
+    """
+    取得目前班次（產線、班別、組別、班別日期）的生產紀錄
+
+    [優化] 以 idx_logs_session 索引在資料庫中篩選，成本只與本班的紀錄數有關；
+    查詢結果（伺服器快照）在 session 中沿用 config.SESSION_LOGS_REFRESH_SECONDS 秒，撤銷時立即失效
+    [關鍵修正] 本 session 剛記錄的紀錄與本機日誌中尚未同步的紀錄每次合併到快照上，
+    記錄 PASS/NG 後不需重新查詢共用資料庫；資料庫無法讀取時改從 production_logs 篩選
+
+    參數:
+        shift_date: 班別日期 "YYYY-MM-DD"（None 表示目前時間所屬的班別日期，晚班跨日屬於前一天）
+
+    回傳:
+        DataFrame：欄位同 config.LOG_COLUMNS，另含 id、event_id、shift_date，依時間由舊到新
+    """
+    if shift_date is None:
+        shift_date = dm.get_shift_date(shift).strftime("%Y-%m-%d")
+    key = (line, shift, group, shift_date)
+    cache = st.session_state.setdefault('session_logs_cache', {})
+    entry = cache.get(key)
+    now = time.monotonic()
+    if entry is None or now - entry[0] >= config.SESSION_LOGS_REFRESH_SECONDS:
+        columns = config.LOG_COLUMNS + LOG_KEY_COLUMNS + ["shift_date"]
+        try:
+            init_database()
+            conn = get_connection(readonly=True)
+            try:
+                df = pd.read_sql_query(f"""
+                    SELECT {', '.join(columns)}
+                    FROM production_logs
+                    WHERE 產線 = ? AND 班別 = ? AND 組別 = ? AND shift_date = ?
+                    ORDER BY 時間
+                """, conn, params=(line, shift, group, shift_date))
+            finally:
+                conn.close()
+        except Exception as e:
+            # 失敗結果同樣沿用到下次更新，伺服器無回應時不會每次刷新都重試
+            print(f"⚠️ 讀取本班紀錄時發生錯誤，改用已載入的紀錄：{e}")
+            df = _filter_session_logs(line, shift, group, shift_date)
+        entry = cache[key] = (now, df)
+
+    df = entry[1]
+    pieces = _unsynced_session_pieces(key, set(df["event_id"].dropna()))
+    if not pieces:
+        return df
+    pieces = pd.DataFrame([{**log, "shift_date": shift_date} for log in pieces], columns=df.columns)
+    return pd.concat([df, pieces], ignore_index=True).sort_values(by="時間", kind="stable", ignore_index=True)
+
+
+def get_shift_summary(line, shift, group, shift_date=None):
+    """
+    取得目前班次的累計數值（讀取 shift_summary，每張工單一列，與紀錄總數無關）
+
+    查詢結果（伺服器快照）在 session 中沿用 config.SESSION_LOGS_REFRESH_SECONDS 秒，撤銷時立即失效；
+    本 session 剛記錄與本機日誌中尚未同步的紀錄每次加到快照上（同 get_session_logs），
+    資料庫無法讀取時改由本班紀錄計算
+
+    回傳:
+        {"良品數", "實重合計", "準重合計", "NG數", "粒子重"}
+    """
+    if shift_date is None:
+        shift_date = dm.get_shift_date(shift).strftime("%Y-%m-%d")
+    key = (line, shift, group, shift_date)
+    cache = st.session_state.setdefault('shift_summary_cache', {})
+    entry = cache.get(key)
+    now = time.monotonic()
+    if entry is None or now - entry[0] >= config.SESSION_LOGS_REFRESH_SECONDS:
+        fields = SHIFT_SUMMARY_FIELDS
+        # 上次已確認寫入資料庫的紀錄不必再查詢
+        known = entry[2] if entry is not None else set()
+        try:
+            init_database()
+            conn = get_connection(readonly=True)
+            try:
+                row = conn.execute(f"""
+                    SELECT {', '.join(f'COALESCE(SUM({f}), 0)' for f in fields)}
+                    FROM shift_summary
+                    WHERE 產線 = ? AND shift_date = ? AND 班別 = ? AND 組別 = ?
+                """, (line, shift_date, shift, group)).fetchone()
+                # 已寫入資料庫（已計入統計表）但仍在本機日誌 / 本 session 紀錄中的，不重複計算
+                candidates = [log.get("event_id") for log in _unsynced_session_pieces(key, known)]
+                synced = known | _existing_event_ids(conn, candidates)
+            finally:
+                conn.close()
+            summary = dict(zip(fields, row))
+        except Exception as e:
+            print(f"⚠️ 讀取班別統計時發生錯誤，改由本班紀錄計算：{e}")
+            rows = _filter_session_logs(line, shift, group, shift_date)
+            summary = _add_pieces_to_summary(dict.fromkeys(fields, 0), rows.to_dict("records"))
+            synced = set(rows["event_id"].dropna())
+        entry = cache[key] = (now, summary, synced)
+
+    return _add_pieces_to_summary(dict(entry[1]), _unsynced_session_pieces(key, entry[2]))
+
+
+def _add_pieces_to_summary(summary, pieces):
+    """把尚未計入統計表的紀錄加到 summary（準重以工單準重計算）"""
+    if not pieces:
+        return summary
+    std_map = st.session_state.work_orders_db.set_index("工單號碼")["準重"].to_dict() \
+        if 'work_orders_db' in st.session_state else {}
+    for log in pieces:
+        weight = float(pd.to_numeric(log.get("實測重"), errors='coerce') or 0)
+        if log.get("判定結果") == "PASS":
+            summary["良品數"] += 1
+            summary["實重合計"] += weight
+            summary["準重合計"] += float(pd.to_numeric(std_map.get(log.get("工單號")), errors='coerce') or 0)
+        elif log.get("判定結果") == "NG":
+            summary["NG數"] += 1
+        elif log.get("判定結果") == "PARTICLE":
+            summary["粒子重"] += weight
+    return summary
+
+
+def _remember_session_piece(entry):
+    """
+    記住本 session 記錄的紀錄（LogEntry），之後的本班紀錄 / 班別統計直接合併，不必重新查詢資料庫
+    已出現在伺服器快照中的紀錄合併時依事件 ID 排除；只保留目前班別日期的紀錄
+    """
+    shift_date = log_time_columns(entry.time, entry.shift)[1]
+    pieces = st.session_state.setdefault('session_local_pieces', {})
+    for old_key in [k for k in pieces if k[3] != shift_date]:
+        del pieces[old_key]
+    pieces.setdefault((entry.line, entry.shift, entry.group, shift_date), []).append(entry.to_dict())
+
+
+def _forget_session_piece(event_id):
+    """撤銷後移除本 session 記住的紀錄"""
+    if event_id is None:
+        return
+    for logs in st.session_state.get('session_local_pieces', {}).values():
+        logs[:] = [log for log in logs if log.get("event_id") != event_id]
+
+
+def _unsynced_session_pieces(key, exclude_event_ids=()):
+    """
+    該班次（產線, 班別, 組別, 班別日期）尚未出現在伺服器快照中的紀錄 [log, ...]：
+    本 session 記錄的紀錄，加上本機日誌中尚未同步的紀錄（同一程序的其他 session）
+    """
+    line, shift, group, shift_date = key
+    seen = set(exclude_event_ids)
+    pieces = []
+    for log in st.session_state.get('session_local_pieces', {}).get(key, ()):
+        if log.get("event_id") not in seen:
+            seen.add(log.get("event_id"))
+            pieces.append(log)
+    journal = get_write_journal()
+    if journal is None:
+        return pieces
+    for _, _, payload in journal.pending("piece"):
+        log = payload["log"]
+        if (log.get("產線"), log.get("班別"), log.get("組別")) != (line, shift, group):
+            continue
+        if log.get("event_id") in seen or log_time_columns(log.get("時間"), shift)[1] != shift_date:
+            continue
+        seen.add(log.get("event_id"))
+        pieces.append({**log, "id": None})
+    return pieces
+
+
+def _filter_session_logs(line, shift, group, shift_date):
+    """從 session 中的 production_logs 篩選本班紀錄（資料庫無法讀取時的備用方式）"""
+    logs = get_production_logs()
+    if logs is None or logs.empty:
+        return pd.DataFrame(columns=config.LOG_COLUMNS + LOG_KEY_COLUMNS + ["shift_date"])
+    df = logs[(logs["產線"] == line) & (logs["班別"] == shift) & (logs["組別"] == group)].copy()
+    df["shift_date"] = [log_time_columns(t, shift)[1] for t in df["時間"]]
+    return df[df["shift_date"] == shift_date].sort_values(by="時間", kind="stable")
+
+
+def invalidate_session_logs():
+    """撤銷資料庫中的紀錄後呼叫，下次 get_session_logs() / get_shift_summary() 重新查詢"""
+    st.session_state.pop('session_logs_cache', None)
+    st.session_state.pop('shift_summary_cache', None)
+
+
+def get_log_months():
+    """有生產紀錄的 (年, 月) 清單（新到舊），只讀取 ts_epoch 索引"""
+    init_database()
+    conn = get_connection(readonly=True)
+    try:
+        rows = conn.execute("""
+            SELECT DISTINCT CAST(strftime('%Y', ts_epoch, 'unixepoch') AS INTEGER),
+                            CAST(strftime('%m', ts_epoch, 'unixepoch') AS INTEGER)
+            FROM production_logs
+            WHERE ts_epoch IS NOT NULL
+            ORDER BY 1 DESC, 2 DESC
+        """).fetchall()
+    finally:
+        conn.close()
+    return [(year, month) for year, month in rows]
+
+
 def reload_work_orders():
     """強制重新載入工單資料（用於同步伺服器資料）"""
-    conn = get_connection()
+    conn = get_connection(readonly=True)
     try:
         query = f"SELECT {', '.join(config.ORDER_COLUMNS)} FROM work_orders ORDER BY 產線, 排程順序"
         st.session_state.work_orders_db = pd.read_sql_query(query, conn)
@@ -532,8 +1245,12 @@ def reload_work_orders():
                     st.session_state.work_orders_db[col], errors='coerce'
                 ).fillna(0).astype(int)
         
+        # 加回本機尚未同步的完成數量
+        st.session_state.work_orders_db = _apply_pending_order_deltas(st.session_state.work_orders_db, conn)
+        
         # 正規化排序
         st.session_state.work_orders_db = dm.normalize_sequences(st.session_state.work_orders_db)
+        snapshot_work_orders()
     except Exception as e:
         print(f"重新載入工單資料時發生錯誤: {e}")
     finally:
@@ -4,12 +4,18 @@ import os
 import json
 import time
 import serial
-import re
 import config
 import random
 import datetime
 import streamlit as st
 import sys
+import atexit
+
+from multi_scale_reader import MultiScaleReader
+from scale_reader import ScaleReader
+from shared_weight import SharedScaleView, SharedWeightBoard
+from stability import StabilityDetector, settings_for_line
+from trace_recorder import TraceRecorder
 
 # 檔案鎖定相關 import（跨平台）
 try:
@@ -39,126 +45,160 @@ def get_serial_connection():
         print(f"串口連接失敗: {e}")
         return None
 
-def _read_weight_from_serial(ser):
-    """
-    從串口讀取重量數據（內部函數）
-    """
+def _on_serial_disconnect():
+    """串口異常時清除連線快取，讓背景讀取器下次重新建立連接"""
+    get_serial_connection.clear()
+
+
+def _current_shift_key():
+    """目前班別代碼（例如 20260117_早班），用於重量軌跡檔換檔"""
+    now = datetime.datetime.now()
+    shift = get_shift_info_backup(now)
+    return f"{get_shift_date(shift, now).strftime('%Y%m%d')}_{shift}"
+
+
+def _create_trace_recorder():
+    """依設定建立重量軌跡記錄器（未啟用時回傳 None）"""
+    if not config.TRACE_RECORDER_ENABLED:
+        return None
     try:
-        # [優化] 先清空舊數據，只讀取最新數據
-        ser.reset_input_buffer()
-        
-        # [優化] 減少等待時間，快速讀取最新數據
-        # 先等待一小段時間讓數據傳入
-        time.sleep(0.05)  # 從 0.1 秒減少到 0.05 秒
-        
-        # [優化] 讀取所有可用的數據，只取最後一筆（最新的）
-        latest_val = None
-        latest_text = ""
-        attempts = 0
-        max_attempts = 5  # 從 20 次減少到 5 次
-        
-        while attempts < max_attempts:
-            if ser.in_waiting:
-                raw = ser.readline()
-                try:
-                    text = raw.decode('utf-8', errors='ignore').strip()
-                    if len(text) > 3:
-                        match = re.search(r"([\d]+\.[\d]+)", text)
-                        if match:
-                            latest_val = float(match.group(1))
-                            latest_text = text
-                            # 繼續讀取，直到沒有更多數據（獲取最新值）
-                except:
-                    pass
-            else:
-                # 如果沒有數據，稍微等待一下
-                time.sleep(0.02)
-            
-            attempts += 1
-        
-        # 如果讀取到數據，返回最新值
-        if latest_val is not None:
-            return latest_val, f"正常連線 ({latest_text})"
-        
-        return 0.0, "無數據 (連線中)"
-    
-    except serial.SerialException as e:
-        # 串口連接異常，需要重連
-        raise ConnectionError(f"串口讀取錯誤: {e}")
+        recorder = TraceRecorder(
+            directory=config.TRACE_DIR,
+            line_name=config.SCALE_LINE or "scale",
+            shift_key=_current_shift_key,
+        )
+        atexit.register(recorder.close)
+        return recorder
     except Exception as e:
-        raise Exception(f"讀取數據時發生錯誤: {e}")
+        print(f"⚠️ 建立重量軌跡記錄器失敗（不影響秤重）：{e}")
+        return None
+
+
+def _create_scale_reader(publisher=None):
+    """建立並啟動本機磅秤背景讀取器（publisher 為共享讀數看板）"""
+    reader = ScaleReader(
+        connect=get_serial_connection,
+        on_disconnect=_on_serial_disconnect,
+        protocol=config.SCALE_PROTOCOL,
+        detector=StabilityDetector(**settings_for_line(config.SCALE_LINE)),
+        recorder=_create_trace_recorder(),
+        publisher=publisher,
+        buffer_size=config.SCALE_BUFFER_SIZE,
+    )
+    reader.start()
+    return reader
+
+
+@st.cache_resource
+def get_scale_reader():
+    """
+    獲取磅秤背景讀取器（每個程序一個，所有 session 共用）
+    讀取器擁有 get_serial_connection() 建立的串口，持續讀取並保存最近的讀數，
+    並在讀取執行緒中以儀表原生頻率進行穩定判斷
+
+    [優化] 啟用共享讀數（config.SCALE_SHARED_ENABLED）時，同一台電腦上只有一個程序開啟串口，
+    其他程序改讀共享記憶體（介面相同），不再互相搶奪串口資料
+    """
+    if config.SCALE_SHARED_ENABLED:
+        try:
+            return SharedScaleView(SharedWeightBoard(config.SCALE_SHARED_FILE), _create_scale_reader)
+        except Exception as e:
+            print(f"⚠️ 共享讀數初始化失敗，改為本程序直接讀取磅秤：{e}")
+    return _create_scale_reader()
+
+
+def get_latest_reading():
+    """
+    非阻塞取得最新讀數
+
+    回傳:
+        (ScaleReading, age_seconds, status)；尚無讀數時 reading/age 為 None
+    """
+    reader = get_scale_reader()
+    # 執行緒意外結束時自動重新啟動
+    if not reader.is_running:
+        reader.start()
+    reading, age = reader.latest()
+    return reading, age, reader.status
+
 
 def get_real_weight():
     """
-    獲取磅秤實際重量（優化版：使用連接快取）
+    獲取磅秤實際重量（非阻塞版：查詢背景讀取器的最新讀數）
     
     優化說明：
-    - 使用 @st.cache_resource 快取串口連接，避免頻繁開關
-    - 連接會在 Streamlit session 期間保持開啟
-    - 自動檢測連接狀態，連接失敗時自動重連
-    - 完全向後相容，不影響現有功能
+    - 串口由背景執行緒持續讀取，不再於每次 UI 刷新時清空緩衝區並等待
+    - 每次呼叫只是查詢環狀緩衝區的最新一筆，幾乎不耗時
+    - 讀數超過 SCALE_STALE_SECONDS 未更新時視為無數據
+    - 回傳格式與舊版相同：(重量, 狀態訊息)
+    """
+    weight, msg, _, _ = get_weight_and_stability()
+    return weight, msg
+
+
+@st.cache_resource
+def get_multi_scale_reader():
+    """
+    獲取多磅秤讀取服務（每個程序一個，所有 session 共用）
+    在單一 event loop 中讀取 config.SCALE_SOURCES 的所有來源，供總覽模式顯示各產線即時重量
+    """
+    reader = MultiScaleReader(
+        sources=config.SCALE_SOURCES,
+        protocol=config.SCALE_PROTOCOL,
+        baudrate=config.SCALE_BAUDRATE,
+    )
+    reader.start()
+    return reader
+
+
+def has_line_scale(line_name):
+    """產線是否設定了多磅秤讀取來源"""
+    return bool(line_name) and line_name in config.SCALE_SOURCES
+
+
+def _weight_result(reading, age, status, state):
+    """將讀數與穩定判斷整理為 (重量, 狀態訊息, 是否穩定, 穩定值)"""
+    if status.startswith("正常"):
+        if reading is None or age > config.SCALE_STALE_SECONDS:
+            return 0.0, "無數據 (連線中)", False, None
+        msg = f"正常連線 ({reading.raw}, {age:.2f}s)"
+        if reading.stable is not None and config.SCALE_STABLE_SOURCE == "auto":
+            return reading.weight, msg, reading.stable, (reading.weight if reading.stable else None)
+        return reading.weight, msg, state.is_stable, state.settled_value
+
+    # 連線異常時不沿用舊讀數，避免顯示過期的重量
+    return 0.0, status, False, None
+
+
+def get_weight_and_stability(line_name=None):
+    """
+    獲取磅秤重量及穩定判斷結果
+
+    參數:
+        line_name: 產線名稱；該產線有設定 config.SCALE_SOURCES 時讀取多磅秤服務，
+                   否則讀取本機磅秤（config.SCALE_PORT）
+
+    穩定來源（config.SCALE_STABLE_SOURCE）：
+    - "auto"：儀表有回報 ST/US 旗標時直接採用，否則使用讀取執行緒中的穩定判斷引擎
+    - "software"：一律使用穩定判斷引擎
+
+    回傳:
+        (重量, 狀態訊息, 是否穩定, 穩定值)
+        是否穩定為 None 表示沒有讀取器的判斷結果（模擬模式），由呼叫端自行判斷
     """
     # 模擬模式 check
     if config.USE_SIMULATION:
         val = round(random.uniform(24.5, 25.5), 2)
-        return val, "模擬數據 (測試用)"
+        return val, "模擬數據 (測試用)", None, None
 
-    # 嘗試使用快取的連接
-    ser = get_serial_connection()
-    
-    if ser is None:
-        # 如果連接失敗，清除快取並重試一次
-        try:
-            get_serial_connection.clear()
-            ser = get_serial_connection()
-        except Exception:
-            pass
-        
-        if ser is None:
-            return 0.0, "連線失敗: 無法建立串口連接"
-    
-    # 檢查連接是否仍然有效
-    try:
-        if not ser.is_open:
-            # 連接已關閉，清除快取並重新連接
-            try:
-                get_serial_connection.clear()
-                ser = get_serial_connection()
-            except Exception:
-                pass
-            
-            if ser is None:
-                return 0.0, "連線失敗: 串口連接已關閉"
-    except (AttributeError, serial.SerialException):
-        # 連接狀態檢查失敗，清除快取並重新連接
-        try:
-            get_serial_connection.clear()
-            ser = get_serial_connection()
-        except Exception:
-            pass
-        
-        if ser is None:
-            return 0.0, "連線失敗: 串口連接異常"
-    
-    # 嘗試讀取數據
-    try:
-        return _read_weight_from_serial(ser)
-    except ConnectionError as e:
-        # 連接錯誤，清除快取以便下次重連
-        try:
-            get_serial_connection.clear()
-        except Exception:
-            pass
-        return 0.0, f"連線失敗: {str(e)}"
-    except serial.SerialException as e:
-        # 串口異常，清除快取以便下次重連
-        try:
-            get_serial_connection.clear()
-        except Exception:
-            pass
-        return 0.0, f"串口錯誤: {str(e)}"
-    except Exception as e:
-        return 0.0, f"讀取失敗: {str(e)}"
+    if has_line_scale(line_name):
+        reader = get_multi_scale_reader()
+        if not reader.is_running:
+            reader.start()
+        return _weight_result(*reader.latest(line_name))
+
+    reading, age, status = get_latest_reading()
+    return _weight_result(reading, age, status, get_scale_reader().stability)
 
 # ==========================================
 # 2. 核心功能：工單排序 (對應 main.py Line 160, 195...)
@@ -386,6 +426,21 @@ def get_shift_info_backup(dt_obj):
     except:
         return ""
 
+def get_shift_date(shift, dt=None):
+    """
+    取得班別所屬的日期（考慮晚班跨日）
+    晚班在 00:00-07:59 時段屬於前一天的班別
+    """
+    if dt is None:
+        dt = datetime.datetime.now()
+    if shift == "晚班":
+        hour = dt.hour
+        minute = dt.minute
+        # 晚班在 00:00-07:59 時段，使用前一天日期
+        if (hour == 0) or (hour >= 1 and hour < 8) or (hour == 7 and minute < 55):
+            return dt - datetime.timedelta(days=1)
+    return dt
+
 def generate_lot_number(line_name, shift, group, dt=None):
     """
     生成 LOT 號碼
@@ -404,17 +459,7 @@ def generate_lot_number(line_name, shift, group, dt=None):
         dt = datetime.datetime.now()
     
     # 根據班別和時間判斷日期（考慮晚班跨日）
-    if shift == "晚班":
-        hour = dt.hour
-        minute = dt.minute
-        # 晚班在 00:00-07:59 時段，使用前一天日期
-        if (hour == 0) or (hour >= 1 and hour < 8) or (hour == 7 and minute < 55):
-            adjusted_date = dt - datetime.timedelta(days=1)
-            date_obj = adjusted_date
-        else:
-            date_obj = dt
-    else:
-        date_obj = dt
+    date_obj = get_shift_date(shift, dt)
     
     # 產線編號（從 Line 1, Line 2 等提取數字）
     line_num = "".join(filter(str.isdigit, line_name)) or "0"
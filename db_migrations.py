@@ -0,0 +1,303 @@
+"""
+資料庫結構版本管理
+以 PRAGMA user_version 記錄資料庫目前的結構版本，依序套用尚未執行的升級（migration），
+每個升級只會執行一次；升級與版本號在同一個交易中寫入，多台平板同時啟動也只會有一台執行
+
+- 新增結構變更時，在檔案最後加上 @migration(下一個版本號, "說明") 的函數，不要修改已發布的升級
+- init_database() 每個程序對同一個資料庫檔案只檢查一次（is_current / mark_current），
+  之後的資料操作不再檢查結構
+- 部署前可先在伺服器執行，避免第一台平板啟動時才升級：
+    python db_migrations.py            # 升級到最新版本
+    python db_migrations.py --status   # 只顯示目前版本
+    python db_migrations.py --db ./production_db.sqlite
+"""
+
+import argparse
+import sqlite3
+import threading
+
+MIGRATIONS = []  # [(版本, 說明, 升級函數(cursor)), ...]，版本號由 1 開始連續遞增
+
+_current_files = set()
+_lock = threading.Lock()
+
+
+def migration(version, description):
+    """註冊一個結構升級（版本號必須連續）"""
+    def register(func):
+        expected = len(MIGRATIONS) + 1
+        if version != expected:
+            raise ValueError(f"結構升級版本號必須連續：預期 {expected}，實際 {version}")
+        MIGRATIONS.append((version, description, func))
+        return func
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def get_version(conn):
+    """資料庫目前的結構版本（尚未使用版本管理的資料庫為 0）"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """
+    套用尚未執行的結構升級（單一交易）
+
+    參數:
+        conn: 資料庫連線
+        target: 升級到的版本（None 表示最新版本）
+
+    回傳:
+        本次套用的版本號清單（已是最新版本時為空清單）
+    """
+    target = latest_version() if target is None else target
+    if get_version(conn) >= target:
+        return []
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # 取得寫入鎖後重新讀取版本：其他平板可能已經完成升級
+        current = get_version(conn)
+        applied = []
+        for version, description, func in MIGRATIONS:
+            if current < version <= target:
+                print(f"🔧 套用資料庫結構升級 {version}：{description}")
+                func(cursor)
+                cursor.execute(f"PRAGMA user_version = {int(version)}")
+                applied.append(version)
+        conn.commit()
+        return applied
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def is_current(db_file):
+    """此程序是否已確認過該資料庫為最新結構"""
+    return db_file in _current_files
+
+
+def mark_current(db_file):
+    with _lock:
+        _current_files.add(db_file)
+
+
+def reset():
+    """清除「已確認」紀錄（下次 init_database() 重新檢查）"""
+    with _lock:
+        _current_files.clear()
+
+
+# ==========================================
+# 結構升級（依版本號排列，已發布的內容不要修改）
+# ==========================================
+@migration(1, "建立資料表與基本索引")
+def _create_base_schema(cursor):
+    # 產品資料表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            產品ID TEXT NOT NULL UNIQUE,
+            客戶名 TEXT,
+            溫度等級 TEXT,
+            品種 TEXT,
+            密度 INTEGER,
+            長 REAL,
+            寬 REAL,
+            高 REAL,
+            下限 REAL,
+            準重 REAL,
+            上限 REAL,
+            備註1 TEXT,
+            備註2 TEXT,
+            備註3 TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # 工單資料表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS work_orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            產線 TEXT NOT NULL,
+            排程順序 INTEGER NOT NULL,
+            工單號碼 TEXT NOT NULL,
+            產品ID TEXT,
+            顯示內容 TEXT,
+            品種 TEXT,
+            密度 INTEGER,
+            準重 REAL,
+            預計數量 INTEGER DEFAULT 0,
+            已完成數量 INTEGER DEFAULT 0,
+            狀態 TEXT,
+            建立時間 TEXT,
+            詳細規格字串 TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(產線, 工單號碼)
+        )
+    """)
+
+    # 生產紀錄表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS production_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            時間 TEXT NOT NULL,
+            產線 TEXT,
+            工單號 TEXT,
+            產品ID TEXT,
+            實測重 REAL,
+            判定結果 TEXT,
+            NG原因 TEXT,
+            組別 TEXT DEFAULT 'A',
+            班別 TEXT,
+            操作員 TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # 建立索引以提升查詢效能
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_product_id ON products(產品ID)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_line ON work_orders(產線)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_sequence ON work_orders(產線, 排程順序)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_time ON production_logs(時間)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_line ON production_logs(產線)")
+
+    # [防重複記錄] 建立組合索引以快速查詢重複記錄（時間、產線、工單號、實測重）
+    # 注意：不使用 UNIQUE 約束，因為時間戳可能有微小差異，我們在應用層面進行重複檢查
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_duplicate_check ON production_logs(時間, 產線, 工單號, 實測重)")
+
+
+@migration(2, "生產紀錄事件 ID（唯一索引）")
+def _add_log_event_id(cursor):
+    # 舊紀錄的 event_id 為 NULL，不受唯一索引限制
+    cursor.execute("PRAGMA table_info(production_logs)")
+    if "event_id" not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE production_logs ADD COLUMN event_id TEXT")
+    # [防重複記錄] 重送同一筆紀錄時由 ON CONFLICT DO NOTHING 略過
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_event_id ON production_logs(event_id)")
+
+
+@migration(3, "生產紀錄時間戳與班別日期（含索引與舊資料回填）")
+def _add_log_time_columns(cursor):
+    # ts_epoch：時間欄位（本地時間）換算的秒數，視為 UTC 計算，與 db_schema.log_time_columns() 一致
+    # shift_date：班別所屬日期（晚班 00:00-07:59 屬於前一天；班別空白時 07:55 前視為前一天的晚班）
+    cursor.execute("PRAGMA table_info(production_logs)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if "ts_epoch" not in columns:
+        cursor.execute("ALTER TABLE production_logs ADD COLUMN ts_epoch INTEGER")
+    if "shift_date" not in columns:
+        cursor.execute("ALTER TABLE production_logs ADD COLUMN shift_date TEXT")
+    cursor.execute("""
+        UPDATE production_logs
+        SET ts_epoch = CAST(strftime('%s', substr(時間, 1, 19)) AS INTEGER),
+            shift_date = CASE
+                WHEN strftime('%s', substr(時間, 1, 19)) IS NULL THEN NULL
+                WHEN 班別 = '晚班' AND strftime('%H', substr(時間, 1, 19)) < '08'
+                    THEN date(substr(時間, 1, 19), '-1 day')
+                WHEN COALESCE(TRIM(班別), '') = '' AND strftime('%H:%M', substr(時間, 1, 19)) < '07:55'
+                    THEN date(substr(時間, 1, 19), '-1 day')
+                ELSE date(substr(時間, 1, 19))
+            END
+        WHERE ts_epoch IS NULL
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_ts_epoch ON production_logs(ts_epoch)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_shift_date ON production_logs(shift_date, 產線)")
+
+
+@migration(4, "本班紀錄查詢索引（產線、班別、組別、班別日期、時間）")
+def _add_session_index(cursor):
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_logs_session
+        ON production_logs(產線, 班別, 組別, shift_date, 時間)
+    """)
+
+
+@migration(5, "班別統計表（PASS/NG/粒子累計，隨每筆紀錄更新）")
+def _add_shift_summary(cursor):
+    # 由 db_schema.insert_log_if_absent / delete_log 在同一交易中累加或扣除
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS shift_summary (
+            產線 TEXT NOT NULL,
+            shift_date TEXT NOT NULL,
+            班別 TEXT NOT NULL,
+            組別 TEXT NOT NULL,
+            工單號 TEXT NOT NULL,
+            良品數 INTEGER NOT NULL DEFAULT 0,
+            實重合計 REAL NOT NULL DEFAULT 0,
+            準重合計 REAL NOT NULL DEFAULT 0,
+            NG數 INTEGER NOT NULL DEFAULT 0,
+            粒子重 REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (產線, shift_date, 班別, 組別, 工單號)
+        )
+    """)
+    # 以現有紀錄回填
+    cursor.execute("""
+        INSERT OR REPLACE INTO shift_summary (產線, shift_date, 班別, 組別, 工單號, 良品數, 實重合計, 準重合計, NG數, 粒子重)
+        SELECT COALESCE(l.產線, ''), l.shift_date, COALESCE(l.班別, ''), COALESCE(l.組別, ''), COALESCE(l.工單號, ''),
+               SUM(l.判定結果 = 'PASS'),
+               SUM(CASE WHEN l.判定結果 = 'PASS' THEN COALESCE(l.實測重, 0) ELSE 0 END),
+               SUM(CASE WHEN l.判定結果 = 'PASS' THEN COALESCE(w.準重, 0) ELSE 0 END),
+               SUM(l.判定結果 = 'NG'),
+               SUM(CASE WHEN l.判定結果 = 'PARTICLE' THEN COALESCE(l.實測重, 0) ELSE 0 END)
+        FROM production_logs l
+        LEFT JOIN work_orders w ON w.產線 = l.產線 AND w.工單號碼 = l.工單號
+        WHERE l.shift_date IS NOT NULL AND l.判定結果 IN ('PASS', 'NG', 'PARTICLE')
+        GROUP BY 1, 2, 3, 4, 5
+    """)
+
+
+@migration(6, "產品目錄版本號（meta 表與 products 觸發器）")
+def _add_products_version(cursor):
+    # product_catalog 以此判斷程序內的產品目錄快取是否過期
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('products_version', 0)")
+    # 任何程式新增/修改/刪除產品都會遞增版本號（匯入腳本、後台、其他平板）
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_products_version_{event.lower()}
+            AFTER {event} ON products
+            BEGIN
+                UPDATE meta SET value = value + 1 WHERE key = 'products_version';
+            END
+        """)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="資料庫結構升級")
+    parser.add_argument("--db", default=None, help="資料庫檔案（預設為 db_schema.get_db_file()）")
+    parser.add_argument("--status", action="store_true", help="只顯示目前版本，不升級")
+    args = parser.parse_args(argv)
+
+    db_file = args.db
+    if db_file is None:
+        import db_schema
+        db_file = db_schema.get_db_file()
+
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    try:
+        version = get_version(conn)
+        print(f"📦 {db_file}：目前版本 {version}，最新版本 {latest_version()}")
+        if args.status:
+            return
+        applied = migrate(conn)
+        if applied:
+            print(f"✅ 已套用 {len(applied)} 個升級，目前版本 {get_version(conn)}")
+        else:
+            print("✅ 已是最新版本")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+SQLite 持久連線管理
+每個程序保留少量「讀取」連線（DB_POOL_READERS 條）與「寫入」連線（DB_POOL_WRITERS 條），
+重複使用而不是每次呼叫都重新連線
+
+- get_connection() 取得的連線呼叫 close() 時只會歸還，不會真正關閉
+- 每條連線同一時間只有一個執行緒使用（同執行緒可重入，例如寫入後立即重新載入）；
+  多個 session 同時查詢時各自取得不同的連線，不必排隊
+- 閒置超過 DB_HEALTH_CHECK_SECONDS、路徑改變或歸還時仍有未完成的交易，才在下次取用時檢查連線
+- 全部連線都在使用中且等待超過 DB_POOL_WAIT_SECONDS 時改用臨時連線，不會因為某個 session 卡住而全部阻塞
+- get_stats() 回報實際連線次數、重用次數及省下的連線時間
+"""
+
+import sqlite3
+import threading
+import time
+
+import config
+
+
+class PooledConnection(sqlite3.Connection):
+    """由連線管理器持有的連線：close() 只歸還，不關閉"""
+
+    _slot = None
+
+    def close(self):
+        slot = self._slot
+        if slot is None:
+            super().close()
+            return
+        # 是否需要重新檢查由 release() 依未完成的交易判斷（finally: conn.close() 也可能處於無關的例外中）
+        slot.release()
+
+    def really_close(self):
+        self._slot = None
+        try:
+            super().close()
+        except Exception:
+            pass
+
+
+class _Slot:
+    """單一持久連線（使用權由所屬的 _Pool 管理）"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.name = pool.name
+        self.conn = None
+        self.path = None
+        self.last_used = 0.0
+        self.suspect = False
+        self._owner = None
+        self._depth = 0
+
+    def release(self, failed=False):
+        with self.pool.cond:
+            if self._owner is not threading.current_thread():
+                return
+            if failed:
+                self.suspect = True
+            self._depth -= 1
+            if self._depth > 0:
+                return
+            # 呼叫端未 commit 就歸還時回滾，避免下一位使用者接到未完成的交易
+            try:
+                if self.conn is not None and self.conn.in_transaction:
+                    self.conn.rollback()
+                    self.suspect = True
+            except Exception:
+                self.suspect = True
+            self.last_used = time.monotonic()
+            self._owner = None
+            self.pool.cond.notify()
+
+    def drop(self):
+        if self.conn is not None:
+            self.conn.really_close()
+            self.conn = None
+            self.path = None
+
+
+class _Pool:
+    """同一用途（讀取或寫入）的數條持久連線"""
+
+    def __init__(self, name, size):
+        self.name = name
+        self.cond = threading.Condition()
+        self.slots = [_Slot(self) for _ in range(max(1, size))]
+
+    def acquire(self, timeout):
+        """取得一條連線的使用權（同執行緒可重入）；逾時回傳 None"""
+        me = threading.current_thread()
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                free = None
+                for slot in self.slots:
+                    if slot._owner is me:
+                        slot._depth += 1
+                        return slot
+                    if slot._owner is not None and not slot._owner.is_alive():
+                        # 持有者執行緒已結束卻未歸還（例如例外時漏掉 close），收回連線
+                        print(f"⚠️ 資料庫{self.name}連線未歸還，已收回")
+                        slot._owner = None
+                        slot.suspect = True
+                    # 優先使用已開啟的連線
+                    if slot._owner is None and (free is None or (free.conn is None and slot.conn is not None)):
+                        free = slot
+                if free is not None:
+                    free._owner = me
+                    free._depth = 1
+                    return free
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(min(remaining, 0.5))
+
+
+class ConnectionManager:
+    """
+    每個程序一個的連線管理器
+
+    參數:
+        opener: 建立連線的函數 opener(factory) -> sqlite3.Connection
+        path_getter: 取得目前資料庫路徑的函數（路徑改變時重新連線）
+    """
+
+    def __init__(self, opener, path_getter):
+        self._opener = opener
+        self._path_getter = path_getter
+        self._pools = {
+            "reader": _Pool("讀取", config.DB_POOL_READERS),
+            "writer": _Pool("寫入", config.DB_POOL_WRITERS),
+        }
+        self._stats_lock = threading.Lock()
+        self.connects = 0
+        self.connect_seconds = 0.0
+        self.leases = 0
+        self.reused = 0
+        self.reconnects = 0
+        self.overflow = 0
+        self.health_checks = 0
+
+    def _record_connect(self, seconds):
+        with self._stats_lock:
+            self.connects += 1
+            self.connect_seconds += seconds
+
+    def _connect(self, slot):
+        start = time.perf_counter()
+        conn = self._opener(PooledConnection)
+        self._record_connect(time.perf_counter() - start)
+        conn._slot = slot
+        slot.conn = conn
+        slot.path = self._path_getter()
+        slot.suspect = False
+
+    def _healthy(self, slot):
+        self.health_checks += 1
+        if self._path_getter() != slot.path:
+            return False
+        try:
+            slot.conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def lease(self, role="writer"):
+        """取得持久連線（使用完畢後呼叫 close() 歸還）"""
+        slot = self._pools[role].acquire(config.DB_POOL_WAIT_SECONDS)
+        if slot is None:
+            # 所有連線都被長時間占用：改用臨時連線（close() 會真正關閉）
+            self.overflow += 1
+            start = time.perf_counter()
+            conn = self._opener(sqlite3.Connection)
+            self._record_connect(time.perf_counter() - start)
+            return conn
+
+        if slot._depth > 1:
+            return slot.conn
+        try:
+            self.leases += 1
+            if slot.conn is None:
+                self._connect(slot)
+                return slot.conn
+            idle = time.monotonic() - slot.last_used
+            if slot.suspect or idle > config.DB_HEALTH_CHECK_SECONDS:
+                if not self._healthy(slot):
+                    self.reconnects += 1
+                    slot.drop()
+                    self._connect(slot)
+                    return slot.conn
+                slot.suspect = False
+            self.reused += 1
+            return slot.conn
+        except Exception:
+            slot.drop()
+            slot.release(failed=True)
+            raise
+
+    def invalidate(self):
+        """標記所有連線需在下次取用時重新檢查（例如伺服器重新連線後）"""
+        for pool in self._pools.values():
+            for slot in pool.slots:
+                slot.suspect = True
+
+    def get_stats(self):
+        """連線統計：實際連線次數、重用次數、平均連線時間、估計省下的時間（秒）"""
+        avg = self.connect_seconds / self.connects if self.connects else 0.0
+        return {
+            "connects": self.connects,
+            "leases": self.leases,
+            "reused": self.reused,
+            "reconnects": self.reconnects,
+            "overflow": self.overflow,
+            "health_checks": self.health_checks,
+            "avg_connect_ms": avg * 1000,
+            "saved_seconds": self.reused * avg,
+        }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager(opener, path_getter):
+    """取得程序唯一的連線管理器（db_schema 被重新載入時沿用同一個）"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ConnectionManager(opener, path_getter)
+        return _manager
+
+
+def get_stats():
+    """連線統計（尚未使用連線管理器時回傳 None）"""
+    return _manager.get_stats() if _manager is not None else None
+
+
+def invalidate():
+    """標記所有持久連線需重新檢查"""
+    if _manager is not None:
+        _manager.invalidate()
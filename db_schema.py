@@ -3,11 +3,18 @@ SQL 資料庫結構定義
 使用 SQLite 作為資料庫引擎
 """
 
+import calendar
+import hashlib
 import sqlite3
 import os
 import sys
 import time
+import uuid
+from datetime import datetime, timedelta
+
 import config
+import db_migrations
+import db_pool
 
 # 設定標準輸出編碼為 UTF-8（解決 Windows 命令提示字元中文顯示問題）
 if sys.stdout.encoding != 'utf-8':
@@ -68,80 +75,8 @@ def create_tables():
         cursor = conn.cursor()
         cursor.execute("PRAGMA busy_timeout = 30000")
         
-        # 產品資料表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                產品ID TEXT NOT NULL UNIQUE,
-                客戶名 TEXT,
-                溫度等級 TEXT,
-                品種 TEXT,
-                密度 INTEGER,
-                長 REAL,
-                寬 REAL,
-                高 REAL,
-                下限 REAL,
-                準重 REAL,
-                上限 REAL,
-                備註1 TEXT,
-                備註2 TEXT,
-                備註3 TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # 工單資料表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS work_orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                產線 TEXT NOT NULL,
-                排程順序 INTEGER NOT NULL,
-                工單號碼 TEXT NOT NULL,
-                產品ID TEXT,
-                顯示內容 TEXT,
-                品種 TEXT,
-                密度 INTEGER,
-                準重 REAL,
-                預計數量 INTEGER DEFAULT 0,
-                已完成數量 INTEGER DEFAULT 0,
-                狀態 TEXT,
-                建立時間 TEXT,
-                詳細規格字串 TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(產線, 工單號碼)
-            )
-        """)
-        
-        # 生產紀錄表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS production_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                時間 TEXT NOT NULL,
-                產線 TEXT,
-                工單號 TEXT,
-                產品ID TEXT,
-                實測重 REAL,
-                判定結果 TEXT,
-                NG原因 TEXT,
-                組別 TEXT DEFAULT 'A',
-                班別 TEXT,
-                操作員 TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # 建立索引以提升查詢效能
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_product_id ON products(產品ID)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_line ON work_orders(產線)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_sequence ON work_orders(產線, 排程順序)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_time ON production_logs(時間)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_line ON production_logs(產線)")
-        
-        # [防重複記錄] 建立組合索引以快速查詢重複記錄（時間、產線、工單號、實測重）
-        # 注意：不使用 UNIQUE 約束，因為時間戳可能有微小差異，我們在應用層面進行重複檢查
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_duplicate_check ON production_logs(時間, 產線, 工單號, 實測重)")
+        # 資料表與索引由結構升級程序建立（見 db_migrations.py）
+        db_migrations.migrate(conn)
         
         conn.commit()
         conn.close()
@@ -169,13 +104,32 @@ def create_tables():
         raise Exception(error_msg)
 
 
-def get_connection(max_retries=3, retry_delay=1):
+def get_connection(max_retries=3, retry_delay=1, readonly=False):
+    """
+    取得資料庫連線
+
+    [優化] 啟用 config.DB_PERSISTENT_CONNECTIONS 時回傳持久連線（db_pool.py），
+    不再每次呼叫都重新連線、檢查伺服器並測試連線；呼叫端照常使用 conn.close() 歸還
+
+    參數:
+        max_retries: 最大重試次數（預設 3 次）
+        retry_delay: 重試間隔（秒，預設 1 秒）
+        readonly: 只讀取資料時為 True（使用讀取連線，不會等待寫入中的 session）
+    """
+    if config.DB_PERSISTENT_CONNECTIONS:
+        manager = db_pool.get_manager(lambda factory: _open_connection(factory=factory), get_db_file)
+        return manager.lease("reader" if readonly else "writer")
+    return _open_connection(max_retries, retry_delay)
+
+
+def _open_connection(max_retries=3, retry_delay=1, factory=sqlite3.Connection):
     """
-    取得資料庫連線（帶重試機制和動態連線檢查）
+    建立新的資料庫連線（帶重試機制和動態連線檢查）
     
     參數:
         max_retries: 最大重試次數（預設 3 次）
         retry_delay: 重試間隔（秒，預設 1 秒）
+        factory: 連線類別（持久連線使用 db_pool.PooledConnection）
     """
     last_error = None
     
@@ -220,7 +174,7 @@ def get_connection(max_retries=3, retry_delay=1):
                         raise
             
             # [改進] 測試連接 + timeout/busy_timeout，降低 network share / 多人同時存取造成的鎖定問題
-            conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False)
+            conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False, factory=factory)
             # 執行簡單查詢測試連接是否正常
             cursor = conn.cursor()
             cursor.execute("PRAGMA busy_timeout = 30000")
@@ -288,13 +242,187 @@ def get_connection(max_retries=3, retry_delay=1):
     raise Exception(error_msg)
 
 
+_LOG_INSERT_COLUMNS = config.LOG_COLUMNS + ["event_id", "ts_epoch", "shift_date"]
+_LOG_INSERT_IF_ABSENT_SQL = f"""
+    INSERT INTO production_logs ({', '.join(_LOG_INSERT_COLUMNS)})
+    VALUES ({', '.join(['?'] * len(_LOG_INSERT_COLUMNS))})
+    ON CONFLICT(event_id) DO NOTHING
+"""
+
+
+def to_epoch(dt):
+    """datetime（本地時間）→ ts_epoch 秒數（視為 UTC 計算，與 SQLite strftime('%s', 時間) 相同）"""
+    return calendar.timegm(dt.timetuple())
+
+
+def log_time_columns(time_str, shift):
+    """
+    由紀錄時間與班別計算 (ts_epoch, shift_date)，無法解析時間時回傳 (None, None)
+
+    shift_date 為班別所屬日期：晚班 00:00-07:59 屬於前一天（同 data_manager.get_shift_date）；
+    班別空白時依時間推定（同 data_manager.get_shift_info_backup），07:55 前視為前一天的晚班
+    """
+    try:
+        dt = datetime.strptime(str(time_str)[:19], "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None, None
+    shift = (shift or "").strip()
+    if shift == "晚班":
+        previous_day = dt.hour < 8
+    elif not shift:
+        previous_day = (dt.hour, dt.minute) < (7, 55)
+    else:
+        previous_day = False
+    day = dt.date() - timedelta(days=1) if previous_day else dt.date()
+    return to_epoch(dt), day.isoformat()
+
+
+def new_event_id():
+    """產生一筆紀錄的事件 ID（建立紀錄時產生一次，重送時沿用同一個）"""
+    return uuid.uuid4().hex
+
+
+def content_event_id(log, occurrence=0):
+    """
+    沒有事件 ID 的紀錄（例如整批儲存、舊版日誌項目）依內容推導出固定的事件 ID，
+    同一批資料重送時得到相同結果
+
+    參數:
+        occurrence: 同一批中內容完全相同的第幾筆（0 起算），讓合法的相同紀錄不會互相抵銷
+    """
+    key = "|".join(str(log.get(col)) for col in ("時間", "產線", "工單號", "判定結果"))
+    key += f"|{float(log.get('實測重') or 0):.3f}|{occurrence}"
+    return "c:" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def insert_log_if_absent(cursor, log, order=None):
+    """
+    寫入一筆生產紀錄（冪等）：以 event_id 唯一索引判斷，已寫入過的事件直接略過，
+    紀錄實際寫入時才累加工單完成數量，重送同一筆不會重複計數
+
+    參數:
+        cursor: 資料庫游標（由呼叫端負責交易）
+        log: {欄位: 值}，欄位同 config.LOG_COLUMNS，另含 "event_id"（缺少時依內容推導）
+        order: {"產線", "工單號碼", "delta", "status"}，None 表示不更新工單
+
+    回傳:
+        新紀錄的 id；已寫入過（略過）時回傳 None
+        （之後的班別統計 upsert 會改變 cursor.lastrowid，請使用回傳值）
+    """
+    values = [log.get(col) for col in config.LOG_COLUMNS]
+    ts_epoch, shift_date = log_time_columns(log.get("時間"), log.get("班別"))
+    values += [log.get("event_id") or content_event_id(log), ts_epoch, shift_date]
+    cursor.execute(_LOG_INSERT_IF_ABSENT_SQL, values)
+    inserted = cursor.lastrowid if cursor.rowcount == 1 else None
+    if inserted:
+        update_shift_summary(
+            cursor, log.get("產線"), shift_date, log.get("班別"), log.get("組別"),
+            log.get("工單號"), log.get("判定結果"), log.get("實測重"), 1,
+        )
+        if order:
+            bump_work_order(cursor, order["產線"], order["工單號碼"], order.get("delta", 0), order.get("status"))
+    return inserted
+
+
+def delete_log(cursor, rowid=None, event_id=None, log=None, order=None):
+    """
+    刪除一筆生產紀錄（由呼叫端負責交易）
+    依序以 id、event_id 或（時間、產線、工單號、實測重）找出該筆，皆為索引查詢，
+    實際刪除時才扣回工單完成數量，重送同一個撤銷不會重複扣除
+
+    參數:
+        rowid: 紀錄 id
+        event_id: 事件 ID（尚不知道 id 時使用，例如本機日誌寫入的紀錄）
+        log: {欄位: 值}（前兩者皆無時，以內容找出最新的一筆）
+        order: {"產線", "工單號碼", "delta", "status"}，None 表示不更新工單
+
+    回傳:
+        是否實際刪除
+    """
+    if rowid is None and event_id:
+        row = cursor.execute("SELECT id FROM production_logs WHERE event_id = ?", (event_id,)).fetchone()
+        rowid = row[0] if row else None
+    if rowid is None and log is not None:
+        row = cursor.execute("""
+            SELECT id FROM production_logs
+            WHERE 時間 = ? AND 產線 = ? AND 工單號 = ? AND 實測重 = ?
+            ORDER BY id DESC LIMIT 1
+        """, (log["時間"], log["產線"], log["工單號"], log["實測重"])).fetchone()
+        rowid = row[0] if row else None
+    if rowid is None:
+        return False
+    row = cursor.execute("""
+        SELECT 產線, shift_date, 班別, 組別, 工單號, 判定結果, 實測重 FROM production_logs WHERE id = ?
+    """, (rowid,)).fetchone()
+    if row is None:
+        return False
+    cursor.execute("DELETE FROM production_logs WHERE id = ?", (rowid,))
+    deleted = cursor.rowcount == 1
+    if deleted:
+        update_shift_summary(cursor, *row, -1)
+        if order:
+            bump_work_order(cursor, order["產線"], order["工單號碼"], order.get("delta", 0), order.get("status"))
+    return deleted
+
+
+def update_shift_summary(cursor, line, shift_date, shift, group, wo_id, result, weight, sign):
+    """
+    累加（sign=1）或扣除（sign=-1）一筆紀錄在班別統計（shift_summary）中的數值（由呼叫端負責交易）
+    PASS：良品數、實重合計、準重合計（工單準重）；NG：NG數；PARTICLE：粒子重
+    """
+    if shift_date is None or result not in ("PASS", "NG", "PARTICLE"):
+        return
+    weight = float(weight or 0)
+    pass_count = pass_weight = std_weight = ng_count = particle_weight = 0
+    if result == "PASS":
+        row = cursor.execute(
+            "SELECT 準重 FROM work_orders WHERE 產線 = ? AND 工單號碼 = ?", (line, wo_id)
+        ).fetchone()
+        pass_count, pass_weight, std_weight = 1, weight, float(row[0] or 0) if row else 0.0
+    elif result == "NG":
+        ng_count = 1
+    else:
+        particle_weight = weight
+    cursor.execute("""
+        INSERT INTO shift_summary (產線, shift_date, 班別, 組別, 工單號, 良品數, 實重合計, 準重合計, NG數, 粒子重)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(產線, shift_date, 班別, 組別, 工單號) DO UPDATE SET
+            良品數 = 良品數 + excluded.良品數,
+            實重合計 = 實重合計 + excluded.實重合計,
+            準重合計 = 準重合計 + excluded.準重合計,
+            NG數 = NG數 + excluded.NG數,
+            粒子重 = 粒子重 + excluded.粒子重
+    """, (
+        line or "", shift_date, shift or "", group or "", wo_id or "",
+        sign * pass_count, sign * pass_weight, sign * std_weight, sign * ng_count, sign * particle_weight,
+    ))
+
+
+def bump_work_order(cursor, line, wo_id, delta=1, status=None):
+    """累加工單完成數量（可為負數，最少為 0；status 不為 None 時同時更新狀態），回傳更新筆數"""
+    cursor.execute("""
+        UPDATE work_orders
+        SET 已完成數量 = MAX(已完成數量 + ?, 0), 狀態 = COALESCE(?, 狀態)
+        WHERE 產線 = ? AND 工單號碼 = ?
+    """, (delta, status, line, wo_id))
+    return cursor.rowcount
+
+
 def init_database():
-    """初始化資料庫（如果不存在則建立）"""
+    """
+    初始化資料庫（如果不存在則建立），並套用尚未執行的結構升級
+
+    [優化] 每個程序對同一個資料庫檔案只檢查一次（見 db_migrations.py），
+    之後的呼叫不再檢查檔案、開啟連線或重送 CREATE INDEX
+    """
     global _db_init_message_shown
     
+    # 動態獲取資料庫路徑（確保使用最新的 BASE_DIR）
+    db_file = get_db_file()
+    if db_migrations.is_current(db_file):
+        return
+    
     try:
-        # 動態獲取資料庫路徑（確保使用最新的 BASE_DIR）
-        db_file = get_db_file()
         print(f"🔍 檢查資料庫：{db_file}")
         print(f"   BASE_DIR：{config.BASE_DIR}")
         print(f"   資料庫目錄存在：{os.path.exists(os.path.dirname(db_file))}")
@@ -306,15 +434,11 @@ def init_database():
             _db_init_message_shown = True
         else:
             print(f"📦 資料庫檔案已存在：{db_file}")
-            # 確保索引存在（對於已存在的資料庫，確保新索引被創建）
             conn = get_connection()
-            cursor = conn.cursor()
             try:
-                # 創建防重複記錄的組合索引（如果不存在）
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_duplicate_check ON production_logs(時間, 產線, 工單號, 實測重)")
-                conn.commit()
-            except Exception as e:
-                print(f"⚠️ 創建索引時發生錯誤（可忽略）：{e}")
+                applied = db_migrations.migrate(conn)
+                if applied:
+                    print(f"✅ 資料庫結構已升級到第 {applied[-1]} 版")
             finally:
                 conn.close()
             
@@ -323,6 +447,7 @@ def init_database():
                 file_size = os.path.getsize(db_file)
                 print(f"📦 資料庫已存在，大小：{file_size} bytes")
                 _db_init_message_shown = True
+        db_migrations.mark_current(db_file)
     except Exception as e:
         error_msg = f"❌ 初始化資料庫失敗：{e}"
         print(error_msg)
@@ -0,0 +1,343 @@
+"""
+單一寫入者資料庫服務
+在伺服器（或本機）執行的小型服務，是唯一開啟 production_db.sqlite 的程序；
+各平板透過 TCP（或 Unix socket）送出請求，不再經由網路磁碟同時開啟同一個 SQLite 檔案
+
+通訊協定（每個訊框）：
+    4 bytes 長度（big-endian）+ UTF-8 JSON
+    請求：{"id": 1, "op": "record_logs", "args": {...}}
+    回應：{"id": 1, "ok": true, "result": ...} 或 {"id": 1, "ok": false, "error": "..."}
+
+操作：
+    ping                                   -> "pong"
+    record_logs  {items: [{log, order}]}   -> [{"inserted": bool, "rowid": int}, ...]
+    bump_order   {產線, 工單號碼, delta, status}  -> 更新筆數
+    delete_log   {id, event_id, log, order}  -> 是否實際刪除
+
+同時到達的請求由單一寫入執行緒合併成一次交易提交（group commit），
+每個請求以 SAVEPOINT 隔離，單一請求失敗不影響同批次的其他請求
+
+適用範圍（config.DB_BACKEND = "service"）：只有秤重紀錄的寫入（record_logs / delete_log 及其工單完成數量）
+經由本服務；其他讀寫（工單/產品存檔、工單狀態、本班紀錄與報表查詢）仍由 data_loader 直接開啟資料庫檔案
+
+執行：
+    python db_service.py --listen tcp://0.0.0.0:8765
+    python db_service.py --listen unix:/tmp/production_db.sock --db ./production_db.sqlite
+"""
+
+import argparse
+import asyncio
+import json
+import select
+import socket
+import sqlite3
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import db_migrations
+from db_schema import bump_work_order, delete_log, insert_log_if_absent
+
+_LENGTH = struct.Struct(">I")
+MAX_FRAME = 16 * 1024 * 1024
+
+
+def parse_address(address):
+    """解析服務位址：tcp://host:port 或 unix:/path"""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        return "tcp", (host, int(port))
+    raise ValueError(f"無法解析的資料庫服務位址：{address}")
+
+
+# ==========================================
+# 1. 服務端
+# ==========================================
+class DbService:
+    """
+    單一寫入者資料庫服務
+
+    參數:
+        db_file: SQLite 資料庫檔案
+        group_window: 合併請求的等待時間（秒），越長批次越大但延遲越高
+        max_batch: 單一交易最多處理的請求數
+    """
+
+    def __init__(self, db_file, group_window=0.002, max_batch=256):
+        self.db_file = db_file
+        self._group_window = group_window
+        self._max_batch = max_batch
+        # 所有 SQLite 操作都在同一條執行緒、同一條連線上執行
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="DbServiceWriter")
+        self._conn = None
+        self._queue = None
+        self.batches = 0
+        self.requests = 0
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA busy_timeout = 30000")
+
+    # ------------------------------------------
+    # 操作（在寫入執行緒中執行）
+    # ------------------------------------------
+    def _op_ping(self, cur, args):
+        return "pong"
+
+    def _op_record_logs(self, cur, args):
+        results = []
+        for item in args["items"]:
+            rowid = insert_log_if_absent(cur, item["log"], item.get("order"))
+            results.append({"inserted": rowid is not None, "rowid": rowid})
+        return results
+
+    def _op_bump_order(self, cur, args):
+        return bump_work_order(cur, args["產線"], args["工單號碼"], args.get("delta", 0), args.get("status"))
+
+    def _op_delete_log(self, cur, args):
+        return delete_log(cur, args.get("id"), args.get("event_id"), args.get("log"), args.get("order"))
+
+    def _run_batch(self, batch):
+        """以單一交易執行一批請求，回傳 [(ok, result_or_error), ...]"""
+        if self._conn is None:
+            self._open()
+        cur = self._conn.cursor()
+        results = []
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for i, (op, args) in enumerate(batch):
+                handler = getattr(self, f"_op_{op}", None)
+                if handler is None:
+                    results.append((False, f"未知的操作：{op}"))
+                    continue
+                cur.execute(f"SAVEPOINT req{i}")
+                try:
+                    results.append((True, handler(cur, args)))
+                    cur.execute(f"RELEASE req{i}")
+                except Exception as e:
+                    cur.execute(f"ROLLBACK TO req{i}")
+                    cur.execute(f"RELEASE req{i}")
+                    results.append((False, str(e)))
+            self._conn.commit()
+        except Exception as e:
+            # 整批失敗（例如磁碟錯誤）：回滾並重新開啟連線
+            try:
+                self._conn.rollback()
+            except Exception:
+                pass
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+            return [(False, f"資料庫錯誤：{e}")] * len(batch)
+        self.batches += 1
+        self.requests += len(batch)
+        return results
+
+    # ------------------------------------------
+    # asyncio 網路層
+    # ------------------------------------------
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            batch = [first]
+            # 等待一小段時間，把同時到達的請求合併成同一個交易
+            deadline = loop.time() + self._group_window
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self._run_batch, [(op, args) for op, args, _ in batch]
+                )
+            except Exception as e:
+                # [關鍵修正] 非預期的錯誤不可結束寫入迴圈，否則之後所有請求都會永遠等待
+                print(f"❌ 資料庫服務處理批次失敗：{e}")
+                results = [(False, f"服務錯誤：{e}")] * len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def _handle_client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                header = await reader.readexactly(_LENGTH.size)
+                (length,) = _LENGTH.unpack(header)
+                if length > MAX_FRAME:
+                    break
+                request = json.loads(await reader.readexactly(length))
+                future = loop.create_future()
+                await self._queue.put((request.get("op"), request.get("args") or {}, future))
+                ok, result = await future
+                response = {"id": request.get("id"), "ok": ok}
+                response["result" if ok else "error"] = result
+                data = json.dumps(response, ensure_ascii=False, default=str).encode("utf-8")
+                writer.write(_LENGTH.pack(len(data)) + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address):
+        self._queue = asyncio.Queue()
+        kind, target = parse_address(address)
+        if kind == "unix":
+            server = await asyncio.start_unix_server(self._handle_client, path=target)
+        else:
+            server = await asyncio.start_server(self._handle_client, target[0], target[1])
+        writer_task = asyncio.create_task(self._writer_loop())
+        print(f"🗄️ 資料庫服務已啟動：{address}（資料庫 {self.db_file}）")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer_task.cancel()
+
+
+# ==========================================
+# 2. 客戶端
+# ==========================================
+class DbServiceError(Exception):
+    """資料庫服務回傳的錯誤"""
+
+
+class DbServiceClient:
+    """
+    資料庫服務客戶端（阻塞式，執行緒安全）
+
+    參數:
+        address: 服務位址（tcp://host:port 或 unix:/path）
+        timeout: 單一請求逾時（秒）
+    """
+
+    def __init__(self, address, timeout=10.0):
+        self.address = address
+        self._timeout = timeout
+        self._sock = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def _connect(self):
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self._timeout)
+        sock.connect(target)
+        self._sock = sock
+
+    def _recv_exact(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self._sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("資料庫服務已關閉連線")
+            buf += chunk
+        return bytes(buf)
+
+    def _stale(self):
+        """重用的連線是否已被服務端關閉（例如服務重新啟動），送出請求前檢查"""
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            return bool(readable) and self._sock.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def call(self, op, **args):
+        """
+        送出請求並等待回應
+
+        只有請求尚未完整送出時（連線失敗、送出中斷）才重新連線並重試一次；
+        [關鍵修正] 已送出後逾時或中斷時不重送，服務端可能已經提交（例如重送撤銷會回報找不到紀錄）
+        """
+        with self._lock:
+            self._next_id += 1
+            data = json.dumps({"id": self._next_id, "op": op, "args": args}, ensure_ascii=False).encode("utf-8")
+            frame = _LENGTH.pack(len(data)) + data
+            if self._sock is not None and self._stale():
+                self.close()
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    # 服務端只處理完整的訊框，送出中斷時這個請求不會被執行
+                    self._sock.sendall(frame)
+                    break
+                except OSError as e:
+                    self.close()
+                    if attempt == 1:
+                        raise ConnectionError(f"無法連線到資料庫服務 {self.address}：{e}")
+            try:
+                (length,) = _LENGTH.unpack(self._recv_exact(_LENGTH.size))
+                response = json.loads(self._recv_exact(length))
+            except OSError as e:
+                self.close()
+                raise ConnectionError(f"資料庫服務沒有回應（請求可能已經執行）：{e}")
+        if not response.get("ok"):
+            raise DbServiceError(response.get("error"))
+        return response.get("result")
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    # 常用操作
+    def record_logs(self, items):
+        return self.call("record_logs", items=items)
+
+    def bump_order(self, line, wo_id, delta=1, status=None):
+        return self.call("bump_order", 產線=line, 工單號碼=wo_id, delta=delta, status=status)
+
+    def delete_log(self, rowid=None, event_id=None, log=None, order=None):
+        return self.call("delete_log", id=rowid, event_id=event_id, log=log, order=order)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="單一寫入者資料庫服務")
+    parser.add_argument("--listen", default=config.DB_SERVICE_ADDRESS, help="tcp://host:port 或 unix:/path")
+    parser.add_argument("--db", default=None, help="資料庫檔案（預設為 db_schema.get_db_file()）")
+    parser.add_argument("--group-window", type=float, default=0.002, help="合併請求的等待時間（秒）")
+    args = parser.parse_args(argv)
+
+    db_file = args.db
+    if db_file is None:
+        import db_schema
+        db_file = db_schema.get_db_file()
+
+    # [關鍵修正] 無論是否指定 --db，都先把實際服務的資料庫升級到最新結構
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    try:
+        applied = db_migrations.migrate(conn)
+    finally:
+        conn.close()
+    if applied:
+        print(f"✅ 資料庫結構已升級到第 {applied[-1]} 版：{db_file}")
+
+    service = DbService(db_file, group_window=args.group_window)
+    try:
+        asyncio.run(service.serve(args.listen))
+    except KeyboardInterrupt:
+        print(f"⏹️ 資料庫服務已停止（{service.batches} 個交易 / {service.requests} 個請求）")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,13 @@
 """
 
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 import time
 import re
 import config
 import data_manager as dm
-from data_loader import save_data
+from data_loader import get_session_logs, get_shift_summary, record_piece, save_data, undo_piece
+from queue_view import get_queue_view
 
 
 @st.dialog("確認撤銷 (Confirm Undo)")
@@ -40,48 +40,20 @@ def show_undo_confirm(line_name, shift_curr, group_curr):
     with col_confirm:
         if st.button("確定\n(Confirm)", type="primary", width='stretch'):
             try:
-                logs = st.session_state.production_logs
-                
-                # 檢查 logs 是否為空
-                if logs.empty:
-                    st.error("❌ 沒有記錄可以刪除")
-                    return
-                
-                # 過濾出符合條件的記錄（同一個 session：日期、產線、班別、組別）
-                today_str = datetime.now().strftime("%Y-%m-%d")
-                mask_strict_shift = (logs["班別"] == shift_curr)
-                mask_strict_group = (logs["組別"] == group_curr)
-                temp_dts = pd.to_datetime(logs["時間"], errors='coerce') 
-                mask_date = temp_dts.dt.date.astype(str) == today_str
-                mask_line = logs["產線"] == line_name
-                session_logs = logs[mask_date & mask_line & mask_strict_shift & mask_strict_group]
+                # 同一個 session（產線、班別、組別、班別日期，晚班跨日仍屬同一班）的紀錄，含尚未同步的本機紀錄
+                session_logs = get_session_logs(line_name, shift_curr, group_curr)
                 
                 # 檢查是否有符合條件的記錄
-                if session_logs.empty or len(session_logs) == 0:
+                if session_logs.empty:
                     st.error(f"❌ {line_name} 目前沒有可刪除的記錄")
                     return
                 
-                # 取得最後一筆記錄的索引
-                last_idx = session_logs.index[-1]
-                last_log = logs.loc[last_idx]
-                
-                # 如果是 PASS 記錄，需要更新工單的已完成數量
-                if last_log["判定結果"] == "PASS":
-                    wo_id = last_log["工單號"]
-                    if not st.session_state.work_orders_db.empty:
-                        wo_indices = st.session_state.work_orders_db.index[
-                            st.session_state.work_orders_db["工單號碼"] == wo_id
-                        ].tolist()
-                        if wo_indices:
-                            wo_idx = wo_indices[0]
-                            current_qty = st.session_state.work_orders_db.at[wo_idx, "已完成數量"]
-                            if current_qty > 0:
-                                st.session_state.work_orders_db.at[wo_idx, "已完成數量"] = current_qty - 1
-                                st.session_state.work_orders_db.at[wo_idx, "狀態"] = "生產中" 
+                # 取得最後一筆記錄（依時間排序，同一秒內以紀錄 id 先後為準；尚未同步的紀錄沒有 id，排在最後）
+                last_log = session_logs.sort_values(by=["時間", "id"], kind="stable").iloc[-1]
                 
-                # 刪除最後一筆記錄（無論是 PASS 還是 NG）
-                st.session_state.production_logs = logs.drop(last_idx)
-                save_data()
+                # [優化] 以紀錄 id 刪除單筆，PASS 時同一交易扣回工單完成數量
+                if not undo_piece(last_log):
+                    st.warning("⚠️ 資料庫中找不到這筆紀錄（可能已被刪除），已從畫面移除")
                 st.session_state.toast_msg = ("↩️ 已成功撤銷上一筆紀錄", None)
                 # 設定標記，讓主程式知道需要重新載入
                 st.session_state[f"undo_completed_{line_name}"] = True
@@ -209,8 +181,6 @@ def show_end_shift_dialog(line_name, current_s, current_g, all_line_statuses):
         return
     
     st.markdown(f"### 📋 {line_name} 生產數據確認")
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    logs = st.session_state.production_logs
     
     key_confirmed = f"p_conf_{line_name}"
     key_weight = f"p_val_{line_name}"
@@ -228,24 +198,12 @@ def show_end_shift_dialog(line_name, current_s, current_g, all_line_statuses):
     collection_rate_val = 0.0
     product_weight = 0.0
 
-    if not logs.empty:
-        temp_logs = logs.copy()
-        temp_logs['datetime'] = temp_logs['時間'].apply(dm.parse_log_time)
-        mask = ((temp_logs['產線'] == line_name) & 
-                (temp_logs['datetime'].dt.strftime("%Y-%m-%d") == today_str) & 
-                (temp_logs['班別'] == current_s) & 
-                (temp_logs['組別'] == current_g))
-        shift_data = temp_logs[mask]
-        pass_data = shift_data[shift_data['判定結果'] == 'PASS']
-        ng_data = shift_data[shift_data['判定結果'] == 'NG']
-        count_ng = len(ng_data)
-        total_std_pass = 0.0
-        pass_actual_sum = 0.0
-        if not pass_data.empty:
-            wo_std_map = st.session_state.work_orders_db.set_index("工單號碼")["準重"].to_dict()
-            mapped_stds = pass_data["工單號"].map(wo_std_map).fillna(0).astype(float)
-            total_std_pass = mapped_stds.sum()
-            pass_actual_sum = pd.to_numeric(pass_data['實測重'], errors='coerce').fillna(0).sum()
+    # [優化] 本班累計值直接讀取班別統計表
+    summary = get_shift_summary(line_name, current_s, current_g)
+    if summary["良品數"] or summary["NG數"]:
+        count_ng = summary["NG數"]
+        total_std_pass = summary["準重合計"]
+        pass_actual_sum = summary["實重合計"]
         total_ng_weight = count_ng * 10.0
         total_production_val = total_std_pass + total_ng_weight
         total_production_weight = int(round(total_production_val, 0))
@@ -360,11 +318,8 @@ def show_end_shift_dialog(line_name, current_s, current_g, all_line_statuses):
     with confirm_col:
         if st.button("🏁 確認結算並下班 (Confirm & Logout)", type="primary", width='stretch', disabled=logout_disabled):
             final_p = st.session_state[key_weight]
-            new_log = pd.DataFrame([[
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 
-                line_name, "SHIFT_END", "PARTICLE", final_p, "PARTICLE", "", current_g, current_s, ""
-            ]], columns=config.LOG_COLUMNS)
-            st.session_state.production_logs = pd.concat([st.session_state.production_logs, new_log], ignore_index=True)
+            # [優化] 粒子重量與秤重紀錄相同，直接寫入單筆（同時累加班別統計的粒子重）
+            record_piece(line_name, "SHIFT_END", "PARTICLE", final_p, "PARTICLE", shift=current_s, group=current_g)
             save_data()
             
             all_line_statuses[line_name] = {"active": False, "shift": current_s, "group": current_g} 
@@ -1025,111 +980,18 @@ def show_start_shift_dialog(line_name, all_line_statuses):
         
         # [當機恢復優化] 優先恢復之前保存的工單選擇，如果沒有則選擇第一個未完成的工單
         try:
-            # 找到該產線未完成的工單（狀態為"待生產"或"生產中"）
-            mask = (st.session_state.work_orders_db["狀態"].isin(["待生產", "生產中"])) & (st.session_state.work_orders_db["產線"] == line_name)
-            pending = st.session_state.work_orders_db[mask].sort_values(by="排程順序")
+            # 該產線未完成的工單（狀態為"待生產"或"生產中"），與現場頁面共用同一份工單佇列
+            view = get_queue_view(line_name)
+            wo_label = None
             
-            if not pending.empty:
+            if view is not None:
                 # [當機恢復] 嘗試恢復之前保存的工單選擇
                 saved_wo_label = dm.load_current_work_order(line_name)
-                target_pending = None
-                wo_label = None
-                
-                if saved_wo_label:
-                    # 如果有保存的工單，嘗試在待完成工單中找到匹配的
-                    if not st.session_state.products_db.empty:
-                        queue_view = pending.merge(st.session_state.products_db, on="產品ID", how="left")
-                    else:
-                        queue_view = pending.copy()
-                    queue_view["temp_sort"] = range(1, len(queue_view) + 1)
-                    
-                    # 生成選單顯示文字來匹配
-                    def make_label(row):
-                        if "客戶名" in row and pd.notna(row["客戶名"]):
-                            spec = f"{dm.format_size(row['長'])}x{dm.format_size(row['寬'])}x{dm.format_size(row['高'])}"
-                            density_str = ""
-                            product_id = row.get("產品ID", "")
-                            if product_id and not st.session_state.products_db.empty:
-                                product_match = st.session_state.products_db[st.session_state.products_db["產品ID"] == product_id]
-                                if not product_match.empty and "密度" in product_match.columns:
-                                    density_val = product_match.iloc[0]["密度"]
-                                    if pd.notna(density_val) and str(density_val).strip() != "":
-                                        try:
-                                            density_str = f"{float(density_val):.1f} | "
-                                        except (ValueError, TypeError):
-                                            density_str = f"{density_val} | "
-                            return f"#{row['temp_sort']} {row['客戶名']} | {row['溫度等級']} | {row['品種_x']} | {density_str}{spec} | {float(row['準重_x']):.3f}kg (數:{int(row['預計數量'])})"
-                        else:
-                            return f"#{row['temp_sort']} {str(row['顯示內容'])} (數:{int(row['預計數量'])})"
-                    
-                    queue_view["選單顯示"] = queue_view.apply(make_label, axis=1)
-                    matched = queue_view[queue_view["選單顯示"] == saved_wo_label]
-                    if not matched.empty:
-                        target_pending = matched.iloc[0]
-                        wo_label = saved_wo_label
-                
-                # 如果沒有找到匹配的保存工單，優先選擇"生產中"的工單，接續上一班的生產
-                if target_pending is None:
-                    # [交接班優化] 優先選擇狀態為"生產中"的工單
-                    producing = pending[pending["狀態"] == "生產中"]
-                    if not producing.empty:
-                        # 如果有生產中的工單，選擇第一個（按排程順序）
-                        target_pending = producing.iloc[0]
-                    else:
-                        # 如果沒有生產中的工單，才選擇第一個待生產的工單
-                        target_pending = pending.iloc[0]
-                    
-                    # 生成選單顯示文字（使用與 render_active_line 相同的邏輯，確保序號正確）
-                    if not st.session_state.products_db.empty:
-                        queue_view_temp = pending.merge(st.session_state.products_db, on="產品ID", how="left")
-                    else:
-                        queue_view_temp = pending.copy()
-                    queue_view_temp["temp_sort"] = range(1, len(queue_view_temp) + 1)
-                    
-                    # 找到目標工單在排序後的位置
-                    target_matched = queue_view_temp[queue_view_temp["工單號碼"] == target_pending["工單號碼"]]
-                    if not target_matched.empty:
-                        target_row = target_matched.iloc[0]
-                        # 生成選單顯示文字（使用與 render_active_line 相同的邏輯）
-                        def make_label(row):
-                            if "客戶名" in row and pd.notna(row["客戶名"]):
-                                spec = f"{dm.format_size(row['長'])}x{dm.format_size(row['寬'])}x{dm.format_size(row['高'])}"
-                                density_str = ""
-                                product_id = row.get("產品ID", "")
-                                if product_id and not st.session_state.products_db.empty:
-                                    product_match = st.session_state.products_db[st.session_state.products_db["產品ID"] == product_id]
-                                    if not product_match.empty and "密度" in product_match.columns:
-                                        density_val = product_match.iloc[0]["密度"]
-                                        if pd.notna(density_val) and str(density_val).strip() != "":
-                                            try:
-                                                density_str = f"{float(density_val):.1f} | "
-                                            except (ValueError, TypeError):
-                                                density_str = f"{density_val} | "
-                                return f"#{row['temp_sort']} {row['客戶名']} | {row['溫度等級']} | {row['品種_x']} | {density_str}{spec} | {float(row['準重_x']):.3f}kg (數:{int(row['預計數量'])})"
-                            else:
-                                return f"#{row['temp_sort']} {str(row['顯示內容'])} (數:{int(row['預計數量'])})"
-                        
-                        wo_label = make_label(target_row)
-                    else:
-                        # 如果找不到，使用簡單格式（但這不應該發生）
-                        if not st.session_state.products_db.empty:
-                            product_match = st.session_state.products_db[st.session_state.products_db["產品ID"] == target_pending["產品ID"]]
-                            if not product_match.empty:
-                                product_row = product_match.iloc[0]
-                                spec = f"{dm.format_size(product_row['長'])}x{dm.format_size(product_row['寬'])}x{dm.format_size(product_row['高'])}"
-                                density_str = ""
-                                density_val = product_row.get("密度", "")
-                                if pd.notna(density_val) and str(density_val).strip() != "":
-                                    try:
-                                        density_str = f"{float(density_val):.1f} | "
-                                    except (ValueError, TypeError):
-                                        density_str = f"{density_val} | "
-                                wo_weight = float(target_pending.get('準重', product_row.get('準重', 0)))
-                                wo_label = f"#1 {product_row['客戶名']} | {product_row['溫度等級']} | {product_row['品種']} | {density_str}{spec} | {wo_weight:.3f}kg (數:{int(target_pending['預計數量'])})"
-                            else:
-                                wo_label = f"#1 {str(target_pending['顯示內容'])} (數:{int(target_pending['預計數量'])})"
-                        else:
-                            wo_label = f"#1 {str(target_pending['顯示內容'])} (數:{int(target_pending['預計數量'])})"
+                if saved_wo_label and saved_wo_label in view.labels:
+                    wo_label = saved_wo_label
+                else:
+                    # [交接班優化] 優先選擇狀態為"生產中"的工單，接續上一班的生產；沒有時選擇第一個待生產的工單
+                    wo_label = view.labels[view.current_index]
                 
                 # 設置工單選擇
                 if wo_label:
@@ -7,7 +7,11 @@ import streamlit as st
 from datetime import datetime
 import config
 import data_manager as dm
-from data_loader import load_data, save_data
+import db_pool
+from data_loader import (
+    get_product_catalog, get_write_journal, load_data, save_data, snapshot_work_orders,
+)
+from queue_view import get_queue_view_stats
 from ui_styles import load_styles
 from pages.admin import render_admin_page
 from pages.production import render_production_page
@@ -71,13 +75,17 @@ if config.IS_STANDALONE_MODE:
                 # 重新載入 db_schema 模組以更新資料庫路徑
                 import db_schema
                 importlib.reload(db_schema)
+                # 持久連線可能仍指向本機資料庫，下次取用時重新檢查
+                db_pool.invalidate()
                 # 清除 session_state 中的資料，強制重新載入
                 if 'products_db' in st.session_state:
                     del st.session_state.products_db
                 if 'work_orders_db' in st.session_state:
                     del st.session_state.work_orders_db
+                st.session_state.pop('work_orders_snapshot', None)
                 if 'production_logs' in st.session_state:
                     del st.session_state.production_logs
+                st.session_state.pop('production_logs_tail', None)
                 # 如果連線成功，重新載入頁面
                 st.rerun()
                 
@@ -138,18 +146,52 @@ with st.sidebar:
     selected_station = st.selectbox("📍 鎖定本機工作站", station_options, key="locked_station")
     st.info(f"目前顯示：{selected_station}")
 
+    # 系統狀態（持久連線等效能統計）
+    with st.expander("🔧 系統狀態", expanded=False):
+        db_stats = db_pool.get_stats()
+        if db_stats:
+            st.caption(
+                f"資料庫連線：實際連線 {db_stats['connects']} 次 / 取用 {db_stats['leases']} 次，"
+                f"重用 {db_stats['reused']} 次（平均連線 {db_stats['avg_connect_ms']:.0f} ms，"
+                f"約省下 {db_stats['saved_seconds']:.1f} 秒）"
+            )
+        else:
+            st.caption("資料庫連線：尚未使用持久連線")
+        catalog_stats = get_product_catalog().get_stats()
+        st.caption(
+            f"產品目錄：{catalog_stats['rows']} 筆（版本 {catalog_stats['version']}），"
+            f"快取命中 {catalog_stats['hits']} 次 / 重新載入 {catalog_stats['misses']} 次"
+            f"（命中率 {catalog_stats['hit_rate']:.0%}）"
+        )
+        queue_stats = get_queue_view_stats()
+        if queue_stats:
+            st.caption(
+                f"工單佇列：快取命中 {queue_stats['hits']} 次 / 重新建立 {queue_stats['misses']} 次"
+                f"（命中率 {queue_stats['hit_rate']:.0%}）"
+            )
+        journal = get_write_journal()
+        if journal is not None:
+            backlog = journal.backlog()
+            if backlog["depth"]:
+                st.caption(f"本機日誌：待同步 {backlog['depth']} 筆（最舊 {backlog['oldest_age']:.0f} 秒）")
+            else:
+                st.caption(f"本機日誌：已全部同步（累計 {backlog['synced_total']} 筆）")
+            if backlog["last_error"]:
+                st.warning(f"⚠️ 同步失敗，稍後自動重試：{backlog['last_error']}")
+
 # 根據頁面決定如何載入資料（優化：管理頁面不重新載入工單資料，避免輸入時頻繁刷新）
 if menu == "後台：系統管理中心":
     # 管理頁面：只在首次載入時載入工單資料，避免輸入時頻繁刷新
     # [關鍵修正] 產品資料也改為只在首次載入時載入，避免覆蓋正在編輯的資料
-    from data_loader import get_connection
+    from data_loader import get_connection, get_products, load_log_window
     from db_schema import init_database
+    from product_catalog import PRODUCT_COLUMNS
     import pandas as pd
     
     # [關鍵修正] 添加錯誤處理，避免連線失敗導致應用程式崩潰
     try:
         init_database()
-        conn = get_connection()
+        conn = get_connection(readonly=True)
     except Exception as e:
         st.error(f"⚠️ **無法連接到資料庫：{str(e)}**")
         st.info("""
@@ -167,32 +209,13 @@ if menu == "後台：系統管理中心":
     
     # [關鍵修正] 只在 products_db 不存在時才載入，避免覆蓋正在編輯的資料
     # 這樣可以確保新增產品後，資料不會被重新載入覆蓋
+    # [優化] 使用程序共用的產品目錄（與現場頁面共用同一份）
     if 'products_db' not in st.session_state:
         try:
-            query = "SELECT 產品ID, 客戶名, 溫度等級, 品種, 密度, 長, 寬, 高, 下限, 準重, 上限, 備註1, 備註2, 備註3 FROM products"
-            st.session_state.products_db = pd.read_sql_query(query, conn)
-            
-            # 清理備註欄位中的 HTML 標籤
-            import re
-            def clean_note_field(val):
-                if pd.isna(val) or str(val).lower() == 'none':
-                    return ""
-                val_str = str(val)
-                # 先移除所有 HTML 標籤（包括 </div>、<div> 等）
-                val_str = re.sub(r'<[^>]+>', '', val_str)
-                # 移除所有殘留的 < 和 > 字符（處理不完整的標籤）
-                val_str = val_str.replace('<', '').replace('>', '')
-                return val_str.strip()
-            
-            for note_col in ['備註1', '備註2', '備註3']:
-                if note_col in st.session_state.products_db.columns:
-                    st.session_state.products_db[note_col] = st.session_state.products_db[note_col].apply(clean_note_field)
+            get_products()
         except Exception as e:
             print(f"載入產品資料時發生錯誤: {e}")
-            st.session_state.products_db = pd.DataFrame(columns=[
-                "產品ID", "客戶名", "溫度等級", "品種", "密度", "長", "寬", "高", 
-                "下限", "準重", "上限", "備註1", "備註2", "備註3"
-            ])
+            st.session_state.products_db = pd.DataFrame(columns=PRODUCT_COLUMNS)
     
     # 工單資料：只在首次載入時載入，避免輸入時頻繁刷新
     if 'work_orders_db' not in st.session_state:
@@ -211,34 +234,14 @@ if menu == "後台：系統管理中心":
                     ).fillna(0).astype(int)
             # 正規化排序
             st.session_state.work_orders_db = dm.normalize_sequences(st.session_state.work_orders_db)
+            snapshot_work_orders()
         except Exception as e:
             print(f"載入工單資料時發生錯誤: {e}")
             st.session_state.work_orders_db = pd.DataFrame(columns=config.ORDER_COLUMNS)
+            st.session_state.pop('work_orders_snapshot', None)
     
-    # 載入生產紀錄（只在首次載入時）
-    if 'production_logs' not in st.session_state:
-        try:
-            query = f"SELECT {', '.join(config.LOG_COLUMNS)} FROM production_logs ORDER BY 時間 DESC"
-            st.session_state.production_logs = pd.read_sql_query(query, conn)
-        except Exception as e:
-            print(f"載入生產紀錄時發生錯誤: {e}")
-            st.session_state.production_logs = pd.DataFrame(columns=config.LOG_COLUMNS)
-        
-        # 確保所有必要欄位存在並設定預設值
-        for col in config.LOG_COLUMNS:
-            if col not in st.session_state.production_logs.columns: 
-                if col == "組別": 
-                    st.session_state.production_logs[col] = "A"
-                elif col == "班別": 
-                    st.session_state.production_logs[col] = ""
-                elif col == "操作員": 
-                    st.session_state.production_logs[col] = ""
-                else: 
-                    st.session_state.production_logs[col] = ""
-    
-    # 初始化已保存的記錄計數器（用於增量更新）
-    if 'production_logs_saved_count' not in st.session_state:
-        st.session_state['production_logs_saved_count'] = len(st.session_state.production_logs) if not st.session_state.production_logs.empty else 0
+    # 載入生產紀錄（只載入最近的工作範圍，見 data_loader.load_log_window）
+    load_log_window(conn)
     
     try:
         conn.close()
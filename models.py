@@ -0,0 +1,195 @@
+"""
+資料模型（產品、工單、生產紀錄）
+現場頁面的熱路徑（每筆秤重、每次刷新）以這些輕量物件取代單列 pandas Series / 單列 DataFrame
+
+- Product / WorkOrder / LogEntry：使用 __slots__ 的 dataclass，屬性為英文名稱，COLUMNS 為對應的資料欄位
+  （__slots__ 直接寫在類別中而非 dataclass(slots=True)，以支援 Python 3.8/3.9；因此屬性不可有預設值）
+- 屬性型別依資料表欄位標註；由 DataFrame 建立時數值可能為 numpy 型別，缺值為 None 或 NaN
+- ProductBatch / WorkOrderBatch / LogBatch：以欄為單位保存多筆資料（每欄一個 list），
+  與 DataFrame 互轉只需逐欄複製（報表、session 中的 DataFrame）
+"""
+
+from dataclasses import dataclass, fields
+from typing import ClassVar, Optional, Union
+
+import pandas as pd
+
+import config
+
+# 密度欄位為 INTEGER，但舊資料可能存有 "N/A" 等文字
+Density = Optional[Union[float, str]]
+
+PRODUCT_COLUMNS = [
+    "產品ID", "客戶名", "溫度等級", "品種", "密度", "長", "寬", "高",
+    "下限", "準重", "上限", "備註1", "備註2", "備註3"
+]
+
+
+class _Record:
+    """資料列共用方法（子類別為宣告 __slots__ 的 dataclass，屬性依序對應 COLUMNS）"""
+
+    __slots__ = ()
+    COLUMNS: ClassVar[tuple] = ()
+    FIELDS: ClassVar[tuple] = ()
+
+    @classmethod
+    def from_row(cls, row):
+        """由 dict 或 pandas Series 建立（缺少的欄位為 None）"""
+        return cls(*(row.get(col) for col in cls.COLUMNS))
+
+    def to_dict(self):
+        """轉為 {資料欄位: 值}"""
+        return {col: getattr(self, name) for col, name in zip(self.COLUMNS, self.FIELDS)}
+
+
+def _bind_columns(cls, columns):
+    """設定 COLUMNS / FIELDS（欄位數須與 dataclass 屬性數一致，__slots__ 須與屬性相同）"""
+    cls.FIELDS = tuple(f.name for f in fields(cls))
+    # 不使用 assert：python -O 執行時仍必須檢查
+    if cls.__slots__ != cls.FIELDS:
+        raise TypeError(f"{cls.__name__} 的 __slots__ 與屬性不一致")
+    cls.COLUMNS = tuple(columns)
+    if len(cls.FIELDS) != len(cls.COLUMNS):
+        raise ValueError(f"{cls.__name__} 欄位數不一致：屬性 {len(cls.FIELDS)} 個，資料欄位 {len(cls.COLUMNS)} 個")
+    return cls
+
+
+@dataclass
+class Product(_Record):
+    __slots__ = ("product_id", "customer", "temp_grade", "variety", "density", "length", "width", "height",
+                 "low", "std", "high", "note1", "note2", "note3")
+
+    product_id: str
+    customer: Optional[str]
+    temp_grade: Optional[str]
+    variety: Optional[str]
+    density: Density
+    length: Optional[float]
+    width: Optional[float]
+    height: Optional[float]
+    low: Optional[float]
+    std: Optional[float]
+    high: Optional[float]
+    note1: Optional[str]
+    note2: Optional[str]
+    note3: Optional[str]
+
+    @property
+    def notes(self):
+        return (self.note1, self.note2, self.note3)
+
+
+@dataclass
+class WorkOrder(_Record):
+    __slots__ = ("line", "sequence", "wo_id", "product_id", "display", "variety", "density", "std",
+                 "planned_qty", "done_qty", "status", "created_at", "spec_text")
+
+    line: str
+    sequence: int
+    wo_id: str
+    product_id: Optional[str]
+    display: Optional[str]
+    variety: Optional[str]
+    density: Density
+    std: Optional[float]
+    planned_qty: int
+    done_qty: int
+    status: Optional[str]
+    created_at: Optional[str]
+    spec_text: Optional[str]
+
+    @property
+    def remaining(self):
+        """剩餘數量（預計數量 - 已完成數量）"""
+        return int(self.planned_qty or 0) - int(self.done_qty or 0)
+
+
+@dataclass
+class LogEntry(_Record):
+    __slots__ = ("time", "line", "wo_id", "product_id", "weight", "result", "ng_reason", "group", "shift",
+                 "operator", "event_id", "id")
+
+    time: str
+    line: Optional[str]
+    wo_id: Optional[str]
+    product_id: Optional[str]
+    weight: Optional[float]
+    result: Optional[str]
+    ng_reason: Optional[str]
+    group: Optional[str]
+    shift: Optional[str]
+    operator: Optional[str]
+    event_id: Optional[str]
+    id: Optional[int]
+
+    def to_log(self):
+        """寫入資料庫 / 本機日誌用的 dict（config.LOG_COLUMNS + event_id，不含 id）"""
+        log = self.to_dict()
+        del log["id"]
+        return log
+
+
+_bind_columns(Product, PRODUCT_COLUMNS)
+_bind_columns(WorkOrder, config.ORDER_COLUMNS)
+_bind_columns(LogEntry, config.LOG_COLUMNS + ["event_id", "id"])
+
+
+class _Batch:
+    """
+    以欄為單位保存多筆資料列（每個屬性一個 list）
+
+    append() 只是各欄 list.append，不會像 pd.concat 一樣複製既有資料；
+    需要 DataFrame 時再以 to_frame() 一次轉換
+    """
+
+    record_type = None
+
+    def __init__(self):
+        self.columns = {name: [] for name in self.record_type.FIELDS}
+
+    def __len__(self):
+        return len(self.columns[self.record_type.FIELDS[0]])
+
+    def __iter__(self):
+        record_type = self.record_type
+        for values in zip(*self.columns.values()):
+            yield record_type(*values)
+
+    def append(self, record):
+        for name, values in self.columns.items():
+            values.append(getattr(record, name))
+
+    def clear(self):
+        for values in self.columns.values():
+            values.clear()
+
+    @classmethod
+    def from_frame(cls, df):
+        """由 DataFrame 建立（依 COLUMNS 取欄，缺少的欄位為 None）"""
+        batch = cls()
+        for name, col in zip(cls.record_type.FIELDS, cls.record_type.COLUMNS):
+            batch.columns[name] = df[col].tolist() if col in df.columns else [None] * len(df)
+        return batch
+
+    def to_frame(self, columns=None):
+        """
+        轉為 DataFrame（欄名為資料欄位）
+
+        參數:
+            columns: 只輸出指定的資料欄位（None 表示全部）
+        """
+        names = dict(zip(self.record_type.COLUMNS, self.record_type.FIELDS))
+        columns = list(columns or self.record_type.COLUMNS)
+        return pd.DataFrame({col: self.columns[names[col]] for col in columns}, columns=columns)
+
+
+class ProductBatch(_Batch):
+    record_type = Product
+
+
+class WorkOrderBatch(_Batch):
+    record_type = WorkOrder
+
+
+class LogBatch(_Batch):
+    record_type = LogEntry
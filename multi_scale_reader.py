@@ -0,0 +1,229 @@
+"""
+多磅秤 asyncio 讀取服務
+在單一背景執行緒的 event loop 中同時讀取多個磅秤來源（串口 / pty / TCP），
+發布每條產線的最新讀數，讓主管站的「總覽模式」也能顯示各產線即時重量，
+不需要每個串口各佔一個阻塞執行緒
+
+來源格式（config.SCALE_SOURCES）：
+- "COM5"、"/dev/ttyUSB0"、"/dev/pts/3" ：串口或 pty
+- "tcp://172.16.3.160:4001"          ：串口轉網路（serial server）
+
+串口讀取優先使用 pyserial-asyncio（選用套件）；未安裝時在 Linux 以 loop.add_reader
+監聽檔案描述符，其他平台退回 executor 讀取
+"""
+
+import asyncio
+import sys
+import threading
+import time
+
+import serial
+
+from scale_protocols import get_protocol
+from scale_reader import ScaleReading
+from stability import StabilityDetector, settings_for_line
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+
+class _LineChannel:
+    """單一產線的讀取狀態（最新讀數、連線狀態、穩定判斷）"""
+
+    def __init__(self, line_name, source, protocol):
+        self.line_name = line_name
+        self.source = source
+        self.parser = get_protocol(protocol)
+        self.framer = self.parser.framer()
+        self.detector = StabilityDetector(**settings_for_line(line_name))
+        self.status = "連線中"
+        self.latest = None  # ScaleReading；整體替換，讀取端不需加鎖
+        self.frames_total = 0
+
+    def feed(self, chunk):
+        for raw in self.framer.feed(chunk):
+            frame = self.parser.parse(raw)
+            if frame is None:
+                continue
+            ts = time.monotonic()
+            self.detector.add(ts, frame.weight)
+            self.latest = ScaleReading(
+                ts, frame.weight, raw.decode('ascii', errors='replace').strip(),
+                frame.unit, frame.stable, frame.net,
+            )
+            self.frames_total += 1
+
+    def reset(self):
+        self.framer.clear()
+        self.detector.reset()
+
+
+class MultiScaleReader:
+    """
+    多磅秤讀取服務
+
+    參數:
+        sources: {產線名稱: 來源}，例如 {"Line 1": "COM5", "Line 2": "tcp://10.0.0.5:4001"}
+        protocol: 磅秤協定名稱（所有來源共用）
+        baudrate: 串口傳輸速率
+        reconnect_delay: 連線失敗後重試間隔（秒）
+    """
+
+    def __init__(self, sources, protocol="generic", baudrate=9600, reconnect_delay=2.0):
+        self._channels = {line: _LineChannel(line, src, protocol) for line, src in sources.items()}
+        self._baudrate = baudrate
+        self._reconnect_delay = reconnect_delay
+        self._loop = None
+        self._thread = None
+        self._stopping = False
+
+    @property
+    def lines(self):
+        return list(self._channels)
+
+    # ------------------------------------------
+    # 執行緒 / event loop 控制
+    # ------------------------------------------
+    def start(self):
+        """啟動背景 event loop（重複呼叫不會建立多個執行緒）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            for channel in self._channels.values():
+                self._loop.create_task(self._run_channel(channel))
+            ready.set()
+            try:
+                self._loop.run_forever()
+            finally:
+                self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="MultiScaleReader", daemon=True)
+        self._thread.start()
+        ready.wait(2.0)
+
+    def stop(self, timeout=3.0):
+        """停止所有讀取"""
+        self._stopping = True
+        if self._loop is not None and self._loop.is_running():
+            def shutdown():
+                for task in asyncio.all_tasks(self._loop):
+                    task.cancel()
+                self._loop.call_soon(self._loop.stop)
+            self._loop.call_soon_threadsafe(shutdown)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # ------------------------------------------
+    # 查詢介面（非阻塞）
+    # ------------------------------------------
+    def latest(self, line_name):
+        """
+        取得產線的最新讀數
+
+        回傳:
+            (ScaleReading, age_seconds, status, StabilityState)；
+            產線未設定來源時回傳 (None, None, "未設定磅秤來源", None)
+        """
+        channel = self._channels.get(line_name)
+        if channel is None:
+            return None, None, "未設定磅秤來源", None
+        reading = channel.latest
+        age = None if reading is None else time.monotonic() - reading.timestamp
+        return reading, age, channel.status, channel.detector.state
+
+    def snapshot(self):
+        """所有產線的最新讀數 {產線: (ScaleReading, age, status)}"""
+        return {line: self.latest(line)[:3] for line in self._channels}
+
+    # ------------------------------------------
+    # 讀取協程
+    # ------------------------------------------
+    async def _run_channel(self, channel):
+        while not self._stopping:
+            try:
+                channel.reset()
+                async for chunk in self._open_chunks(channel.source):
+                    if channel.status != "正常連線":
+                        channel.status = "正常連線"
+                    channel.feed(chunk)
+                channel.status = "連線中斷: 來源已關閉"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not channel.status.startswith("連線失敗"):
+                    print(f"⚠️ {channel.line_name} 磅秤讀取錯誤，將重新連線：{e}")
+                channel.status = f"連線失敗: {e}"
+            await asyncio.sleep(self._reconnect_delay)
+
+    async def _open_chunks(self, source):
+        """依來源類型產生收到的資料區塊"""
+        if source.startswith("tcp://"):
+            host, _, port = source[len("tcp://"):].rpartition(":")
+            reader, writer = await asyncio.open_connection(host, int(port))
+            try:
+                while True:
+                    data = await reader.read(4096)
+                    if not data:
+                        return
+                    yield data
+            finally:
+                writer.close()
+        elif serial_asyncio is not None:
+            reader, writer = await serial_asyncio.open_serial_connection(url=source, baudrate=self._baudrate)
+            try:
+                while True:
+                    data = await reader.read(4096)
+                    if not data:
+                        return
+                    yield data
+            finally:
+                writer.close()
+        elif sys.platform != "win32":
+            async for data in self._posix_serial_chunks(source):
+                yield data
+        else:
+            async for data in self._executor_serial_chunks(source):
+                yield data
+
+    async def _posix_serial_chunks(self, port):
+        """Linux / macOS：以 add_reader 監聽串口檔案描述符（不佔用執行緒）"""
+        loop = asyncio.get_running_loop()
+        ser = serial.Serial(port, self._baudrate, timeout=0)
+        readable = asyncio.Event()
+        fd = ser.fileno()
+        loop.add_reader(fd, readable.set)
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                data = ser.read(4096)
+                if data:
+                    yield data
+        finally:
+            loop.remove_reader(fd)
+            ser.close()
+
+    async def _executor_serial_chunks(self, port):
+        """Windows 且未安裝 pyserial-asyncio 時的備援：在 executor 中讀取"""
+        loop = asyncio.get_running_loop()
+        ser = serial.Serial(port, self._baudrate, timeout=0.1)
+        try:
+            while True:
+                data = await loop.run_in_executor(None, ser.read, 4096)
+                if data:
+                    yield data
+        finally:
+            ser.close()
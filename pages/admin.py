@@ -16,7 +16,7 @@ import sqlite3
 
 import config
 import data_manager as dm
-from data_loader import save_data, upsert_products, delete_products, reload_products
+from data_loader import save_data, upsert_products, delete_products, reload_products, get_logs_between, get_log_months
 from db_schema import get_connection
 from dialogs import show_delete_work_orders_confirm
 
@@ -128,7 +128,7 @@ def render_product_management():
                                             if candidate_id not in st.session_state.products_db['產品ID'].values:
                                                 # 再檢查資料庫中是否已存在（查詢資料庫）
                                                 try:
-                                                    check_conn = get_connection()
+                                                    check_conn = get_connection(readonly=True)
                                                     check_cursor = check_conn.cursor()
                                                     check_cursor.execute("SELECT COUNT(*) FROM products WHERE 產品ID = ?", (candidate_id,))
                                                     exists_in_db = check_cursor.fetchone()[0] > 0
@@ -1523,22 +1523,28 @@ def render_reports():
     """生產報表中心"""
     st.markdown('<div class="section-header header-admin">📊 每日生產統計報表</div>', unsafe_allow_html=True)
     
-    logs = st.session_state.production_logs.copy(); final_cols = ['Line.', '日期', '班別', '組別', '溫度等級', '品種', '密度', '長度', '寬度', '厚度', '數量', '標準重量', '總計']
-    if logs.empty: 
+    # [優化] 年月清單與當月紀錄直接以 ts_epoch 索引向資料庫查詢，不再解析全部紀錄的時間字串
+    log_months = get_log_months(); final_cols = ['Line.', '日期', '班別', '組別', '溫度等級', '品種', '密度', '長度', '寬度', '厚度', '數量', '標準重量', '總計']
+    if not log_months: 
         st.warning("⚠️ 無紀錄。"); current_year = datetime.now().year; years = [current_year]
     else:
-        logs['datetime'] = logs['時間'].apply(dm.parse_log_time); logs['Year'] = logs['datetime'].dt.year; logs['Month'] = logs['datetime'].dt.month; years = sorted(logs['Year'].unique(), reverse=True)
+        years = sorted({year for year, _ in log_months}, reverse=True)
+    
+    def month_options(year):
+        return [month for y, month in log_months if y == year] or list(range(1, 13))
+    
+    def month_logs(year, month):
+        start = datetime(year, month, 1)
+        end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+        return get_logs_between(start, end)
     
     col_d1, col_d2 = st.columns(2)
     with col_d1:
         sel_year = st.selectbox("請選擇年份", years, key="rpt_year")
     with col_d2:
-        if not logs.empty: months = sorted(logs[logs['Year'] == sel_year]['Month'].unique(), reverse=True)
-        else: months = range(1, 13)
-        sel_month = st.selectbox("請選擇月份", months, key="rpt_month")
+        sel_month = st.selectbox("請選擇月份", month_options(sel_year), key="rpt_month")
         
-    if not logs.empty: filtered_logs = logs[(logs['Year'] == sel_year) & (logs['Month'] == sel_month)].copy()
-    else: filtered_logs = pd.DataFrame()
+    filtered_logs = month_logs(sel_year, sel_month) if log_months else pd.DataFrame()
     
     buffer_daily = io.BytesIO()
     has_data_daily = False
@@ -1548,26 +1554,8 @@ def render_reports():
         # 先確定班別
         filtered_logs['班別'] = filtered_logs.apply(lambda r: r['班別'] if pd.notna(r['班別']) and str(r['班別']).strip()!="" else dm.get_shift_info_backup(r['datetime']), axis=1)
         
-        # 根據班別和時間判斷日期（考慮晚班跨日，與 LOT 編號邏輯一致）
-        from datetime import timedelta
-        def adjust_date_for_shift(row):
-            """根據班別和時間調整日期，晚班在 00:00-07:59 使用前一天日期"""
-            dt = row['datetime']
-            shift = row['班別']
-            
-            # 如果是晚班且在 00:00-07:59，日期減一天
-            if shift == "晚班":
-                hour = dt.hour
-                minute = dt.minute
-                # 晚班在 00:00-07:59 時段，使用前一天日期（與 LOT 編號邏輯一致）
-                if (hour == 0) or (hour >= 1 and hour < 8) or (hour == 7 and minute < 55):
-                    adjusted_date = dt - timedelta(days=1)
-                    return adjusted_date.strftime("%d")
-            
-            # 其他情況（早班、中班，或晚班在 23:55-23:59）使用原始日期
-            return dt.strftime("%d")
-        
-        filtered_logs['日期'] = filtered_logs.apply(adjust_date_for_shift, axis=1)
+        # 日期使用寫入時計算的班別日期（晚班 00:00-07:59 屬於前一天，與 LOT 編號邏輯一致）
+        filtered_logs['日期'] = filtered_logs['shift_date'].str[8:10]
         
         if '組別' not in filtered_logs.columns: filtered_logs['組別'] = 'A'
         # 只處理 PASS 和 NG 記錄，排除 PARTICLE 記錄（PARTICLE 只用於實重準重報表）
@@ -1645,21 +1633,18 @@ def render_reports():
     with col_w1:
         sel_year_weight = st.selectbox("請選擇年份", years, key="weight_rpt_year")
     with col_w2:
-        if not logs.empty: months_weight = sorted(logs[logs['Year'] == sel_year_weight]['Month'].unique(), reverse=True)
-        else: months_weight = range(1, 13)
-        sel_month_weight = st.selectbox("請選擇月份", months_weight, key="weight_rpt_month")
+        sel_month_weight = st.selectbox("請選擇月份", month_options(sel_year_weight), key="weight_rpt_month")
 
     buffer_weight = io.BytesIO()
     has_data_weight = False
     
-    if not logs.empty:
-        w_logs = logs[(logs['Year'] == sel_year_weight) & (logs['Month'] == sel_month_weight)].copy()
+    if log_months:
+        w_logs = month_logs(sel_year_weight, sel_month_weight)
         
         if not w_logs.empty and not st.session_state.products_db.empty:
             w_merged = pd.merge(w_logs, st.session_state.products_db, on="產品ID", how="left")
-            w_merged['datetime_obj'] = pd.to_datetime(w_merged['時間'], errors='coerce')
-            w_merged['日期'] = w_merged['datetime_obj'].dt.strftime("%d")
-            w_merged['班別'] = w_merged.apply(lambda r: r['班別'] if pd.notna(r['班別']) and str(r['班別']).strip()!="" else dm.get_shift_info_backup(r['datetime_obj']), axis=1)
+            w_merged['日期'] = w_merged['datetime'].dt.strftime("%d")
+            w_merged['班別'] = w_merged.apply(lambda r: r['班別'] if pd.notna(r['班別']) and str(r['班別']).strip()!="" else dm.get_shift_info_backup(r['datetime']), axis=1)
             if '組別' not in w_merged.columns: w_merged['組別'] = 'A'
 
             pass_df = w_merged[w_merged['判定結果'] == 'PASS'].copy()
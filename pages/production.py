@@ -5,13 +5,13 @@
 
 import streamlit as st
 import pandas as pd
-from datetime import datetime
 import textwrap
 import time
 
 import config
 import data_manager as dm
-from data_loader import save_data
+from data_loader import get_product, get_session_logs, get_shift_summary, get_work_order, record_piece
+from queue_view import get_queue_view
 from dialogs import show_end_shift_dialog, show_start_shift_dialog, show_undo_confirm
 
 
@@ -67,6 +67,8 @@ def render_production_line(line_name, all_line_statuses, wo_std_map,
         st.session_state[f"stable_start_{line_name}"] = None
     if f"auto_held_val_{line_name}" not in st.session_state: 
         st.session_state[f"auto_held_val_{line_name}"] = None
+    if f"auto_record_{line_name}" not in st.session_state: 
+        st.session_state[f"auto_record_{line_name}"] = line_name in config.AUTO_RECORD_LINES
 
     if is_active:
         render_active_line(line_name, cur_s, cur_g, wo_std_map, 
@@ -109,38 +111,13 @@ def render_active_line(line_name, cur_s, cur_g, wo_std_map,
         show_end_shift_dialog(line_name, cur_s, cur_g, all_line_statuses)
     st.divider()
 
-    mask = (st.session_state.work_orders_db["狀態"].isin(["待生產", "生產中"])) & (st.session_state.work_orders_db["產線"] == line_name)
-    pending = st.session_state.work_orders_db[mask].sort_values(by="排程順序")
+    # [優化] 工單佇列（選單文字、工單列表、預設工單）依產線快取，該產線工單或產品目錄改變時才重新建立
+    view = get_queue_view(line_name)
     
-    if not pending.empty:
-        if not st.session_state.products_db.empty: 
-            p_db = st.session_state.products_db.copy()
-            queue_view = pending.merge(p_db, on="產品ID", how="left")
-        else: 
-            queue_view = pending.copy()
-        
-        queue_view["temp_sort"] = range(1, len(queue_view) + 1)
-        def make_label(row):
-            if "客戶名" in row and pd.notna(row["客戶名"]):
-                spec = f"{dm.format_size(row['長'])}x{dm.format_size(row['寬'])}x{dm.format_size(row['高'])}"
-                # 從 products_db 中取得密度值
-                density_str = ""
-                product_id = row.get("產品ID", "")
-                if product_id and not st.session_state.products_db.empty:
-                    product_match = st.session_state.products_db[st.session_state.products_db["產品ID"] == product_id]
-                    if not product_match.empty and "密度" in product_match.columns:
-                        density_val = product_match.iloc[0]["密度"]
-                        if pd.notna(density_val) and str(density_val).strip() != "":
-                            try:
-                                density_str = f"{float(density_val):.1f} | "
-                            except (ValueError, TypeError):
-                                density_str = f"{density_val} | "
-                return f"#{row['temp_sort']} {row['客戶名']} | {row['溫度等級']} | {row['品種_x']} | {density_str}{spec} | {float(row['準重_x']):.3f}kg (數:{int(row['預計數量'])})"
-            else: 
-                return f"#{row['temp_sort']} {str(row['顯示內容'])} (數:{int(row['預計數量'])})"
-        
-        queue_view["選單顯示"] = queue_view.apply(make_label, axis=1)
-        options_list = queue_view["選單顯示"].tolist()
+    if view is not None:
+        options_list = view.labels
+        # [交接班優化] 優先選擇"生產中"的工單
+        producing_label = options_list[view.producing_index] if view.producing_index is not None else None
         
         col_sel, col_finish_btn = st.columns([3, 1])
         with col_sel:
@@ -150,100 +127,28 @@ def render_active_line(line_name, cur_s, cur_g, wo_std_map,
             
             # [交接班優化] 如果保存的工單不在當前列表中，優先選擇"生產中"的工單
             if saved_wo_label and saved_wo_label not in options_list:
-                # 優先選擇"生產中"的工單
-                try:
-                    producing_mask = queue_view["狀態"] == "生產中"
-                    if producing_mask.any():
-                        producing_queue = queue_view[producing_mask]
-                        if not producing_queue.empty:
-                            producing_item = producing_queue.iloc[0]
-                            producing_label = queue_view[queue_view["工單號碼"] == producing_item["工單號碼"]]["選單顯示"].iloc[0]
-                            if producing_label in options_list:
-                                saved_wo_label = producing_label
-                                dm.save_current_work_order(line_name, producing_label)
-                            else:
-                                saved_wo_label = None
-                                dm.save_current_work_order(line_name, None)
-                        else:
-                            saved_wo_label = None
-                            dm.save_current_work_order(line_name, None)
-                    else:
-                        saved_wo_label = None
-                        dm.save_current_work_order(line_name, None)
-                except Exception as e:
-                    saved_wo_label = None
-                    dm.save_current_work_order(line_name, None)
+                saved_wo_label = producing_label
+                dm.save_current_work_order(line_name, producing_label)
             
             # 初始化 session_state（只在第一次或需要恢復時）
             if key_sel not in st.session_state:
                 if saved_wo_label and saved_wo_label in options_list:
                     st.session_state[key_sel] = saved_wo_label
-                elif options_list:
-                    # [交接班優化] 優先選擇"生產中"的工單
-                    try:
-                        producing_mask = queue_view["狀態"] == "生產中"
-                        if producing_mask.any():
-                            producing_queue = queue_view[producing_mask]
-                            if not producing_queue.empty:
-                                producing_item = producing_queue.iloc[0]
-                                producing_label = queue_view[queue_view["工單號碼"] == producing_item["工單號碼"]]["選單顯示"].iloc[0]
-                                if producing_label in options_list:
-                                    st.session_state[key_sel] = producing_label
-                                else:
-                                    st.session_state[key_sel] = options_list[0]
-                            else:
-                                st.session_state[key_sel] = options_list[0]
-                        else:
-                            st.session_state[key_sel] = options_list[0]
-                    except:
-                        st.session_state[key_sel] = options_list[0]
+                else:
+                    st.session_state[key_sel] = options_list[view.current_index]
             
             # 確保 session_state 中的值在選項列表中
-            if key_sel in st.session_state and st.session_state[key_sel] not in options_list:
-                if options_list:
-                    # [交接班優化] 優先選擇"生產中"的工單
-                    try:
-                        producing_mask = queue_view["狀態"] == "生產中"
-                        if producing_mask.any():
-                            producing_queue = queue_view[producing_mask]
-                            if not producing_queue.empty:
-                                producing_item = producing_queue.iloc[0]
-                                producing_label = queue_view[queue_view["工單號碼"] == producing_item["工單號碼"]]["選單顯示"].iloc[0]
-                                if producing_label in options_list:
-                                    st.session_state[key_sel] = producing_label
-                                else:
-                                    st.session_state[key_sel] = options_list[0]
-                            else:
-                                st.session_state[key_sel] = options_list[0]
-                        else:
-                            st.session_state[key_sel] = options_list[0]
-                    except:
-                        st.session_state[key_sel] = options_list[0]
-                else:
-                    st.session_state[key_sel] = None
+            if st.session_state[key_sel] not in options_list:
+                st.session_state[key_sel] = options_list[view.current_index]
             
             # 使用 selectbox，讓 Streamlit 自動管理狀態
-            if options_list:
-                wo_label = st.selectbox("👇 切換當前任務", options=options_list, key=key_sel)
-                
-                # [當機恢復] 當工單選擇改變時，立即保存到持久化存儲
-                if wo_label != saved_wo_label:
-                    dm.save_current_work_order(line_name, wo_label)
-            else:
-                wo_label = None
-                st.info("暫無待生產工單")
+            wo_label = st.selectbox("👇 切換當前任務", options=options_list, key=key_sel)
+            
+            # [當機恢復] 當工單選擇改變時，立即保存到持久化存儲
+            if wo_label != saved_wo_label:
+                dm.save_current_work_order(line_name, wo_label)
         
-        # 確保 wo_label 有效
-        if wo_label and not queue_view.empty:
-            curr_row_list = queue_view[queue_view["選單顯示"] == wo_label]
-            if not curr_row_list.empty: 
-                curr = curr_row_list.iloc[0]
-            else: 
-                curr = queue_view.iloc[0]
-        elif not queue_view.empty:
-            curr = queue_view.iloc[0]
-        else:
-            curr = None
+        curr = view.row_for(wo_label)
 
         if curr is not None:
             with col_finish_btn:
@@ -263,85 +168,12 @@ def render_active_line(line_name, cur_s, cur_g, wo_std_map,
 
             # 工單列表表格（智能刷新：有新數據時快速刷新，否則慢速刷新，與紀錄歷程同步）
             # 先定義內部函數，確保在調用前已定義
-            def render_queue_table_internal(q_view, current_item, line_n):
-                # 重新讀取最新的工單數據，確保進度是最新的
-                try:
-                    latest_pending = st.session_state.work_orders_db[
-                        (st.session_state.work_orders_db["狀態"].isin(["待生產", "生產中"])) & 
-                        (st.session_state.work_orders_db["產線"] == line_n)
-                    ].sort_values(by="排程順序")
-                    
-                    if not latest_pending.empty and not st.session_state.products_db.empty:
-                        latest_queue = latest_pending.merge(st.session_state.products_db, on="產品ID", how="left")
-                    else:
-                        latest_queue = latest_pending.copy() if not latest_pending.empty else q_view
-                    
-                    latest_queue["temp_sort"] = range(1, len(latest_queue) + 1)
-                except:
-                    latest_queue = q_view
-                
-                q_df = pd.DataFrame()
-                q_df["序"] = range(1, len(latest_queue) + 1)
-                if "客戶名" in latest_queue.columns:
-                    q_df["客戶"] = latest_queue["客戶名"]
-                    q_df["溫度"] = latest_queue["溫度等級"].astype(str)
-                    q_df["品種"] = latest_queue["品種_x"]
-                    # 從 products_db 中取得密度值
-                    def get_density(row):
-                        product_id = row.get("產品ID", "")
-                        if product_id and not st.session_state.products_db.empty:
-                            product_match = st.session_state.products_db[st.session_state.products_db["產品ID"] == product_id]
-                            if not product_match.empty and "密度" in product_match.columns:
-                                density_val = product_match.iloc[0]["密度"]
-                                if pd.notna(density_val) and str(density_val).strip() != "":
-                                    try:
-                                        return f"{float(density_val):.1f}"
-                                    except (ValueError, TypeError):
-                                        return str(density_val)
-                        return ""
-                    q_df["密度"] = latest_queue.apply(get_density, axis=1)
-                    q_df["規格"] = latest_queue.apply(lambda x: f"{dm.format_size(x['長'])}x{dm.format_size(x['寬'])}x{dm.format_size(x['高'])}", axis=1)
-                    if "下限" in latest_queue.columns: 
-                        q_df["下限"] = latest_queue["下限"].apply(lambda x: f"{float(x):.1f}" if pd.notna(x) else "")
-                    else: 
-                        q_df["下限"] = ""
-                    q_df["準重"] = latest_queue["準重_x"].apply(dm.safe_format_weight)
-                    if "上限" in latest_queue.columns: 
-                        q_df["上限"] = latest_queue["上限"].apply(lambda x: f"{float(x):.1f}" if pd.notna(x) else "")
-                    else: 
-                        q_df["上限"] = ""
-                    for note_col in ['備註1', '備註2', '備註3']:
-                        if note_col in latest_queue.columns: 
-                            q_df[note_col] = latest_queue[note_col].apply(lambda x: str(x) if pd.notna(x) and str(x).lower() != 'none' else "")
-                        else: 
-                            q_df[note_col] = ""
-                    # [關鍵] 使用最新的已完成數量計算進度
-                    q_df["進度"] = latest_queue.apply(lambda x: f"{int(x['已完成數量'])} / {int(x['預計數量'])}", axis=1)
-                else: 
-                    q_df["內容"] = latest_queue["詳細規格字串"]
-                    q_df["進度"] = latest_queue.apply(lambda x: f"{int(x['已完成數量'])} / {int(x['預計數量'])}", axis=1)
-
-                if "內容" in q_df.columns: 
-                    cols = ["序", "內容", "進度"]
-                else: 
-                    cols = ["序", "客戶", "溫度", "品種", "密度", "規格", "下限", "準重", "上限", "備註1", "備註2", "備註3", "進度"]
-                
-                html_q = '<div class="table-scroll-container"><table class="styled-table"><thead><tr>'
-                for c in cols: 
-                    html_q += f'<th>{c}</th>'
-                html_q += '</tr></thead><tbody>'
-                for _, row in q_df.iterrows():
-                    is_active = (row["序"] == current_item["temp_sort"])
-                    row_style = 'style="background-color: #d6eaf8; border-left: 5px solid #3498db;"' if is_active else ''
-                    html_q += f'<tr {row_style}>'
-                    for c in cols:
-                        val = row.get(c, "")
-                        val_display = f"<strong>{val}</strong>" if is_active else f"{val}"
-                        td_style = "style='max-width: 120px; white-space: normal; word-wrap: break-word; word-break: break-all; color: #d35400;'" if c in ["備註1", "備註2", "備註3"] else ""
-                        html_q += f'<td {td_style}>{val_display}</td>'
-                    html_q += '</tr>'
-                html_q += '</tbody></table></div>'
-                st.markdown(html_q, unsafe_allow_html=True)
+            def render_queue_table_internal(current_item, line_n):
+                # 取得最新的工單佇列（工單或產品目錄未改變時直接沿用快取，進度隨完成數量更新）
+                latest_view = get_queue_view(line_n)
+                if latest_view is None:
+                    return
+                st.markdown(latest_view.table_html(current_item["temp_sort"]), unsafe_allow_html=True)
             
             # 工單列表表格（智能刷新：有新數據時快速刷新，否則慢速刷新，與紀錄歷程同步）
             has_new_log_queue = st.session_state.get(f"new_log_{line_name}", False)
@@ -349,18 +181,18 @@ def render_active_line(line_name, cur_s, cur_g, wo_std_map,
             if has_new_log_queue:
                 # 有新數據時，使用快速刷新（0.5 秒）
                 @st.fragment(run_every=0.5)  # [優化] 從 0.3 秒改為 0.5 秒，減少伺服器負載和連線檢查頻率
-                def render_queue_table_fast(q_view, current_item, line_n):
+                def render_queue_table_fast(current_item, line_n):
                     # 清除標記，下次使用慢速刷新
                     if st.session_state.get(f"new_log_{line_n}", False):
                         st.session_state[f"new_log_{line_n}"] = False
-                    render_queue_table_internal(q_view, current_item, line_n)
-                render_queue_table_fast(queue_view, curr, line_name)
+                    render_queue_table_internal(current_item, line_n)
+                render_queue_table_fast(curr, line_name)
             else:
                 # 沒有新數據時，使用慢速刷新（10 秒）
                 @st.fragment(run_every=10.0)
-                def render_queue_table_slow(q_view, current_item, line_n):
-                    render_queue_table_internal(q_view, current_item, line_n)
-                render_queue_table_slow(queue_view, curr, line_name)
+                def render_queue_table_slow(current_item, line_n):
+                    render_queue_table_internal(current_item, line_n)
+                render_queue_table_slow(curr, line_name)
             
             st.divider()
 
@@ -448,23 +280,13 @@ def render_record_history(line_n, s_curr, g_curr, wo_std_map, undo_dialog_key):
     st.divider()
     h_l, h_r = st.columns(2)
     
-    # 檢查 production_logs 是否為空
-    if st.session_state.production_logs.empty:
-        session_logs = pd.DataFrame()
-    else:
-        mask_strict_shift = (st.session_state.production_logs["班別"] == s_curr)
-        mask_strict_group = (st.session_state.production_logs["組別"] == g_curr)
-        temp_dts = pd.to_datetime(st.session_state.production_logs["時間"], errors='coerce') 
-        mask_date = temp_dts.dt.date.astype(str) == datetime.now().strftime("%Y-%m-%d")
-        mask_line = st.session_state.production_logs["產線"] == line_n
-        session_logs = st.session_state.production_logs[mask_date & mask_line & mask_strict_shift & mask_strict_group]
+    # [優化] 只向資料庫查詢本班（產線、班別、組別、班別日期）的紀錄
+    session_logs = get_session_logs(line_n, s_curr, g_curr)
     
-    pass_all_session = session_logs[session_logs["判定結果"] == "PASS"] if not session_logs.empty else pd.DataFrame()
-    total_weight_session = 0.0
-    if not pass_all_session.empty:
-        for _, row in pass_all_session.iterrows(): 
-            total_weight_session += float(wo_std_map.get(row["工單號"], 0))
-    total_ng_session = len(session_logs[session_logs["判定結果"] == "NG"]) if not session_logs.empty else 0
+    # [優化] 累計值直接讀取班別統計表，不再逐筆對應工單準重
+    summary = get_shift_summary(line_n, s_curr, g_curr)
+    total_weight_session = summary["準重合計"]
+    total_ng_session = summary["NG數"]
 
     with h_l:
         st.markdown(f'<div class="table-label">✅ 良品紀錄 <span style="font-size:0.8em; color:#666; font-weight:normal; margin-left:10px;">(累計: {total_weight_session:.1f} kg)</span></div>', unsafe_allow_html=True)
@@ -519,14 +341,72 @@ def render_record_history(line_n, s_curr, g_curr, wo_std_map, undo_dialog_key):
             st.rerun()
 
 
+def record_pass(line_n, s_curr, g_curr):
+    """
+    記錄一筆良品（PASS）
+    供「紀錄良品」按鈕的 on_click 與自動記錄模式共用，重量與工單資訊從 session_state 讀取
+
+    回傳:
+        是否記錄成功
+    """
+    # [防護機制] 優先使用快照的重量值，如果沒有快照則使用當前鎖定的值
+    weight_to_record = st.session_state.get(f"snapshot_weight_{line_n}")
+    if weight_to_record is None:
+        # 如果沒有快照，使用當前鎖定的重量值
+        weight_to_record = st.session_state.get(f"auto_held_val_{line_n}")
+    if weight_to_record is None:
+        # 如果意外為 None，使用當前顯示值（從 session_state 中讀取，避免閉包問題）
+        weight_to_record = st.session_state.get(f"current_display_val_{line_n}", 0.0)
+
+    try:
+        # 從 session_state 獲取當前工單信息（避免閉包變數問題）
+        wo_id = st.session_state.get(f"current_wo_id_{line_n}")
+        product_id = st.session_state.get(f"current_product_id_{line_n}")
+
+        if wo_id is None or product_id is None:
+            st.error("無法取得當前工單信息，請重新選擇工單")
+            return False
+
+        # [防護機制] 驗證重量是否在合理範圍內
+        # 獲取產品規格以驗證重量
+        try:
+            spec = get_product(product_id)
+            if spec is None:
+                raise KeyError(product_id)
+            low_limit = float(spec.low)
+            # 如果重量小於下限的 50% 或小於 0.5kg，視為異常數據，拒絕記錄
+            min_valid_weight = max(low_limit * 0.5, 0.5)
+            if weight_to_record < min_valid_weight:
+                st.error(f"❌ 記錄失敗：重量值 {weight_to_record:.3f} kg 過小，疑似物品已移除。請重新放置物品後再記錄。")
+                st.session_state[f"lock_{line_n}"] = False  # 不鎖定，讓作業員可以重新操作
+                return False
+        except Exception as e:
+            # 如果無法獲取規格，至少檢查重量是否大於 0.5kg
+            if weight_to_record < 0.5:
+                st.error(f"❌ 記錄失敗：重量值 {weight_to_record:.3f} kg 過小，疑似物品已移除。請重新放置物品後再記錄。")
+                st.session_state[f"lock_{line_n}"] = False
+                return False
+
+        record_piece(line_n, wo_id, product_id, weight_to_record, "PASS", shift=s_curr, group=g_curr)
+        st.session_state[f"lock_{line_n}"] = True
+        # 清除快照，避免下次誤用
+        if f"snapshot_weight_{line_n}" in st.session_state:
+            del st.session_state[f"snapshot_weight_{line_n}"]
+        # 設置標記，通知 fragment 有新數據需要刷新
+        st.session_state[f"new_log_{line_n}"] = True
+        return True
+    except Exception as e:
+        st.error(f"記錄失敗: {e}")
+        return False
+
+
 def render_scale_control_panel(curr_item, line_n, s_curr, g_curr, wo_std_map,
                               STABLE_TOLERANCE, QUICK_STABLE_TIME, HOLD_RELEASE_DIFF,
                               RESET_THRESHOLD, NG_MIN, NG_MAX, undo_dialog_key):
     """渲染磅秤控制面板（需要實時刷新）"""
     # [修正] 實時更新數量
     try:
-        latest_wo = st.session_state.work_orders_db[st.session_state.work_orders_db["工單號碼"] == curr_item["工單號碼"]].iloc[0]
-        rem_qty = int(latest_wo['預計數量']) - int(latest_wo['已完成數量'])
+        rem_qty = get_work_order(curr_item["工單號碼"]).remaining
     except:
         rem_qty = int(curr_item['預計數量']) - int(curr_item['已完成數量'])
 
@@ -539,16 +419,18 @@ def render_scale_control_panel(curr_item, line_n, s_curr, g_curr, wo_std_map,
     """, unsafe_allow_html=True)
 
     try:
-        spec = st.session_state.products_db[st.session_state.products_db["產品ID"] == curr_item["產品ID"]].iloc[0]
-        std, low, high = float(spec['準重']), float(spec['下限']), float(spec['上限'])
-        temp_val = str(spec['溫度等級'])
+        spec = get_product(curr_item["產品ID"])
+        if spec is None:
+            raise KeyError(curr_item["產品ID"])
+        std, low, high = float(spec.std), float(spec.low), float(spec.high)
+        temp_val = str(spec.temp_grade)
         temp_color = dm.get_temp_color(temp_val)
-        density_val = spec['密度']
+        density_val = spec.density
         density_show = f"{float(density_val):.1f}" if str(density_val).replace('.','',1).isdigit() else str(density_val).replace('N/A', '-')
-        size_show = f"{dm.format_size(spec['長'])}x{dm.format_size(spec['寬'])}x{dm.format_size(spec['高'])}"
+        size_show = f"{dm.format_size(spec.length)}x{dm.format_size(spec.width)}x{dm.format_size(spec.height)}"
         range_show = f"{low:.1f} - {std:.3f} - {high:.1f}"
         notes_html = ""
-        for n in [spec['備註1'], spec['備註2'], spec['備註3']]:
+        for n in spec.notes:
             if pd.notna(n) and str(n).strip() != "" and str(n) != "None": 
                 notes_html += f"<div>• {n}</div>"
         if not notes_html: 
@@ -559,25 +441,30 @@ def render_scale_control_panel(curr_item, line_n, s_curr, g_curr, wo_std_map,
 
     col_left, col_right = st.columns([4, 6])
     with col_left:
-        usc_html = f"""<div class="unified-spec-card" style="border-left-color: {temp_color};"><div class="usc-header"><div class="u-label" style="color: #b0bec5; font-weight: bold; font-size: 0.75rem;">CLIENT / 客戶</div><div class="u-value">{spec['客戶名']}</div></div><div class="usc-grid"><div class="usc-item"><span class="u-label">TEMP / 溫度</span><span class="u-value" style="color: {temp_color}">{temp_val}</span></div><div class="usc-item"><span class="u-label">VARIETY / 品種</span><span class="u-value">{spec['品種']}</span></div><div class="usc-item"><span class="u-label">DENSITY / 密度</span><span class="u-value">{density_show}</span></div></div><div class="usc-size-row"><div class="u-label" style="color: #b0bec5; font-weight: bold; font-size: 0.75rem;">SIZE / 尺寸</div><div class="u-value">{size_show}</div></div><div class="usc-range-row"><div class="u-label" style="color: #b0bec5; font-weight: bold; font-size: 0.75rem;">RANGE / 範圍</div><div class="u-value">{range_show}</div></div><div class="usc-notes"><div style="color: #ff4b4b; border-bottom: 1px solid #ff4b4b; padding-bottom: 4px; margin-bottom: 4px; font-weight: bold; font-size: 0.8rem;">NOTES / 備註</div><div class="u-content">{notes_html}</div></div></div>"""
+        usc_html = f"""<div class="unified-spec-card" style="border-left-color: {temp_color};"><div class="usc-header"><div class="u-label" style="color: #b0bec5; font-weight: bold; font-size: 0.75rem;">CLIENT / 客戶</div><div class="u-value">{spec.customer}</div></div><div class="usc-grid"><div class="usc-item"><span class="u-label">TEMP / 溫度</span><span class="u-value" style="color: {temp_color}">{temp_val}</span></div><div class="usc-item"><span class="u-label">VARIETY / 品種</span><span class="u-value">{spec.variety}</span></div><div class="usc-item"><span class="u-label">DENSITY / 密度</span><span class="u-value">{density_show}</span></div></div><div class="usc-size-row"><div class="u-label" style="color: #b0bec5; font-weight: bold; font-size: 0.75rem;">SIZE / 尺寸</div><div class="u-value">{size_show}</div></div><div class="usc-range-row"><div class="u-label" style="color: #b0bec5; font-weight: bold; font-size: 0.75rem;">RANGE / 範圍</div><div class="u-value">{range_show}</div></div><div class="usc-notes"><div style="color: #ff4b4b; border-bottom: 1px solid #ff4b4b; padding-bottom: 4px; margin-bottom: 4px; font-weight: bold; font-size: 0.8rem;">NOTES / 備註</div><div class="u-content">{notes_html}</div></div></div>"""
         st.markdown(usc_html, unsafe_allow_html=True)
 
     with col_right:
-        # 獲取重量（總覽模式下顯示 0）
-        if st.session_state.locked_station == "總覽模式 (所有產線)": 
-            real_w, scale_msg = 0.0, "總覽模式"
+        # 獲取重量（總覽模式下只顯示有設定多磅秤來源的產線，其餘顯示 0）
+        # [改進] 產線列於 config.SCALE_SOURCES 時由多磅秤服務讀取，主管站也能看到即時重量
+        is_overview = st.session_state.locked_station == "總覽模式 (所有產線)"
+        if is_overview and not dm.has_line_scale(line_n): 
+            real_w, scale_msg, scale_stable, settled_val = 0.0, "總覽模式", None, None
         else: 
-            real_w, scale_msg = dm.get_real_weight()
+            real_w, scale_msg, scale_stable, settled_val = dm.get_weight_and_stability(line_n)
 
         hist = st.session_state[f"hist_{line_n}"]
         hist.append(real_w)
         if len(hist) > 5: 
             hist.pop(0) 
         
-        # [優化] 使用滑動平均濾波判斷穩定，比最大值最小值比較更快
+        # [優化] 穩定判斷已在磅秤讀取執行緒中完成（儀表旗標或穩定判斷引擎），不必等待 UI 刷新累積歷史讀數
+        use_scale_stable = scale_stable is not None
+        
+        # [優化] 使用滑動平均濾波判斷穩定，比最大值最小值比較更快（僅用於沒有讀取器判斷結果時，例如模擬模式）
         is_variance_low = False
         # [優化] 減少需要的歷史數據從 3 筆改為 2 筆，加快穩定判斷
-        if len(hist) >= 2:
+        if not use_scale_stable and len(hist) >= 2:
             # 計算最近2筆讀數的滑動平均值（使用更少的數據，更快響應）
             recent_hist = hist[-2:]
             moving_avg = sum(recent_hist) / len(recent_hist)
@@ -588,7 +475,12 @@ def render_scale_control_panel(curr_item, line_n, s_curr, g_curr, wo_std_map,
             if abs(real_w_rounded - moving_avg_rounded) <= STABLE_TOLERANCE:
                 is_variance_low = True
         
-        if is_variance_low and real_w > 0.1:
+        if use_scale_stable and scale_stable and settled_val is not None and real_w > 0.1:
+            # 讀取器判定穩定：立即鎖定；若已鎖定但換成另一個穩定重量，改鎖新值
+            held = st.session_state[f"auto_held_val_{line_n}"]
+            if held is None or abs(settled_val - held) > HOLD_RELEASE_DIFF:
+                st.session_state[f"auto_held_val_{line_n}"] = settled_val
+        elif is_variance_low and real_w > 0.1:
             if st.session_state[f"stable_start_{line_n}"] is None:
                 st.session_state[f"stable_start_{line_n}"] = time.time()
             else:
@@ -601,6 +493,20 @@ def render_scale_control_panel(curr_item, line_n, s_curr, g_curr, wo_std_map,
                 if abs(real_w - st.session_state[f"auto_held_val_{line_n}"]) > HOLD_RELEASE_DIFF:
                     st.session_state[f"auto_held_val_{line_n}"] = None
 
+        # [改進] 自動記錄良品：穩定判斷引擎鎖定的重量落在規格內時自動記錄 PASS，
+        # 記錄後沿用手動記錄的鎖定，重量低於 RESET_THRESHOLD（物品移除）才重新待命
+        if (use_scale_stable and st.session_state.get(f"auto_record_{line_n}", False)
+                and not is_overview
+                and not st.session_state[f"lock_{line_n}"]):
+            held = st.session_state[f"auto_held_val_{line_n}"]
+            if held is not None and round(low, 1) <= round(held, 1) <= round(high, 1):
+                st.session_state[f"snapshot_weight_{line_n}"] = held
+                st.session_state[f"current_wo_id_{line_n}"] = curr_item["工單號碼"]
+                st.session_state[f"current_product_id_{line_n}"] = curr_item["產品ID"]
+                if record_pass(line_n, s_curr, g_curr):
+                    rem_qty -= 1
+                    st.toast(f"✅ 自動記錄 PASS: {held} kg")
+
         is_manually_locked = st.session_state[f"lock_{line_n}"]
         auto_held_val = st.session_state[f"auto_held_val_{line_n}"]
 
@@ -646,14 +552,9 @@ def render_scale_control_panel(curr_item, line_n, s_curr, g_curr, wo_std_map,
         
         over_cls = "over-prod" if rem_qty < 0 else ""
 
-        logs = st.session_state.production_logs
-        today_str = datetime.now().strftime("%Y-%m-%d")
-        mask_logs = (logs["產線"]==line_n) & (logs["班別"]==s_curr) & (logs["組別"]==g_curr)
-        current_logs = logs[mask_logs]
-        current_logs = current_logs[pd.to_datetime(current_logs["時間"]).dt.strftime("%Y-%m-%d") == today_str]
-        pass_logs_now = current_logs[current_logs["判定結果"] == "PASS"]
-        act_sum = pd.to_numeric(pass_logs_now["實測重"], errors='coerce').fillna(0).sum()
-        std_sum = pass_logs_now["工單號"].map(wo_std_map).fillna(0).astype(float).sum()
+        summary = get_shift_summary(line_n, s_curr, g_curr)
+        act_sum = summary["實重合計"]
+        std_sum = summary["準重合計"]
         weight_ratio = (act_sum / std_sum * 100) if std_sum > 0 else 0.0
 
         # 生成 LOT 號碼
@@ -685,59 +586,9 @@ def render_scale_control_panel(curr_item, line_n, s_curr, g_curr, wo_std_map,
         
         b_l, b_r = st.columns([3, 1])
         with b_l:
-            def do_pass():
-                # [防護機制] 優先使用快照的重量值，如果沒有快照則使用當前鎖定的值
-                weight_to_record = st.session_state.get(f"snapshot_weight_{line_n}")
-                if weight_to_record is None:
-                    # 如果沒有快照，使用當前鎖定的重量值
-                    weight_to_record = st.session_state.get(f"auto_held_val_{line_n}")
-                if weight_to_record is None:
-                    # 如果意外為 None，使用當前顯示值（從 session_state 中讀取，避免閉包問題）
-                    weight_to_record = st.session_state.get(f"current_display_val_{line_n}", 0.0)
-                
-                try:
-                    # 從 session_state 獲取當前工單信息（避免閉包變數問題）
-                    wo_id = st.session_state.get(f"current_wo_id_{line_n}")
-                    product_id = st.session_state.get(f"current_product_id_{line_n}")
-                    
-                    if wo_id is None or product_id is None:
-                        st.error("無法取得當前工單信息，請重新選擇工單")
-                        return
-                    
-                    # [防護機制] 驗證重量是否在合理範圍內
-                    # 獲取產品規格以驗證重量
-                    try:
-                        spec = st.session_state.products_db[st.session_state.products_db["產品ID"] == product_id].iloc[0]
-                        low_limit = float(spec['下限'])
-                        # 如果重量小於下限的 50% 或小於 0.5kg，視為異常數據，拒絕記錄
-                        min_valid_weight = max(low_limit * 0.5, 0.5)
-                        if weight_to_record < min_valid_weight:
-                            st.error(f"❌ 記錄失敗：重量值 {weight_to_record:.3f} kg 過小，疑似物品已移除。請重新放置物品後再記錄。")
-                            st.session_state[f"lock_{line_n}"] = False  # 不鎖定，讓作業員可以重新操作
-                            return
-                    except Exception as e:
-                        # 如果無法獲取規格，至少檢查重量是否大於 0.5kg
-                        if weight_to_record < 0.5:
-                            st.error(f"❌ 記錄失敗：重量值 {weight_to_record:.3f} kg 過小，疑似物品已移除。請重新放置物品後再記錄。")
-                            st.session_state[f"lock_{line_n}"] = False
-                            return
-                    
-                    idx = st.session_state.work_orders_db[st.session_state.work_orders_db["工單號碼"] == wo_id].index[0]
-                    st.session_state.work_orders_db.at[idx, "已完成數量"] += 1
-                    st.session_state.work_orders_db.at[idx, "狀態"] = "生產中"
-                    new_log = pd.DataFrame([[datetime.now().strftime("%Y-%m-%d %H:%M:%S"), line_n, wo_id, product_id, weight_to_record, "PASS", "", g_curr, s_curr, ""]], columns=config.LOG_COLUMNS)
-                    st.session_state.production_logs = pd.concat([st.session_state.production_logs, new_log], ignore_index=True)
-                    save_data()
-                    st.session_state[f"lock_{line_n}"] = True
-                    # 清除快照，避免下次誤用
-                    if f"snapshot_weight_{line_n}" in st.session_state:
-                        del st.session_state[f"snapshot_weight_{line_n}"]
-                    # 設置標記，通知 fragment 有新數據需要刷新
-                    st.session_state[f"new_log_{line_n}"] = True
-                except Exception as e:
-                    st.error(f"記錄失敗: {e}")
-            btn_pass_disabled = not (is_pass_weight and buttons_enabled)
-            st.button("紀錄良品\n(PASS)", disabled=btn_pass_disabled, type="primary", use_container_width=True, on_click=do_pass, key=f"btn_pass_{line_n}")
+            # 總覽模式只顯示重量，不可從主管站記錄
+            btn_pass_disabled = is_overview or not (is_pass_weight and buttons_enabled)
+            st.button("紀錄良品\n(PASS)", disabled=btn_pass_disabled, type="primary", use_container_width=True, on_click=record_pass, args=(line_n, s_curr, g_curr), key=f"btn_pass_{line_n}")
 
         with b_r:
             def do_ng():
@@ -766,9 +617,7 @@ def render_scale_control_panel(curr_item, line_n, s_curr, g_curr, wo_std_map,
                         return
                     
                     r = st.session_state.get(f"ng_sel_{line_n}", "其他")
-                    new_log = pd.DataFrame([[datetime.now().strftime("%Y-%m-%d %H:%M:%S"), line_n, wo_id, product_id, weight_to_record, "NG", r, g_curr, s_curr, ""]], columns=config.LOG_COLUMNS)
-                    st.session_state.production_logs = pd.concat([st.session_state.production_logs, new_log], ignore_index=True)
-                    save_data()
+                    record_piece(line_n, wo_id, product_id, weight_to_record, "NG", reason=r, shift=s_curr, group=g_curr)
                     st.session_state.toast_msg = (f"🔴 NG: {weight_to_record} kg", None)
                     st.session_state[f"lock_{line_n}"] = True
                     # 清除快照，避免下次誤用
@@ -780,10 +629,13 @@ def render_scale_control_panel(curr_item, line_n, s_curr, g_curr, wo_std_map,
                     st.error(f"記錄失敗: {e}")
             
             # [關鍵修正] NG 只有在 10.0~10.5 之間才能按
-            btn_ng_disabled = not (is_ng_weight and buttons_enabled)
+            btn_ng_disabled = is_overview or not (is_ng_weight and buttons_enabled)
             st.button("紀錄不良品\n(NG)", disabled=btn_ng_disabled, type="primary", use_container_width=True, on_click=do_ng, key=f"btn_ng_{line_n}")
         
         # [關鍵修正] 下拉選單只在 NG 範圍內出現
         if is_ng_weight and not is_manually_locked: 
             st.selectbox("NG 原因", ["不足重尾數", "規格切換廢料", "外觀不良", "其他"], key=f"ng_sel_{line_n}")
 
+        if st.session_state.locked_station != "總覽模式 (所有產線)":
+            st.toggle("🤖 自動記錄良品（穩定且在規格內時自動記錄 PASS）", key=f"auto_record_{line_n}")
+
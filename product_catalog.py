@@ -0,0 +1,152 @@
+"""
+產品目錄快取（程序共用）
+products 表在每個程序只載入一次，所有 session 共用同一份唯讀 DataFrame，
+只有在資料庫中的版本號改變時才重新載入
+
+- 版本號存放在 meta 表（key = 'products_version'），由 products 表的觸發器在新增/修改/刪除時遞增
+  （見 db_migrations 第 6 版），任何寫入 products 的程式都會使舊快取失效
+- 版本號最多每 PRODUCT_CATALOG_CHECK_SECONDS 秒查詢一次；本程序寫入後呼叫 invalidate() 立即重新檢查
+- 回傳的 DataFrame 由所有 session 共用，呼叫端要修改時請先 copy()
+- index() 提供以產品ID查詢 Product 的字典索引（同一版本只建立一次）
+- get_stats() 回報命中/未命中次數
+"""
+
+import re
+import threading
+import time
+
+import pandas as pd
+
+import config
+from models import PRODUCT_COLUMNS, ProductBatch
+
+VERSION_KEY = "products_version"
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def clean_note_field(val):
+    """清理備註欄位中的 HTML 標籤（防止從 Excel 複製貼上時帶入 HTML）"""
+    if pd.isna(val) or str(val).lower() == 'none':
+        return ""
+    # 先移除所有 HTML 標籤（包括 </div>、<div> 等），再移除殘留的 < 和 > 字符（處理不完整的標籤）
+    val_str = _TAG_RE.sub('', str(val))
+    return val_str.replace('<', '').replace('>', '').strip()
+
+
+def read_version(conn):
+    """讀取資料庫中的產品目錄版本號（尚未建立 meta 表時回傳 None）"""
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (VERSION_KEY,)).fetchone()
+    except Exception:
+        return None
+    return row[0] if row else None
+
+
+def build_index(df):
+    """建立 {產品ID: Product} 的查詢索引；產品ID重複時以第一筆為準（與 df[df["產品ID"] == x].iloc[0] 相同）"""
+    index = {}
+    for product in ProductBatch.from_frame(df):
+        index.setdefault(product.product_id, product)
+    return index
+
+
+def load_products(conn):
+    """從資料庫讀取 products 表並清理備註欄位"""
+    df = pd.read_sql_query(f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products", conn)
+    for note_col in ['備註1', '備註2', '備註3']:
+        if note_col in df.columns:
+            df[note_col] = df[note_col].map(clean_note_field)
+    return df
+
+
+class ProductCatalog:
+    """
+    程序共用的產品目錄
+
+    參數:
+        connect: 取得唯讀連線的函式（連線用完後呼叫 close()）
+        check_seconds: 版本號檢查間隔（秒）
+    """
+
+    def __init__(self, connect, check_seconds=None):
+        self._connect = connect
+        self._check_seconds = config.PRODUCT_CATALOG_CHECK_SECONDS if check_seconds is None else check_seconds
+        self._lock = threading.Lock()
+        self._df = None
+        self._index = None
+        self._version = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.version_checks = 0
+        self.load_seconds = 0.0
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self, force_check=False):
+        """
+        取得產品目錄 DataFrame（共用，請勿直接修改）
+
+        參數:
+            force_check: 忽略檢查間隔，立即比對資料庫版本號
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._df is not None and not force_check and now - self._checked_at < self._check_seconds:
+                self.hits += 1
+                return self._df
+
+            conn = self._connect()
+            try:
+                version = read_version(conn)
+                self.version_checks += 1
+                # 版本號相同（且資料庫支援版本號）時沿用快取
+                if self._df is not None and version is not None and version == self._version:
+                    self._checked_at = now
+                    self.hits += 1
+                    return self._df
+                started = time.perf_counter()
+                df = load_products(conn)
+            finally:
+                conn.close()
+
+            self.load_seconds += time.perf_counter() - started
+            self.misses += 1
+            self._df = df
+            self._index = None
+            self._version = version
+            self._checked_at = now
+            return df
+
+    def index(self, df):
+        """
+        df（目前快取的產品目錄）的 {產品ID: Product} 索引，同一版本只建立一次（共用，請勿修改）
+        df 不是目前的產品目錄（例如 session 中另行修改過的副本）時回傳 None
+        """
+        with self._lock:
+            if df is None or df is not self._df:
+                return None
+            if self._index is None:
+                self._index = build_index(self._df)
+            return self._index
+
+    def invalidate(self):
+        """下次 get() 時重新比對版本號（本程序寫入 products 後呼叫）"""
+        with self._lock:
+            self._checked_at = 0.0
+
+    def get_stats(self):
+        """快取統計：命中/未命中次數、命中率、目前版本、產品數"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "version_checks": self.version_checks,
+            "version": self._version,
+            "rows": 0 if self._df is None else len(self._df),
+            "avg_load_ms": self.load_seconds / self.misses * 1000 if self.misses else 0.0,
+        }
@@ -0,0 +1,197 @@
+"""
+產線工單佇列畫面（選單文字、工單列表、預設選取的工單）
+
+[優化] 每條產線的結果保存在 session 中，只有該產線的待完成工單或產品目錄改變時才重新建立，
+不再於每次重新執行、每次工單列表 fragment 刷新時重複 merge 產品資料與逐列 apply
+- 工單資料版本（data_loader.work_orders_version）與產品目錄相同時直接沿用
+- 版本改變時（例如 load_data 重新讀取工單），比對該產線待完成工單的內容雜湊，內容相同仍沿用
+- get_queue_view_stats() 回報命中率（顯示在側邊欄「系統狀態」）
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+import pandas as pd
+import streamlit as st
+
+import data_manager as dm
+from data_loader import get_product, work_orders_version
+
+PENDING_STATUSES = ["待生產", "生產中"]
+TABLE_COLUMNS = ["序", "客戶", "溫度", "品種", "密度", "規格", "下限", "準重", "上限", "備註1", "備註2", "備註3", "進度"]
+SIMPLE_TABLE_COLUMNS = ["序", "內容", "進度"]
+
+
+@dataclass
+class QueueView:
+    """
+    一條產線的工單佇列
+
+    屬性:
+        rows: 待完成工單（依排程順序，已合併產品資料，含 temp_sort 與 選單顯示 欄位）
+        labels: 選單文字（與 rows 同順序）
+        table_columns / table_rows: 工單列表的欄位與各列顯示值
+        producing_index: 第一張"生產中"工單的位置（沒有時為 None）
+    """
+    rows: pd.DataFrame
+    labels: list
+    table_columns: list
+    table_rows: list
+    producing_index: Optional[int]
+    _html: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def current_index(self):
+        """預設選取的位置：[交接班優化] 優先"生產中"的工單，沒有時為第一張"""
+        return self.producing_index if self.producing_index is not None else 0
+
+    def row_for(self, label):
+        """選單文字對應的工單列（找不到時回傳第一張）"""
+        try:
+            return self.rows.iloc[self.labels.index(label)]
+        except ValueError:
+            return self.rows.iloc[0]
+
+    def table_html(self, active_seq):
+        """工單列表 HTML（active_seq 為目前工單的序號，以底色標示）；同一序號只產生一次"""
+        html = self._html.get(active_seq)
+        if html is None:
+            html = _render_table(self.table_columns, self.table_rows, active_seq)
+            self._html[active_seq] = html
+        return html
+
+
+def _density_text(product_id):
+    """從產品索引取得密度文字（無資料時為空字串）"""
+    product = get_product(product_id)
+    if product is not None:
+        density_val = product.density
+        if pd.notna(density_val) and str(density_val).strip() != "":
+            try:
+                return f"{float(density_val):.1f}"
+            except (ValueError, TypeError):
+                return str(density_val)
+    return ""
+
+
+def _size_text(row):
+    return f"{dm.format_size(row['長'])}x{dm.format_size(row['寬'])}x{dm.format_size(row['高'])}"
+
+
+def make_label(row):
+    """工單選單文字（保存於 dm.save_current_work_order，格式變更會使已保存的選擇失效）"""
+    if "客戶名" in row and pd.notna(row["客戶名"]):
+        density = _density_text(row.get("產品ID", ""))
+        density_str = f"{density} | " if density else ""
+        return f"#{row['temp_sort']} {row['客戶名']} | {row['溫度等級']} | {row['品種_x']} | {density_str}{_size_text(row)} | {float(row['準重_x']):.3f}kg (數:{int(row['預計數量'])})"
+    return f"#{row['temp_sort']} {str(row['顯示內容'])} (數:{int(row['預計數量'])})"
+
+
+def _limit_text(x):
+    return f"{float(x):.1f}" if pd.notna(x) else ""
+
+
+def _note_text(x):
+    return str(x) if pd.notna(x) and str(x).lower() != 'none' else ""
+
+
+def _table_row(row, detailed):
+    progress = f"{int(row['已完成數量'])} / {int(row['預計數量'])}"
+    if not detailed:
+        return [row["temp_sort"], row["詳細規格字串"], progress]
+    return [
+        row["temp_sort"], row["客戶名"], str(row["溫度等級"]), row["品種_x"], _density_text(row.get("產品ID", "")),
+        _size_text(row), _limit_text(row.get("下限")), dm.safe_format_weight(row["準重_x"]), _limit_text(row.get("上限")),
+        _note_text(row.get("備註1")), _note_text(row.get("備註2")), _note_text(row.get("備註3")), progress,
+    ]
+
+
+def _render_table(columns, rows, active_seq):
+    html_q = '<div class="table-scroll-container"><table class="styled-table"><thead><tr>'
+    for c in columns:
+        html_q += f'<th>{c}</th>'
+    html_q += '</tr></thead><tbody>'
+    for values in rows:
+        is_active = values[0] == active_seq
+        row_style = 'style="background-color: #d6eaf8; border-left: 5px solid #3498db;"' if is_active else ''
+        html_q += f'<tr {row_style}>'
+        for c, val in zip(columns, values):
+            val_display = f"<strong>{val}</strong>" if is_active else f"{val}"
+            td_style = "style='max-width: 120px; white-space: normal; word-wrap: break-word; word-break: break-all; color: #d35400;'" if c in ["備註1", "備註2", "備註3"] else ""
+            html_q += f'<td {td_style}>{val_display}</td>'
+        html_q += '</tr>'
+    html_q += '</tbody></table></div>'
+    return html_q
+
+
+def _line_pending(orders, line_name):
+    """該產線的待完成工單（依排程順序）"""
+    mask = orders["狀態"].isin(PENDING_STATUSES) & (orders["產線"] == line_name)
+    return orders[mask].sort_values(by="排程順序")
+
+
+def _fingerprint(pending):
+    """待完成工單內容的雜湊（逐列），用於判斷重新載入後內容是否相同"""
+    return tuple(pd.util.hash_pandas_object(pending, index=False).tolist())
+
+
+def build_queue_view(pending, products):
+    """由該產線的待完成工單與產品資料建立 QueueView（pending 不可為空）"""
+    if not products.empty:
+        rows = pending.merge(products, on="產品ID", how="left")
+    else:
+        rows = pending.reset_index(drop=True)
+    rows["temp_sort"] = range(1, len(rows) + 1)
+    records = rows.to_dict("records")
+    labels = [make_label(row) for row in records]
+    rows["選單顯示"] = labels
+
+    detailed = "客戶名" in rows.columns
+    table_rows = [_table_row(row, detailed) for row in records]
+    producing = [i for i, row in enumerate(records) if row["狀態"] == "生產中"]
+    return QueueView(
+        rows=rows,
+        labels=labels,
+        table_columns=TABLE_COLUMNS if detailed else SIMPLE_TABLE_COLUMNS,
+        table_rows=table_rows,
+        producing_index=producing[0] if producing else None,
+    )
+
+
+def get_queue_view(line_name):
+    """
+    取得產線的工單佇列（沒有待完成工單時回傳 None）
+    結果依 (工單資料版本, 產品目錄) 快取；版本改變但該產線內容相同時仍沿用
+    """
+    orders = st.session_state.work_orders_db
+    products = st.session_state.products_db
+    version = work_orders_version()
+    cache = st.session_state.setdefault('queue_views', {})
+    stats = st.session_state.setdefault('queue_view_stats', {"hits": 0, "misses": 0})
+
+    # 保存工單 / 產品 DataFrame 本身並以 is 比對，避免舊物件被回收後 id 重複
+    entry = cache.get(line_name)
+    if entry is not None and entry["products"] is products and entry["orders"] is orders and entry["version"] == version:
+        stats["hits"] += 1
+        return entry["view"]
+
+    pending = _line_pending(orders, line_name)
+    fingerprint = _fingerprint(pending)
+    if entry is not None and entry["products"] is products and entry["fingerprint"] == fingerprint:
+        stats["hits"] += 1
+    else:
+        stats["misses"] += 1
+        entry = {"products": products, "fingerprint": fingerprint,
+                 "view": build_queue_view(pending, products) if not pending.empty else None}
+    entry.update(orders=orders, version=version)
+    cache[line_name] = entry
+    return entry["view"]
+
+
+def get_queue_view_stats():
+    """本 session 的工單佇列快取統計（尚未使用時回傳 None）"""
+    stats = st.session_state.get('queue_view_stats')
+    if not stats:
+        return None
+    total = stats["hits"] + stats["misses"]
+    return {**stats, "hit_rate": stats["hits"] / total if total else 0.0}
@@ -0,0 +1,174 @@
+"""
+磅秤通訊協定模組
+提供 bytearray 增量分框器與常見連續輸出格式的解析器，
+可在 config.SCALE_PROTOCOL 中選擇使用的協定
+
+支援格式：
+- generic : 任意文字行，取第一個小數（舊版行為，無穩定旗標）
+- csv     : 狀態,毛淨重,數值單位，例如 ST,GS,+0025.30kg
+- and     : A&D 格式，例如 ST,+00025.30  kg
+- toledo  : Mettler Toledo 連續輸出（STX + 3 個狀態字 + 重量 + 皮重 + CR）
+"""
+
+import re
+from collections import namedtuple
+
+# 單一框架的解析結果
+# weight: 含正負號的重量；unit: 單位字串（例如 kg），未提供時為 ""
+# stable: True=穩定 / False=不穩定 / None=協定未提供
+# net: True=淨重 / False=毛重 / None=協定未提供
+ScaleFrame = namedtuple("ScaleFrame", ["weight", "unit", "stable", "net"])
+
+_LINE_END = re.compile(rb"[\r\n]")
+
+
+class FrameBuffer:
+    """
+    bytearray 增量分框器
+    串口資料可能在任意位置被切斷，這裡保留未完成的部分等下一批資料補齊
+
+    參數:
+        start: 框架起始字元（例如 Toledo 的 STX），None 表示不需要
+        end_pattern: 框架結尾的正規表示式（bytes）
+        max_len: 單一框架的最大長度，超過即丟棄（避免雜訊造成緩衝區無限增長）
+    """
+
+    def __init__(self, start=None, end_pattern=_LINE_END, max_len=128):
+        self._buf = bytearray()
+        self._start = start
+        self._end = end_pattern
+        self._max_len = max_len
+
+    def feed(self, data):
+        """加入新資料，回傳已完整的框架（bytes 列表，不含起始/結尾字元）"""
+        buf = self._buf
+        buf += data
+        frames = []
+        pos = 0
+        n = len(buf)
+        while pos < n:
+            if self._start is not None:
+                s = buf.find(self._start, pos)
+                if s < 0:
+                    pos = n  # 沒有起始字元，之前的都是雜訊
+                    break
+                pos = s + 1
+            m = self._end.search(buf, pos)
+            if m is None:
+                if self._start is not None:
+                    pos -= 1  # 保留起始字元，等待後續資料
+                break
+            if m.start() > pos:
+                frames.append(bytes(buf[pos:m.start()]))
+            pos = m.end()
+        # 一次刪除已處理的部分（而非逐位元組處理）
+        if pos:
+            del buf[:pos]
+        if len(buf) > self._max_len:
+            buf.clear()
+        return frames
+
+    def clear(self):
+        self._buf.clear()
+
+
+class GenericParser:
+    """通用文字格式：取第一個（可含正負號的）小數，與舊版 regex 行為相容"""
+
+    name = "generic"
+    _pattern = re.compile(rb"([+-]?)\s*(\d+\.\d+)\s*([A-Za-z]*)")
+
+    def framer(self):
+        return FrameBuffer()
+
+    def parse(self, frame):
+        if len(frame) <= 3:
+            return None
+        m = self._pattern.search(frame)
+        if m is None:
+            return None
+        sign, value, unit = m.groups()
+        weight = float(value)
+        if sign == b"-":
+            weight = -weight
+        return ScaleFrame(weight, unit.decode("ascii").lower(), None, None)
+
+
+class StatusHeaderParser:
+    """
+    帶狀態標頭的連續輸出格式（csv / A&D）
+    ST=穩定、US=不穩定、OL=過載；GS=毛重、NT=淨重
+    例如：ST,GS,+0025.30kg、US,NT,-0000.12kg、ST,+00025.30  kg
+    """
+
+    _pattern = re.compile(
+        rb"(ST|US|OL|QT)\s*,\s*(?:(GS|NT|TR|GW|NW)\s*,\s*)?([+-]?)\s*(\d+(?:\.\d+)?)\s*([A-Za-z]*)"
+    )
+
+    def __init__(self, name="csv"):
+        self.name = name
+
+    def framer(self):
+        return FrameBuffer()
+
+    def parse(self, frame):
+        m = self._pattern.search(frame)
+        if m is None:
+            return None
+        status, mode, sign, value, unit = m.groups()
+        if status == b"OL":
+            return None  # 過載時沒有有效重量
+        weight = float(value)
+        if sign == b"-":
+            weight = -weight
+        net = None
+        if mode is not None:
+            net = mode in (b"NT", b"NW")
+        return ScaleFrame(weight, unit.decode("ascii").lower(), status == b"ST", net)
+
+
+class ToledoContinuousParser:
+    """
+    Mettler Toledo 連續輸出格式
+    STX SWA SWB SWC WWWWWW TTTTTT CR [CKS]
+    - SWA bit0-2：小數點位置
+    - SWB bit0：淨重；bit1：負號；bit2：超出範圍；bit3：不穩定；bit4：kg（否則 lb）
+    """
+
+    name = "toledo"
+    # SWA 小數點代碼 -> 除數（代碼 0、1 為 X00、X0 表示數值需乘上倍率）
+    _DECIMAL_FACTORS = {0: 100.0, 1: 10.0, 2: 1.0, 3: 0.1, 4: 0.01, 5: 0.001, 6: 0.0001, 7: 0.00001}
+
+    def framer(self):
+        return FrameBuffer(start=b"\x02", end_pattern=re.compile(rb"\r"))
+
+    def parse(self, frame):
+        if len(frame) < 9:
+            return None
+        swa, swb = frame[0], frame[1]
+        digits = frame[3:9]
+        if not digits.isdigit():
+            return None
+        if swb & 0x04:
+            return None  # 超出範圍
+        weight = int(digits) * self._DECIMAL_FACTORS[swa & 0x07]
+        if swb & 0x02:
+            weight = -weight
+        unit = "kg" if swb & 0x10 else "lb"
+        return ScaleFrame(weight, unit, not (swb & 0x08), bool(swb & 0x01))
+
+
+PROTOCOLS = {
+    "generic": GenericParser,
+    "csv": lambda: StatusHeaderParser("csv"),
+    "and": lambda: StatusHeaderParser("and"),
+    "toledo": ToledoContinuousParser,
+}
+
+
+def get_protocol(name):
+    """依名稱建立協定解析器（名稱不分大小寫）"""
+    key = (name or "generic").lower()
+    if key not in PROTOCOLS:
+        raise ValueError(f"不支援的磅秤協定：{name}（可用：{', '.join(PROTOCOLS)}）")
+    return PROTOCOLS[key]()
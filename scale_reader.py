@@ -0,0 +1,231 @@
+"""
+磅秤背景讀取模組
+由單一背景執行緒持續讀取串口，將帶時間戳的讀數存入固定大小的環狀緩衝區，
+UI 端（st.fragment）只需非阻塞地查詢最新讀數，不再在每次刷新時等待串口 I/O
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+import serial
+
+from scale_protocols import get_protocol
+
+# 單筆讀數：timestamp 為 time.monotonic()，raw 為原始框架文字（供狀態訊息顯示）
+# stable / net 的意義同 scale_protocols.ScaleFrame（None 表示協定未提供）
+ScaleReading = namedtuple("ScaleReading", ["timestamp", "weight", "raw", "unit", "stable", "net"])
+
+
+class ScaleReader:
+    """
+    磅秤背景讀取器（每個程序一個）
+
+    參數:
+        connect: 取得 serial.Serial 的函數（失敗時回傳 None）
+        on_disconnect: 連線異常時呼叫的函數（用於清除連線快取）
+        protocol: 磅秤協定名稱（見 scale_protocols.PROTOCOLS）
+        detector: 穩定判斷器（stability.StabilityDetector），每筆讀數都會送入判斷
+        recorder: 重量軌跡記錄器（trace_recorder.TraceRecorder），None 表示不記錄
+        publisher: 共享讀數看板（shared_weight.SharedWeightBoard），None 表示不發布
+        buffer_size: 環狀緩衝區大小（保留最近 N 筆讀數）
+        reconnect_delay: 連線失敗後重試間隔（秒）
+    """
+
+    def __init__(self, connect, on_disconnect=None, protocol="generic", detector=None,
+                 recorder=None, publisher=None, buffer_size=256, reconnect_delay=1.0):
+        self._connect = connect
+        self._on_disconnect = on_disconnect
+        self._parser = get_protocol(protocol)
+        self._detector = detector
+        self._recorder = recorder
+        self._publisher = publisher
+        self._size = buffer_size
+        self._reconnect_delay = reconnect_delay
+
+        # 預先配置的環狀緩衝區（避免讀取迴圈中反覆配置記憶體）
+        self._timestamps = [0.0] * buffer_size
+        self._weights = [0.0] * buffer_size
+        self._raws = [b""] * buffer_size
+        self._frames = [None] * buffer_size
+        self._count = 0  # 累計寫入筆數，最新一筆位於 (_count - 1) % size
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._status = "連線中"
+        self._frames_total = 0
+
+    # ------------------------------------------
+    # 執行緒控制
+    # ------------------------------------------
+    def start(self):
+        """啟動背景讀取執行緒（重複呼叫不會建立多個執行緒）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ScaleReader", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """停止背景讀取執行緒"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def status(self):
+        """目前連線狀態文字（例如：正常連線、連線失敗: ...）"""
+        return self._status
+
+    @property
+    def stability(self):
+        """最新的穩定判斷結果（stability.StabilityState），未設定判斷器時為 None"""
+        return self._detector.state if self._detector is not None else None
+
+    @property
+    def frames_total(self):
+        """自啟動以來成功解析的讀數筆數"""
+        return self._frames_total
+
+    # ------------------------------------------
+    # 查詢介面（非阻塞）
+    # ------------------------------------------
+    def latest(self):
+        """
+        取得最新一筆讀數及其經過時間
+
+        回傳:
+            (ScaleReading, age_seconds)；尚無任何讀數時回傳 (None, None)
+        """
+        with self._lock:
+            if self._count == 0:
+                return None, None
+            reading = self._reading_at((self._count - 1) % self._size)
+        return reading, time.monotonic() - reading.timestamp
+
+    def readings(self, since=None):
+        """
+        取得緩衝區中的讀數（由舊到新）
+
+        參數:
+            since: 只回傳 timestamp 大於此值的讀數（None 表示全部）
+        """
+        with self._lock:
+            n = min(self._count, self._size)
+            start = self._count - n
+            result = []
+            for k in range(start, self._count):
+                i = k % self._size
+                if since is None or self._timestamps[i] > since:
+                    result.append(self._reading_at(i))
+        return result
+
+    def _reading_at(self, i):
+        # 原始框架只在查詢時才解碼，讀取迴圈中不產生字串
+        frame = self._frames[i]
+        return ScaleReading(
+            self._timestamps[i], self._weights[i],
+            self._raws[i].decode('ascii', errors='replace').strip(),
+            frame.unit, frame.stable, frame.net,
+        )
+
+    # ------------------------------------------
+    # 背景讀取迴圈
+    # ------------------------------------------
+    def _push(self, frame, raw):
+        """寫入一筆讀數到環狀緩衝區"""
+        ts = time.monotonic()
+        with self._lock:
+            i = self._count % self._size
+            self._timestamps[i] = ts
+            self._weights[i] = frame.weight
+            self._raws[i] = raw
+            self._frames[i] = frame
+            self._count += 1
+        self._frames_total += 1
+        # 在讀取執行緒中以儀表原生頻率更新穩定判斷
+        if self._detector is not None:
+            self._detector.add(ts, frame.weight)
+        if self._recorder is not None:
+            try:
+                self._recorder.append(ts, frame.weight, frame.stable)
+            except Exception as e:
+                # 記錄失敗不可影響秤重，停用記錄器
+                print(f"⚠️ 重量軌跡記錄失敗，已停用：{e}")
+                self._recorder = None
+        if self._publisher is not None:
+            self._publisher.publish(
+                ts, frame.weight, raw, frame.unit, frame.stable, frame.net, self._status, self.stability,
+            )
+
+    def _heartbeat(self):
+        """沒有新讀數時通知共享看板目前狀態（其他程序據此判斷擁有者仍在運作）"""
+        if self._publisher is not None:
+            self._publisher.heartbeat(self._status)
+
+    def _disconnect(self, ser):
+        try:
+            ser.close()
+        except Exception:
+            pass
+        self._clear_connection()
+
+    def _clear_connection(self):
+        """通知連線來源捨棄目前（或快取的失敗）連線，下次重試時重新開啟串口"""
+        if self._on_disconnect is not None:
+            try:
+                self._on_disconnect()
+            except Exception:
+                pass
+
+    def _run(self):
+        parser = self._parser
+        framer = parser.framer()
+        while not self._stop_event.is_set():
+            try:
+                ser = self._connect()
+            except Exception as e:
+                ser = None
+                self._status = f"連線失敗: {e}"
+            if ser is None:
+                if not self._status.startswith("連線失敗"):
+                    self._status = "連線失敗: 無法建立串口連接"
+                # [關鍵修正] 連線來源可能快取了失敗結果（st.cache_resource 會快取 None），清除後才會真正重試
+                self._clear_connection()
+                self._heartbeat()
+                self._stop_event.wait(self._reconnect_delay)
+                continue
+
+            self._status = "正常連線"
+            framer.clear()
+            if self._detector is not None:
+                self._detector.reset()
+            try:
+                while not self._stop_event.is_set():
+                    # 以 read(timeout) 阻塞等待資料，不需要 sleep 輪詢
+                    chunk = ser.read(ser.in_waiting or 1)
+                    if not chunk:
+                        self._heartbeat()
+                        continue
+                    for raw in framer.feed(chunk):
+                        frame = parser.parse(raw)
+                        if frame is not None:
+                            self._push(frame, raw)
+            except serial.SerialException as e:
+                self._status = f"串口錯誤: {e}"
+                print(f"⚠️ 磅秤串口讀取錯誤，將重新連線：{e}")
+                self._disconnect(ser)
+                self._heartbeat()
+                self._stop_event.wait(self._reconnect_delay)
+            except Exception as e:
+                self._status = f"讀取失敗: {e}"
+                print(f"⚠️ 磅秤讀取時發生錯誤，將重新連線：{e}")
+                self._disconnect(ser)
+                self._heartbeat()
+                self._stop_event.wait(self._reconnect_delay)
@@ -0,0 +1,393 @@
+"""
+虛擬磅秤模擬器（Linux pseudo-terminal）
+開啟一個 pty，以設定的頻率寫入儀表格式的重量框架，重播內建情境或錄製的重量軌跡，
+讓 get_serial_connection() 與整個秤重紀錄流程不需要 COM5 也能在筆電上測試
+
+執行：
+python scale_simulator.py --trace cycle --rate 10 --protocol csv --link /tmp/ttySCALE
+
+接著將 config.SCALE_PORT 指向 /tmp/ttySCALE（或啟動前設定環境變數 SCALE_PORT=/tmp/ttySCALE），
+config.SCALE_PROTOCOL 設為相同協定後啟動系統即可
+
+內建情境（--trace）：
+- cycle        : 放上物品 → 晃動 → 穩定保持 → 移除，反覆循環
+- early_remove : 物品尚未穩定就被移除（作業員過早拿走）
+- noise        : 穩定但雜訊較大（接近穩定容差）
+- disconnect   : 正常循環中夾雜斷線（關閉 pty，數秒後以同一個 --link 路徑重新建立）與亂碼，
+                 讀取端會收到串口錯誤並重新連線
+- 其他值視為軌跡檔路徑（CSV：秒數,重量[,穩定旗標]，或 trace_recorder 錄製的 .sctr/.sctr.gz）；
+  沒有穩定旗標的樣本以「不穩定」送出，由讀取端自行判斷穩定
+"""
+
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+import time
+
+# 模擬器產生的一筆樣本：weight 為 None 表示不送資料，garbage 表示送出亂碼，
+# unplug / replug 表示關閉 pty（拔線）與重新建立 pty（插回）
+SILENCE = None
+GARBAGE = "GARBAGE"
+UNPLUG = "UNPLUG"
+REPLUG = "REPLUG"
+
+
+# ==========================================
+# 1. 框架格式
+# ==========================================
+def format_frame(protocol, weight, stable=True, net=False):
+    """依協定產生一個框架（bytes）"""
+    sign = "-" if weight < 0 else "+"
+    value = abs(weight)
+    if protocol == "csv":
+        head = "ST" if stable else "US"
+        mode = "NT" if net else "GS"
+        return f"{head},{mode},{sign}{value:07.2f}kg\r\n".encode("ascii")
+    if protocol == "and":
+        head = "ST" if stable else "US"
+        return f"{head},{sign}{value:08.2f}  kg\r\n".encode("ascii")
+    if protocol == "toledo":
+        # SWA：小數點兩位（代碼 4）；SWB：bit0 淨重、bit1 負號、bit3 不穩定、bit4 kg
+        swa = 0x20 | 0x04
+        swb = 0x20 | 0x10
+        if net:
+            swb |= 0x01
+        if weight < 0:
+            swb |= 0x02
+        if not stable:
+            swb |= 0x08
+        digits = f"{int(round(value * 100)):06d}"[-6:]
+        return b"\x02" + bytes([swa, swb, 0x20]) + digits.encode("ascii") + b"000000\r"
+    # generic
+    return f"{weight:.2f} kg\r\n".encode("ascii")
+
+
+# ==========================================
+# 2. 重量軌跡
+# ==========================================
+class TraceBuilder:
+    """
+    以固定取樣頻率組合重量軌跡
+    每個樣本為 (weight, stable)，weight 為 SILENCE 時代表沒有資料、GARBAGE 代表亂碼、
+    UNPLUG / REPLUG 代表拔線與插回
+    """
+
+    def __init__(self, rate=10.0, seed=None):
+        self.rate = rate
+        self.samples = []
+        self.rng = random.Random(seed)
+        self._last = 0.0
+
+    def _n(self, seconds):
+        return max(1, int(round(seconds * self.rate)))
+
+    def empty(self, seconds=1.0, noise=0.01):
+        """空秤"""
+        for _ in range(self._n(seconds)):
+            self.samples.append((round(abs(self.rng.gauss(0, noise)), 2), True))
+        self._last = 0.0
+        return self
+
+    def place(self, target, seconds=0.5):
+        """放上物品：重量快速上升並帶有過衝"""
+        n = self._n(seconds)
+        start = self._last
+        for k in range(1, n + 1):
+            x = k / n
+            overshoot = 0.08 * target * math.sin(math.pi * x)
+            self.samples.append((round(start + (target - start) * x + overshoot, 2), False))
+        self._last = target
+        return self
+
+    def settle(self, target, seconds=0.8, amplitude=0.6):
+        """晃動收斂：衰減振盪直到接近目標值"""
+        n = self._n(seconds)
+        for k in range(n):
+            decay = math.exp(-4.0 * k / n)
+            w = target + amplitude * decay * math.sin(k * 2.2) + self.rng.gauss(0, 0.01)
+            self.samples.append((round(w, 2), False))
+        self._last = target
+        return self
+
+    def hold(self, target, seconds=2.0, noise=0.01):
+        """穩定保持"""
+        for _ in range(self._n(seconds)):
+            self.samples.append((round(target + self.rng.gauss(0, noise), 2), True))
+        self._last = target
+        return self
+
+    def noisy(self, target, seconds=2.0, amplitude=0.12):
+        """雜訊較大的保持（例如產線震動、風扇）"""
+        for _ in range(self._n(seconds)):
+            w = target + self.rng.uniform(-amplitude, amplitude)
+            self.samples.append((round(w, 2), amplitude < 0.05))
+        self._last = target
+        return self
+
+    def remove(self, seconds=0.4):
+        """移除物品：重量下降到 0"""
+        n = self._n(seconds)
+        start = self._last
+        for k in range(1, n + 1):
+            self.samples.append((round(start * (1 - k / n), 2), False))
+        self._last = 0.0
+        return self
+
+    def silence(self, seconds=3.0):
+        """一段時間沒有任何資料（連線仍在）"""
+        for _ in range(self._n(seconds)):
+            self.samples.append((SILENCE, False))
+        return self
+
+    def disconnect(self, seconds=3.0):
+        """斷線：關閉串口，seconds 秒後重新建立"""
+        self.samples.append((UNPLUG, False))
+        self.silence(seconds)
+        self.samples.append((REPLUG, False))
+        return self
+
+    def garbage(self, count=3):
+        """亂碼（例如接觸不良或鮑率錯誤）"""
+        for _ in range(count):
+            self.samples.append((GARBAGE, False))
+        return self
+
+    def piece(self, target):
+        """完整的一件：放上 → 晃動 → 穩定 → 移除 → 空秤"""
+        return (self.place(target)
+                .settle(target)
+                .hold(target, seconds=self.rng.uniform(1.5, 3.0))
+                .remove()
+                .empty(self.rng.uniform(0.8, 1.5)))
+
+
+def _target(rng, base=25.2, spread=0.3):
+    return round(base + rng.uniform(-spread, spread), 2)
+
+
+def build_scenario(name, rate=10.0, pieces=5, base=25.2, seed=None):
+    """產生內建情境的樣本列表"""
+    b = TraceBuilder(rate=rate, seed=seed)
+    b.empty(1.0)
+    for i in range(pieces):
+        t = _target(b.rng, base)
+        if name == "cycle":
+            b.piece(t)
+        elif name == "early_remove":
+            if i % 2 == 0:
+                # 物品尚未穩定就被拿走
+                b.place(t).settle(t, seconds=0.3).remove(0.2).empty(1.0)
+            else:
+                b.piece(t)
+        elif name == "noise":
+            b.place(t).settle(t).noisy(t, seconds=2.5).remove().empty(1.0)
+        elif name == "disconnect":
+            b.piece(t)
+            if i % 2 == 1:
+                b.disconnect(3.0).garbage()
+        else:
+            raise ValueError(f"未知的模擬情境：{name}")
+    return b.samples
+
+
+def load_trace_file(path):
+    """
+    讀取錄製的重量軌跡（CSV：秒數,重量[,穩定旗標]，或 trace_recorder 的二進位檔）
+    回傳 [(seconds, weight, stable), ...]，stable 缺少時為 None（重播時以不穩定送出）
+    """
+    if path.endswith((".sctr", ".sctr.gz")):
+        from trace_recorder import iter_records
+        return [(t, round(w, 3), stable) for t, w, stable in iter_records(path)]
+
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if not row or row[0].strip().startswith("#"):
+                continue
+            try:
+                t = float(row[0])
+                w = float(row[1])
+            except (ValueError, IndexError):
+                continue  # 標題列或格式錯誤
+            stable = None
+            if len(row) > 2 and row[2].strip() != "":
+                stable = row[2].strip().lower() in ("1", "true", "st")
+            rows.append((t, w, stable))
+    return rows
+
+
+# ==========================================
+# 3. pty 輸出
+# ==========================================
+class PtyScale:
+    """
+    開啟 pseudo-terminal 的虛擬磅秤
+    讀取端（pyserial）開啟 slave_name；模擬器寫入 master 端
+    """
+
+    def __init__(self, protocol="generic", link=None):
+        self.protocol = protocol
+        self.link = link
+        self.master = self._slave = None
+        self.slave_name = None
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.unplugs = 0
+        self._open()
+
+    def _open(self):
+        import pty
+        import tty
+
+        self.master, self._slave = pty.openpty()
+        # raw 模式：避免終端把 CR 轉成 LF 或回顯
+        tty.setraw(self._slave)
+        os.set_blocking(self.master, False)
+        self.slave_name = os.ttyname(self._slave)
+        if self.link:
+            try:
+                self._remove_link()
+                os.symlink(self.slave_name, self.link)
+            except OSError as e:
+                print(f"⚠️ 無法建立連結 {self.link}：{e}")
+                self.link = None
+
+    def _remove_link(self):
+        if self.link and os.path.islink(self.link):
+            try:
+                os.remove(self.link)
+            except OSError:
+                pass
+
+    def _close_fds(self):
+        for fd in (self.master, self._slave):
+            if fd is None:
+                continue
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.master = self._slave = None
+
+    @property
+    def connected(self):
+        return self.master is not None
+
+    def unplug(self):
+        """拔線：關閉 pty（讀取端的 read 會發生錯誤），連結一併移除，讀取端暫時無法重新開啟"""
+        self._close_fds()
+        self._remove_link()
+        self.unplugs += 1
+
+    def replug(self):
+        """插回：建立新的 pty 並重新指向 --link（沒有 --link 時裝置名稱可能改變）"""
+        if self.connected:
+            return
+        self._open()
+        print(f"🔌 虛擬磅秤已重新連接：{self.port}")
+
+    @property
+    def port(self):
+        return self.link or self.slave_name
+
+    def write_sample(self, weight, stable):
+        if weight == UNPLUG:
+            self.unplug()
+            return
+        if weight == REPLUG:
+            self.replug()
+            return
+        if weight is SILENCE or not self.connected:
+            return
+        if weight == GARBAGE:
+            data = bytes(random.randrange(256) for _ in range(12))
+        else:
+            data = format_frame(self.protocol, weight, stable)
+        try:
+            os.write(self.master, data)
+            self.frames_sent += 1
+        except BlockingIOError:
+            # 沒有人讀取時緩衝區會滿，真實儀表也會直接丟棄
+            self.frames_dropped += 1
+        # 丟棄讀取端寫回的資料（例如 pyserial 的控制字元）
+        try:
+            os.read(self.master, 1024)
+        except (BlockingIOError, OSError):
+            pass
+
+    def close(self):
+        self._close_fds()
+        self._remove_link()
+
+
+def run(scale, samples, rate, loop=False):
+    """以固定頻率送出樣本（使用絕對時間排程，避免累積誤差）"""
+    interval = 1.0 / rate
+    while True:
+        next_t = time.monotonic()
+        for weight, stable in samples:
+            scale.write_sample(weight, stable)
+            next_t += interval
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if not loop:
+            break
+
+
+def replay(scale, rows, loop=False):
+    """依錄製的時間戳重播軌跡"""
+    while True:
+        if not rows:
+            return
+        t0 = time.monotonic() - rows[0][0]
+        for t, w, stable in rows:
+            delay = t0 + t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            # 軌跡沒有記錄穩定旗標時送出「不穩定」，不替錄製資料假造穩定狀態
+            scale.write_sample(w, bool(stable))
+        if not loop:
+            break
+
+
+def main(argv=None):
+    if not sys.platform.startswith("linux"):
+        raise SystemExit("虛擬磅秤需要 Linux pseudo-terminal（pty）")
+
+    parser = argparse.ArgumentParser(description="虛擬磅秤模擬器")
+    parser.add_argument("--trace", default="cycle", help="情境名稱（cycle/early_remove/noise/disconnect）或軌跡檔路徑")
+    parser.add_argument("--rate", type=float, default=10.0, help="輸出頻率（Hz）")
+    parser.add_argument("--protocol", default="csv", choices=["generic", "csv", "and", "toledo"])
+    parser.add_argument("--pieces", type=int, default=5, help="每輪模擬的件數")
+    parser.add_argument("--weight", type=float, default=25.2, help="物品標準重量（kg）")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--link", default=None, help="建立指向 pty 的固定路徑（例如 /tmp/ttySCALE）")
+    parser.add_argument("--once", action="store_true", help="只播放一輪（預設無限循環）")
+    args = parser.parse_args(argv)
+
+    scale = PtyScale(protocol=args.protocol, link=args.link)
+    print(f"⚖️ 虛擬磅秤已啟動：{scale.port}（協定 {args.protocol}，{args.rate:g} Hz）")
+    print(f"   請設定 config.SCALE_PORT = \"{scale.port}\"、SCALE_PROTOCOL = \"{args.protocol}\"")
+    try:
+        if os.path.exists(args.trace):
+            rows = load_trace_file(args.trace)
+            print(f"▶️ 重播軌跡檔：{args.trace}（{len(rows)} 筆）")
+            replay(scale, rows, loop=not args.once)
+        else:
+            samples = build_scenario(args.trace, rate=args.rate, pieces=args.pieces,
+                                     base=args.weight, seed=args.seed)
+            print(f"▶️ 模擬情境：{args.trace}（{len(samples) / args.rate:.1f} 秒/輪）")
+            run(scale, samples, args.rate, loop=not args.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"⏹️ 已停止：送出 {scale.frames_sent} 筆，丟棄 {scale.frames_dropped} 筆，斷線 {scale.unplugs} 次")
+        scale.close()
+
+
+if __name__ == "__main__":
+    main()
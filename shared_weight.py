@@ -0,0 +1,283 @@
+"""
+磅秤讀數共享記憶體模組
+同一台平板上可能同時執行多個 Streamlit 程序（或多個分頁連到不同程序），
+若每個程序都各自開啟串口，會互相搶奪 COM5 的資料。
+
+本模組以檔案鎖選出唯一的「擁有者」程序：只有擁有者開啟串口並執行 ScaleReader，
+每筆讀數寫入一小塊 mmap 共享記憶體（seqlock 保護）；其他程序只讀取共享記憶體，
+不需要加鎖，也完全不碰串口。擁有者結束後（心跳逾時），其他程序會自動接手。
+
+共享記憶體格式：
+    [0:8]   MAGIC
+    [8:16]  seq（<Q，寫入中為奇數；讀取前後 seq 相同且為偶數才是完整資料）
+    [16:]   PAYLOAD（見 _PAYLOAD）
+
+時間戳一律為 time.monotonic()（系統層級的單調時鐘，跨程序可比較）
+"""
+
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+
+from scale_reader import ScaleReading
+from stability import EMPTY_STATE, StabilityState
+
+try:
+    import fcntl  # Unix/Linux
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt  # Windows
+except ImportError:
+    msvcrt = None
+
+MAGIC = b"SCWGHT01"
+_SEQ = struct.Struct("<Q")
+_SEQ_OFFSET = len(MAGIC)
+_PAYLOAD_OFFSET = _SEQ_OFFSET + _SEQ.size
+# 心跳, 時間戳, 重量, 穩定旗標, 淨重旗標, 單位, 原始框架, 狀態,
+# 穩定判斷（是否穩定, 穩定值, 穩定耗時, 平均, 標準差, 窗長, 筆數, 時間戳）
+_PAYLOAD = struct.Struct("<dddbb8s48s96sbdddddId")
+SIZE = _PAYLOAD_OFFSET + _PAYLOAD.size
+# 讀取到寫入中的資料時，重試前等待的秒數（寫入一筆只需數微秒）
+_RETRY_PAUSE = 0.0002
+
+_NAN = float("nan")
+
+
+def _flag(value):
+    return -1 if value is None else (1 if value else 0)
+
+
+def _unflag(value):
+    return None if value < 0 else bool(value)
+
+
+def _opt(value):
+    return _NAN if value is None else value
+
+
+def _unopt(value):
+    return None if math.isnan(value) else value
+
+
+def _text(value, size):
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return value[:size]
+
+
+def _untext(value):
+    # 截斷後不完整的 UTF-8 字元直接忽略
+    return value.rstrip(b"\x00").decode("utf-8", errors="ignore")
+
+
+class SharedWeightBoard:
+    """
+    共享記憶體讀數看板
+
+    參數:
+        path: 共享記憶體檔案路徑（本機，例如 /dev/shm 或暫存目錄）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock_handle = None
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if os.fstat(fd).st_size < SIZE:
+                os.ftruncate(fd, SIZE)
+            self._mm = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+
+    @property
+    def is_owner(self):
+        return self._lock_handle is not None
+
+    def try_acquire_owner(self):
+        """嘗試成為擁有者（非阻塞檔案鎖，程序結束時由作業系統自動釋放）"""
+        if self._lock_handle is not None:
+            return True
+        handle = open(self.path + ".lock", "a+b")
+        try:
+            if sys.platform == "win32" and msvcrt:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+            elif fcntl:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._lock_handle = handle
+        # [關鍵修正] 前一個擁有者可能在寫入中途結束，seq 停在奇數；接手時先補成偶數，
+        # 否則之後每次寫入完成都會是奇數，所有讀取端永遠讀不到完整資料
+        seq = _SEQ.unpack_from(self._mm, _SEQ_OFFSET)[0]
+        if seq & 1:
+            _SEQ.pack_into(self._mm, _SEQ_OFFSET, seq + 1)
+        self._mm[0:len(MAGIC)] = MAGIC
+        return True
+
+    # ------------------------------------------
+    # 寫入端（僅擁有者的讀取執行緒）
+    # ------------------------------------------
+    def _begin(self):
+        seq = _SEQ.unpack_from(self._mm, _SEQ_OFFSET)[0] + 1
+        _SEQ.pack_into(self._mm, _SEQ_OFFSET, seq)
+        return seq
+
+    def _end(self, seq):
+        _SEQ.pack_into(self._mm, _SEQ_OFFSET, seq + 1)
+
+    def publish(self, timestamp, weight, raw, unit, stable, net, status, state=None):
+        """發布一筆讀數（含連線狀態與穩定判斷結果）"""
+        state = state or EMPTY_STATE
+        seq = self._begin()
+        _PAYLOAD.pack_into(
+            self._mm, _PAYLOAD_OFFSET,
+            time.monotonic(), timestamp, weight, _flag(stable), _flag(net),
+            _text(unit or "", 8), _text(raw.strip(), 48), _text(status, 96),
+            _flag(state.is_stable), _opt(state.settled_value), _opt(state.time_to_settle),
+            state.mean, state.std, state.span, state.count, _opt(state.timestamp),
+        )
+        self._end(seq)
+
+    def heartbeat(self, status):
+        """沒有新讀數時更新心跳與連線狀態（讓其他程序知道擁有者仍在運作）"""
+        seq = self._begin()
+        fields = list(_PAYLOAD.unpack_from(self._mm, _PAYLOAD_OFFSET))
+        fields[0] = time.monotonic()
+        fields[7] = _text(status, 96)
+        _PAYLOAD.pack_into(self._mm, _PAYLOAD_OFFSET, *fields)
+        self._end(seq)
+
+    # ------------------------------------------
+    # 讀取端（任何程序，不加鎖）
+    # ------------------------------------------
+    def read(self, retries=100):
+        """
+        讀取最新內容
+
+        回傳:
+            (ScaleReading 或 None, 狀態文字, StabilityState, 心跳時間)；
+            看板尚未初始化或持續讀到寫入中的資料時回傳 None
+        """
+        mm = self._mm
+        if mm[0:len(MAGIC)] != MAGIC:
+            return None
+        for attempt in range(retries):
+            if attempt:
+                # 寫入端正在更新：稍等再讀，避免空轉佔用 CPU
+                time.sleep(_RETRY_PAUSE)
+            seq1 = _SEQ.unpack_from(mm, _SEQ_OFFSET)[0]
+            if seq1 & 1:
+                continue
+            fields = _PAYLOAD.unpack_from(mm, _PAYLOAD_OFFSET)
+            if _SEQ.unpack_from(mm, _SEQ_OFFSET)[0] == seq1:
+                break
+        else:
+            return None
+
+        (beat, ts, weight, stable, net, unit, raw, status,
+         is_stable, settled, tts, mean, std, span, count, state_ts) = fields
+        reading = None
+        if ts > 0:
+            reading = ScaleReading(ts, weight, _untext(raw), _untext(unit) or None, _unflag(stable), _unflag(net))
+        state = StabilityState(
+            bool(is_stable > 0), _unopt(settled), _unopt(tts), mean, std, span, count, _unopt(state_ts),
+        )
+        return reading, _untext(status) or "連線中", state, beat
+
+    def close(self):
+        try:
+            self._mm.close()
+        except Exception:
+            pass
+        if self._lock_handle is not None:
+            self._lock_handle.close()
+            self._lock_handle = None
+
+
+class SharedScaleView:
+    """
+    共享磅秤讀數（介面與 ScaleReader 相同：latest / status / stability / is_running / start）
+
+    擁有者程序：以 reader_factory(publisher=board) 建立真正的 ScaleReader 並轉呼叫
+    其他程序：讀取共享記憶體；擁有者心跳超過 takeover_after 秒未更新時嘗試接手
+
+    參數:
+        board: SharedWeightBoard
+        reader_factory: 建立 ScaleReader 的函數（接受 publisher 參數）
+        takeover_after: 擁有者心跳逾時秒數
+    """
+
+    def __init__(self, board, reader_factory, takeover_after=3.0):
+        self._board = board
+        self._factory = reader_factory
+        self._takeover_after = takeover_after
+        self._reader = None
+        self._last_takeover_check = 0.0
+        self._try_takeover()
+
+    def _try_takeover(self):
+        if self._board.try_acquire_owner():
+            self._reader = self._factory(publisher=self._board)
+            self._reader.start()
+            print(f"⚖️ 本程序負責讀取磅秤（共享讀數：{self._board.path}）")
+
+    def _snapshot(self):
+        snap = self._board.read()
+        if self._reader is None:
+            now = time.monotonic()
+            stale = snap is None or now - snap[3] > self._takeover_after
+            if stale and now - self._last_takeover_check >= 1.0:
+                self._last_takeover_check = now
+                self._try_takeover()
+        return snap
+
+    @property
+    def is_owner(self):
+        return self._reader is not None
+
+    @property
+    def is_running(self):
+        if self._reader is not None:
+            return self._reader.is_running
+        return True
+
+    def start(self):
+        if self._reader is not None:
+            self._reader.start()
+
+    def latest(self):
+        if self._reader is not None:
+            return self._reader.latest()
+        snap = self._snapshot()
+        if self._reader is not None:
+            return self._reader.latest()
+        if snap is None or snap[0] is None:
+            return None, None
+        reading = snap[0]
+        return reading, time.monotonic() - reading.timestamp
+
+    @property
+    def status(self):
+        if self._reader is not None:
+            return self._reader.status
+        snap = self._snapshot()
+        if snap is None:
+            return "連線中"
+        if time.monotonic() - snap[3] > self._takeover_after:
+            return "連線失敗: 磅秤讀取程序無回應"
+        return snap[1]
+
+    @property
+    def stability(self):
+        if self._reader is not None:
+            return self._reader.stability
+        snap = self._snapshot()
+        return snap[2] if snap is not None else EMPTY_STATE
@@ -0,0 +1,209 @@
+"""
+重量穩定判斷引擎
+以時間窗保存最近的讀數（預先配置的環狀陣列），每筆讀數以 O(1)（攤銷）
+更新滾動平均、變異數與最小/最大值，在磅秤讀取執行緒中以儀表原生頻率判斷穩定
+"""
+
+import math
+from array import array
+from collections import deque, namedtuple
+
+import config
+
+# 判斷結果快照（每筆讀數整體替換，UI 執行緒讀取時不需要加鎖）
+# settled_value: 進入穩定時的窗內平均值；time_to_settle: 從開始變動到判定穩定的秒數
+StabilityState = namedtuple(
+    "StabilityState",
+    ["is_stable", "settled_value", "time_to_settle", "mean", "std", "span", "count", "timestamp"],
+)
+
+EMPTY_STATE = StabilityState(False, None, None, 0.0, 0.0, 0.0, 0, None)
+
+DEFAULT_SETTINGS = {
+    "window_seconds": 0.3,  # 判斷穩定所需的時間窗長度（秒）
+    "tolerance": 0.15,      # 窗內最大值與最小值的容許差（kg）
+    "min_samples": 3,       # 窗內至少需要的讀數筆數
+    "min_weight": 0.1,      # 低於此重量視為空秤，不判定穩定
+    "capacity": 64,         # 環狀陣列大小（需大於 時間窗 x 儀表輸出頻率）
+}
+
+
+def settings_for_line(line_name=None):
+    """取得產線的穩定判斷參數（預設值 + config.STABILITY_SETTINGS 的覆寫）"""
+    settings = dict(DEFAULT_SETTINGS)
+    overrides = getattr(config, "STABILITY_SETTINGS", {})
+    settings.update(overrides.get("default", {}))
+    if line_name:
+        settings.update(overrides.get(line_name, {}))
+    return settings
+
+
+class StabilityDetector:
+    """
+    時間窗穩定判斷器
+
+    使用方式：
+        det = StabilityDetector(**settings_for_line("Line 1"))
+        det.add(time.monotonic(), weight)
+        det.is_stable / det.settled_value / det.time_to_settle
+    """
+
+    def __init__(self, window_seconds=0.3, tolerance=0.15, min_samples=3, min_weight=0.1, capacity=64):
+        self.window_seconds = window_seconds
+        self.tolerance = tolerance
+        self.min_samples = min_samples
+        self.min_weight = min_weight
+
+        # 預先配置的環狀陣列
+        self._cap = capacity
+        self._ts = array('d', [0.0] * capacity)
+        self._vals = array('d', [0.0] * capacity)
+        self._head = 0   # 最舊一筆的序號
+        self._tail = 0   # 下一筆要寫入的序號
+
+        # 滾動統計（以第一筆讀數為基準平移，減少大數相減的誤差）
+        self._offset = None
+        self._sum = 0.0
+        self._sumsq = 0.0
+        # 單調佇列（序號, 值），用於 O(1) 攤銷的最小/最大值
+        self._min_q = deque()
+        self._max_q = deque()
+
+        self._stable = False
+        self._motion_start = None
+        self._settled_value = None
+        self._time_to_settle = None
+        self.state = EMPTY_STATE
+
+    # ------------------------------------------
+    # 查詢介面
+    # ------------------------------------------
+    @property
+    def is_stable(self):
+        return self.state.is_stable
+
+    @property
+    def settled_value(self):
+        return self.state.settled_value
+
+    @property
+    def time_to_settle(self):
+        return self.state.time_to_settle
+
+    @property
+    def count(self):
+        return self._tail - self._head
+
+    @property
+    def mean(self):
+        n = self.count
+        return (self._sum / n + self._offset) if n else 0.0
+
+    @property
+    def variance(self):
+        n = self.count
+        if n < 2:
+            return 0.0
+        m = self._sum / n
+        return max(self._sumsq / n - m * m, 0.0)
+
+    @property
+    def minimum(self):
+        return self._min_q[0][1] if self._min_q else 0.0
+
+    @property
+    def maximum(self):
+        return self._max_q[0][1] if self._max_q else 0.0
+
+    # ------------------------------------------
+    # 更新
+    # ------------------------------------------
+    def reset(self):
+        """清空時間窗（例如重新連線後）"""
+        self._head = self._tail = 0
+        self._offset = None
+        self._sum = self._sumsq = 0.0
+        self._min_q.clear()
+        self._max_q.clear()
+        self._stable = False
+        self._motion_start = None
+        self._settled_value = None
+        self._time_to_settle = None
+        self.state = EMPTY_STATE
+
+    def _evict_oldest(self):
+        i = self._head % self._cap
+        v = self._vals[i] - self._offset
+        self._sum -= v
+        self._sumsq -= v * v
+        if self._min_q and self._min_q[0][0] == self._head:
+            self._min_q.popleft()
+        if self._max_q and self._max_q[0][0] == self._head:
+            self._max_q.popleft()
+        self._head += 1
+
+    def add(self, timestamp, weight):
+        """加入一筆讀數並更新穩定狀態，回傳最新的 StabilityState"""
+        if self._offset is None:
+            self._offset = weight
+
+        # 移出時間窗外或超出陣列容量的舊讀數（每筆只會被移出一次）
+        # 保留一筆恰好落在時間窗起點之前的讀數，讓窗長可以完整涵蓋 window_seconds
+        cutoff = timestamp - self.window_seconds
+        cap = self._cap
+        while self._tail - self._head >= cap or (
+            self._tail - self._head >= 2 and self._ts[(self._head + 1) % cap] <= cutoff
+        ):
+            self._evict_oldest()
+
+        seq = self._tail
+        i = seq % self._cap
+        self._ts[i] = timestamp
+        self._vals[i] = weight
+        self._tail += 1
+        v = weight - self._offset
+        self._sum += v
+        self._sumsq += v * v
+        while self._min_q and self._min_q[-1][1] >= weight:
+            self._min_q.pop()
+        self._min_q.append((seq, weight))
+        while self._max_q and self._max_q[-1][1] <= weight:
+            self._max_q.pop()
+        self._max_q.append((seq, weight))
+
+        n = self._tail - self._head
+        span = timestamp - self._ts[self._head % self._cap]
+        loaded = weight > self.min_weight
+
+        if not loaded:
+            # 空秤：重置變動起點，下一次放上物品時重新計時
+            self._stable = False
+            self._motion_start = None
+        else:
+            if self._motion_start is None:
+                self._motion_start = timestamp
+            window_ok = (
+                n >= self.min_samples
+                and span >= self.window_seconds - 1e-3
+                and (self._max_q[0][1] - self._min_q[0][1]) <= self.tolerance
+            )
+            if window_ok and not self._stable:
+                self._stable = True
+                self._settled_value = self.mean
+                self._time_to_settle = timestamp - self._motion_start
+            elif not window_ok and self._stable:
+                # 穩定後又開始變動（例如換上下一件）
+                self._stable = False
+                self._motion_start = timestamp
+
+        self.state = StabilityState(
+            self._stable,
+            self._settled_value if self._stable else None,
+            self._time_to_settle,
+            self.mean,
+            math.sqrt(self.variance),
+            span,
+            n,
+            timestamp,
+        )
+        return self.state
@@ -0,0 +1,107 @@
+"""
+scale_protocols 的分框與解析測試（不需要串口）
+"""
+
+import pytest
+
+from scale_protocols import FrameBuffer, ScaleFrame, get_protocol
+from scale_simulator import format_frame
+
+
+def _feed_all(framer, chunks):
+    frames = []
+    for chunk in chunks:
+        frames.extend(framer.feed(chunk))
+    return frames
+
+
+# ==========================================
+# FrameBuffer
+# ==========================================
+def test_frame_buffer_splits_lines_and_skips_empty():
+    fb = FrameBuffer()
+    assert fb.feed(b"ST,GS,+0025.30kg\r\nUS,GS,+0001.00kg\r\n\r\n") == [
+        b"ST,GS,+0025.30kg",
+        b"US,GS,+0001.00kg",
+    ]
+
+
+def test_frame_buffer_keeps_partial_frame_until_completed():
+    fb = FrameBuffer()
+    assert fb.feed(b"ST,GS,+00") == []
+    assert fb.feed(b"25.30k") == []
+    assert fb.feed(b"g\r\nUS") == [b"ST,GS,+0025.30kg"]
+    assert fb.feed(b",GS,+0000.10kg\n") == [b"US,GS,+0000.10kg"]
+
+
+def test_frame_buffer_byte_by_byte_matches_single_feed():
+    data = b"ST,GS,+0025.30kg\r\nUS,NT,-0000.12kg\r\n"
+    assert _feed_all(FrameBuffer(), [data[i:i + 1] for i in range(len(data))]) == FrameBuffer().feed(data)
+
+
+def test_frame_buffer_drops_oversized_garbage():
+    fb = FrameBuffer(max_len=16)
+    assert fb.feed(b"\xff" * 40) == []
+    # 丟棄後可以正常接收下一個框架
+    assert fb.feed(b"\r\nST,GS,+0025.30kg\r\n") == [b"ST,GS,+0025.30kg"]
+
+
+def test_frame_buffer_with_start_byte_discards_leading_noise():
+    fb = get_protocol("toledo").framer()
+    frame = format_frame("toledo", 25.3)
+    assert fb.feed(b"noise" + frame[:5]) == []
+    assert fb.feed(frame[5:]) == [frame[1:-1]]
+
+
+# ==========================================
+# 解析器
+# ==========================================
+@pytest.mark.parametrize("protocol", ["csv", "and", "toledo"])
+@pytest.mark.parametrize("weight,stable", [(25.3, True), (25.3, False), (-0.12, True)])
+def test_round_trip_with_simulator_frames(protocol, weight, stable):
+    parser = get_protocol(protocol)
+    frames = parser.framer().feed(format_frame(protocol, weight, stable))
+    assert len(frames) == 1
+    result = parser.parse(frames[0])
+    assert result.weight == pytest.approx(weight)
+    assert result.unit == "kg"
+    assert result.stable is stable
+
+
+def test_generic_parser_has_no_stability_flag():
+    parser = get_protocol("generic")
+    assert parser.parse(b"  -1.50 kg") == ScaleFrame(-1.5, "kg", None, None)
+    assert parser.parse(b"abc") is None
+    assert parser.parse(b"no weight here") is None
+
+
+def test_status_header_parser_modes_and_overload():
+    parser = get_protocol("csv")
+    assert parser.parse(b"ST,NT,+0001.20kg") == ScaleFrame(1.2, "kg", True, True)
+    assert parser.parse(b"US,GS,+0001.20kg").net is False
+    assert parser.parse(b"ST,+00025.30  kg").net is None
+    assert parser.parse(b"OL,GS,+9999.99kg") is None
+    assert parser.parse(b"\x00\xfe\x13garbage") is None
+
+
+def test_toledo_parser_rejects_short_or_out_of_range_frames():
+    parser = get_protocol("toledo")
+    frame = format_frame("toledo", 25.3)[1:-1]
+    assert parser.parse(frame[:8]) is None
+    out_of_range = frame[:1] + bytes([frame[1] | 0x04]) + frame[2:]
+    assert parser.parse(out_of_range) is None
+    bad_digits = frame[:3] + b"00x000" + frame[9:]
+    assert parser.parse(bad_digits) is None
+
+
+def test_garbage_between_frames_is_skipped():
+    parser = get_protocol("csv")
+    framer = parser.framer()
+    data = b"ST,GS,+0025.30kg\r\n\x8a\x13\xff\r\nUS,GS,+0025.10kg\r\n"
+    parsed = [parser.parse(f) for f in _feed_all(framer, [data[:20], data[20:]])]
+    assert [p.weight for p in parsed if p is not None] == [25.3, 25.1]
+
+
+def test_unknown_protocol_raises():
+    with pytest.raises(ValueError):
+        get_protocol("modbus")
@@ -0,0 +1,87 @@
+"""
+stability.StabilityDetector 的穩定判斷測試（以固定時間戳餵入讀數）
+"""
+
+import pytest
+
+from stability import EMPTY_STATE, StabilityDetector
+
+
+def _feed(det, weights, start=0.0, rate=10.0):
+    """以固定頻率餵入讀數，回傳最後的狀態與結束時間"""
+    state = None
+    t = start
+    for w in weights:
+        state = det.add(t, w)
+        t += 1.0 / rate
+    return state, t
+
+
+def _detector(**kwargs):
+    settings = dict(window_seconds=0.3, tolerance=0.15, min_samples=3, min_weight=0.1, capacity=64)
+    settings.update(kwargs)
+    return StabilityDetector(**settings)
+
+
+def test_settles_after_window_within_tolerance():
+    det = _detector()
+    state, _ = _feed(det, [5.0, 18.0, 26.5, 24.8, 25.3])
+    assert not state.is_stable
+    state, _ = _feed(det, [25.20, 25.22, 25.18, 25.21], start=0.5)
+    assert state.is_stable
+    assert state.settled_value == pytest.approx(25.2, abs=0.05)
+    # 從開始變動（第一筆有重量的讀數）到判定穩定
+    assert state.time_to_settle == pytest.approx(0.8, abs=1e-6)
+
+
+def test_needs_full_window_before_settling():
+    det = _detector(window_seconds=0.5)
+    state, _ = _feed(det, [25.2, 25.2, 25.2])  # 只涵蓋 0.2 秒
+    assert not state.is_stable
+    state, _ = _feed(det, [25.2, 25.2, 25.2], start=0.3)
+    assert state.is_stable
+
+
+def test_motion_after_settling_clears_stable():
+    det = _detector()
+    state, t = _feed(det, [25.2] * 6)
+    assert state.is_stable
+    state = det.add(t, 27.0)
+    assert not state.is_stable
+    assert state.settled_value is None
+
+
+def test_empty_scale_never_stable():
+    det = _detector()
+    state, _ = _feed(det, [0.0, 0.01, 0.02, 0.0, 0.01, 0.0])
+    assert not state.is_stable
+
+
+def test_old_readings_leave_the_window():
+    det = _detector()
+    _feed(det, [30.0, 10.0, 25.2])
+    state, _ = _feed(det, [25.2] * 5, start=0.3)
+    # 30.0 / 10.0 已移出時間窗，最大最小值只剩穩定的讀數
+    assert det.maximum == pytest.approx(25.2)
+    assert det.minimum == pytest.approx(25.2)
+    assert state.is_stable
+
+
+def test_capacity_bounds_window_count():
+    det = _detector(window_seconds=10.0, capacity=8)
+    state, _ = _feed(det, [25.2] * 20)
+    assert state.count == 8
+
+
+def test_reset_clears_window_and_state():
+    det = _detector()
+    _feed(det, [25.2] * 6)
+    assert det.is_stable
+    det.reset()
+    assert det.state == EMPTY_STATE
+    assert det.count == 0
+    assert det.mean == 0.0
+    # 重設後需要重新累積完整的時間窗
+    state = det.add(10.0, 25.2)
+    assert not state.is_stable
+    assert state.time_to_settle is None
@@ -0,0 +1,127 @@
+"""
+write_journal.WriteJournal 的寫入與同步測試（以記憶體 SQLite 模擬伺服器資料庫）
+"""
+
+import sqlite3
+
+import pytest
+
+from write_journal import WriteJournal
+
+
+class FakeServer:
+    """以 event_id 去重的共用資料庫（與 data_loader 的冪等寫入相同）"""
+
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE logs (event_id TEXT PRIMARY KEY, weight REAL)")
+        self.calls = 0
+        self.fail_before = False  # 寫入前失敗（例如伺服器無法連線）
+        self.fail_after = False   # 寫入成功但回應前中斷
+
+    def apply_batch(self, items):
+        self.calls += 1
+        if self.fail_before:
+            raise OSError("server unreachable")
+        with self.conn:
+            for kind, payload in items:
+                assert kind == "piece"
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO logs (event_id, weight) VALUES (?, ?)",
+                    (payload["event_id"], payload["weight"]),
+                )
+        if self.fail_after:
+            raise OSError("connection reset")
+
+    def rows(self):
+        return self.conn.execute("SELECT event_id, weight FROM logs ORDER BY event_id").fetchall()
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+@pytest.fixture
+def journal(tmp_path, server):
+    j = WriteJournal(str(tmp_path / "journal.db"), server.apply_batch, batch_size=2)
+    yield j
+    j.stop()
+
+
+def _piece(n):
+    return {"event_id": f"e{n}", "weight": 25.0 + n / 10}
+
+
+def test_append_is_local_until_sync(journal, server):
+    seq1 = journal.append("piece", _piece(1))
+    seq2 = journal.append("piece", _piece(2))
+    assert seq2 > seq1
+    assert server.calls == 0
+    assert [p["event_id"] for _, _, p in journal.pending("piece")] == ["e1", "e2"]
+    assert journal.backlog()["depth"] == 2
+
+
+def test_sync_once_sends_batches_in_order(journal, server):
+    for n in range(1, 4):
+        journal.append("piece", _piece(n))
+    assert journal.sync_once() == 2
+    assert journal.sync_once() == 1
+    assert journal.sync_once() == 0
+    assert server.rows() == [("e1", 25.1), ("e2", 25.2), ("e3", 25.3)]
+    assert journal.pending() == []
+    assert journal.synced_total == 3
+
+
+def test_failed_sync_keeps_items(journal, server):
+    journal.append("piece", _piece(1))
+    server.fail_before = True
+    with pytest.raises(OSError):
+        journal.sync_once()
+    assert journal.backlog()["depth"] == 1
+    server.fail_before = False
+    assert journal.sync_once() == 1
+    assert server.rows() == [("e1", 25.1)]
+
+
+def test_resent_batch_does_not_duplicate(journal, server):
+    journal.append("piece", _piece(1))
+    journal.append("piece", _piece(2))
+    # 伺服器已寫入，但日誌尚未刪除就中斷 → 下次同步會重送同一批
+    server.fail_after = True
+    with pytest.raises(OSError):
+        journal.sync_once()
+    assert journal.backlog()["depth"] == 2
+    server.fail_after = False
+    assert journal.sync_once() == 2
+    assert server.calls == 2
+    assert server.rows() == [("e1", 25.1), ("e2", 25.2)]
+
+
+def test_pending_items_survive_restart(tmp_path, server):
+    path = str(tmp_path / "journal.db")
+    first = WriteJournal(path, server.apply_batch)
+    first.append("piece", _piece(1))
+    first._conn.close()
+    second = WriteJournal(path, server.apply_batch)
+    assert second.sync_once() == 1
+    assert server.rows() == [("e1", 25.1)]
+
+
+def test_cancel_unsynced_item(journal, server):
+    seq = journal.append("piece", _piece(1))
+    journal.append("piece", _piece(2))
+    assert journal.cancel(seq) is True
+    assert journal.cancel(seq) is False
+    journal.sync_once()
+    assert server.rows() == [("e2", 25.2)]
+
+
+def test_flush_reports_failure(journal, server):
+    journal.append("piece", _piece(1))
+    server.fail_before = True
+    assert journal.flush(timeout=1.0) is False
+    assert journal.backlog()["last_error"] == "server unreachable"
+    server.fail_before = False
+    assert journal.flush(timeout=1.0) is True
+    assert journal.backlog()["depth"] == 0
@@ -0,0 +1,202 @@
+"""
+磅秤原始重量軌跡記錄模組
+在磅秤讀取路徑中記錄儀表實際送出的每一筆重量（單調時間戳, 重量, 穩定旗標），
+以固定長度的二進位格式寫入本機檔案（每條產線每個班別一個檔案），
+供作業員對 PASS/NG 判定有爭議時回放檢查
+
+- 只寫入本機目錄（config.TRACE_DIR），不會碰觸共用的 SQLite 資料庫
+- 寫入先累積在預先配置的緩衝區，約每秒才寫一次檔案，對讀取迴圈幾乎沒有負擔
+- 換班或檔案過大時自動換檔，舊檔於背景壓縮為 .gz
+- load_trace() 以 NumPy memmap 讀取（NumPy 為選用套件）
+
+檔案格式：
+    檔頭 16 bytes：b"SCTRACE1" + 檔案開始時的 (epoch 秒 - 單調時間) 偏移（double）
+    每筆 13 bytes：<d 單調時間戳, <f 重量, <b 穩定旗標（1=穩定, 0=不穩定, -1=未提供）
+"""
+
+import gzip
+import os
+import shutil
+import struct
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b"SCTRACE1"
+HEADER = struct.Struct("<8sd")
+RECORD = struct.Struct("<dfb")
+FILE_SUFFIX = ".sctr"
+
+if np is not None:
+    TRACE_DTYPE = np.dtype([("t", "<f8"), ("weight", "<f4"), ("stable", "i1")])
+else:
+    TRACE_DTYPE = None
+
+
+def _safe_name(text):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(text))
+
+
+class TraceRecorder:
+    """
+    重量軌跡記錄器（由磅秤讀取執行緒呼叫 append）
+
+    參數:
+        directory: 檔案存放目錄（本機）
+        line_name: 產線名稱（用於檔名）
+        shift_key: 回傳目前班別代碼的函數（例如 "20260117_早班"），改變時自動換檔
+        flush_interval: 緩衝區寫入檔案的間隔（秒）
+        max_bytes: 單一檔案大小上限，超過時換檔
+        compress: 換檔後是否將舊檔壓縮為 .gz
+    """
+
+    def __init__(self, directory, line_name, shift_key, flush_interval=1.0,
+                 max_bytes=64 * 1024 * 1024, compress=True, buffer_records=512):
+        self.directory = directory
+        self.line_name = line_name
+        self._shift_key = shift_key
+        self._flush_interval = flush_interval
+        self._max_bytes = max_bytes
+        self._compress = compress
+
+        # 預先配置的寫入緩衝區（struct.pack_into，不為每筆讀數建立新物件）
+        self._buf = bytearray(RECORD.size * buffer_records)
+        self._buf_used = 0
+
+        self._file = None
+        self._path = None
+        self._file_bytes = 0
+        self._current_key = None
+        self._last_flush = 0.0
+        self._last_key_check = 0.0
+        self.records_written = 0
+
+    @property
+    def path(self):
+        """目前寫入中的檔案路徑"""
+        return self._path
+
+    def append(self, timestamp, weight, stable):
+        """加入一筆讀數（stable: True/False/None）"""
+        flag = -1 if stable is None else (1 if stable else 0)
+        if self._buf_used + RECORD.size > len(self._buf):
+            self.flush()
+        RECORD.pack_into(self._buf, self._buf_used, timestamp, weight, flag)
+        self._buf_used += RECORD.size
+        self.records_written += 1
+        if timestamp - self._last_flush >= self._flush_interval:
+            self.flush(timestamp)
+
+    def flush(self, now=None):
+        """將緩衝區寫入檔案（必要時換檔）"""
+        now = time.monotonic() if now is None else now
+        self._last_flush = now
+        # 班別代碼每 5 秒檢查一次即可
+        if self._file is None or now - self._last_key_check >= 5.0:
+            self._last_key_check = now
+            key = self._shift_key()
+            if key != self._current_key or self._file_bytes >= self._max_bytes:
+                self._rotate(key)
+        if self._buf_used == 0:
+            return
+        try:
+            self._file.write(memoryview(self._buf)[:self._buf_used])
+            self._file.flush()
+            self._file_bytes += self._buf_used
+        except OSError as e:
+            print(f"⚠️ 重量軌跡寫入失敗：{e}")
+        self._buf_used = 0
+
+    def close(self):
+        """寫入剩餘資料並關閉檔案（不壓縮目前的檔案）"""
+        if self._buf_used and self._file is not None:
+            self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self, key):
+        old_path = self._path
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if old_path and self._compress:
+            threading.Thread(target=compress_trace, args=(old_path,), daemon=True).start()
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = f"{_safe_name(self.line_name)}_{_safe_name(key)}"
+        path = os.path.join(self.directory, base + FILE_SUFFIX)
+        n = 1
+        # 同一班別已有檔案（例如程式重啟或檔案過大）時使用新的序號
+        while os.path.exists(path) or os.path.exists(path + ".gz"):
+            path = os.path.join(self.directory, f"{base}_{n}{FILE_SUFFIX}")
+            n += 1
+
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, time.time() - time.monotonic()))
+        self._file_bytes = HEADER.size
+        self._path = path
+        self._current_key = key
+
+
+def compress_trace(path):
+    """將軌跡檔壓縮為 .gz 並刪除原檔"""
+    try:
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+    except OSError as e:
+        print(f"⚠️ 壓縮重量軌跡失敗：{path} - {e}")
+
+
+def _read_header(header_bytes, path):
+    magic, epoch_offset = HEADER.unpack(header_bytes)
+    if magic != MAGIC:
+        raise ValueError(f"不是重量軌跡檔：{path}")
+    return epoch_offset
+
+
+def load_trace(path):
+    """
+    讀取軌跡檔為 NumPy 結構化陣列（欄位 t / weight / stable）
+
+    未壓縮檔案以 memmap 直接映射（不載入整個檔案），.gz 檔案解壓縮到記憶體
+
+    回傳:
+        (陣列, epoch_offset)；t + epoch_offset 即為 Unix 時間
+    """
+    if np is None:
+        raise ImportError("讀取重量軌跡需要 NumPy（pip install numpy）")
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            data = f.read()
+        epoch_offset = _read_header(data[:HEADER.size], path)
+        body = data[HEADER.size:]
+        usable = len(body) - len(body) % RECORD.size
+        return np.frombuffer(body[:usable], dtype=TRACE_DTYPE), epoch_offset
+
+    with open(path, "rb") as f:
+        epoch_offset = _read_header(f.read(HEADER.size), path)
+    size = os.path.getsize(path) - HEADER.size
+    count = size // RECORD.size
+    if count == 0:
+        return np.zeros(0, dtype=TRACE_DTYPE), epoch_offset
+    return np.memmap(path, dtype=TRACE_DTYPE, mode="r", offset=HEADER.size, shape=(count,)), epoch_offset
+
+
+def iter_records(path):
+    """逐筆讀取軌跡檔（不需要 NumPy）：產生 (timestamp, weight, stable)"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        _read_header(f.read(HEADER.size), path)
+        while True:
+            chunk = f.read(RECORD.size * 4096)
+            if not chunk:
+                break
+            usable = len(chunk) - len(chunk) % RECORD.size
+            for t, w, flag in RECORD.iter_unpack(chunk[:usable]):
+                yield t, w, (None if flag < 0 else bool(flag))
@@ -0,0 +1,190 @@
+"""
+本機寫入日誌（local-first）
+秤重紀錄先寫入平板本機的 SQLite 日誌（數毫秒內完成），再由背景同步執行緒批次寫入
+伺服器共用資料庫，作業員按下 PASS/NG 時不必等待網路磁碟或資料庫鎖定
+
+- 日誌只存放「尚未同步」的項目，同步成功後即刪除
+- 同步以批次為單位在共用資料庫的單一交易中完成；寫入為冪等操作，
+  同一批次重送（例如寫入成功但刪除日誌前程式中斷）不會產生重複紀錄
+- 伺服器無法連線時保留在日誌中，以指數退避重試
+- backlog() 回報待同步筆數、最舊一筆的等待時間與最後的錯誤訊息
+- cancel() 取消尚未同步的項目（撤銷時不必先等待同步）
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class WriteJournal:
+    """
+    本機寫入日誌與背景同步
+
+    參數:
+        path: 本機日誌檔案路徑
+        apply_batch: 將一批項目寫入共用資料庫的函數 apply_batch([(kind, payload), ...])，
+                     失敗時拋出例外；必須為冪等操作
+        batch_size: 每次同步的最大筆數
+        max_backoff: 同步失敗後最長的重試間隔（秒）
+    """
+
+    def __init__(self, path, apply_batch, batch_size=200, max_backoff=30.0):
+        self.path = path
+        self._apply_batch = apply_batch
+        self._batch_size = batch_size
+        self._max_backoff = max_backoff
+
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._lock = threading.Lock()       # 保護本機日誌連線
+        self._sync_lock = threading.Lock()  # 同一時間只有一個同步在進行
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.last_error = None
+        self.last_sync = None
+        self.synced_total = 0
+        self._failures = 0
+
+    # ------------------------------------------
+    # 寫入（UI 執行緒）
+    # ------------------------------------------
+    def append(self, kind, payload):
+        """寫入一筆項目（本機提交後立即返回），回傳日誌序號"""
+        data = json.dumps(payload, ensure_ascii=False)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO journal (kind, payload, created_at) VALUES (?, ?, ?)",
+                (kind, data, time.time()),
+            )
+            seq = cur.lastrowid
+        self._wakeup.set()
+        return seq
+
+    def cancel(self, seq, timeout=1.0):
+        """
+        取消一筆尚未同步的項目（例如撤銷還在日誌中的紀錄），不需連線伺服器
+
+        參數:
+            timeout: 等待進行中的同步完成的最長秒數
+
+        回傳:
+            True = 已取消；False = 日誌中沒有這一筆（已同步）；None = 同步進行中，無法確定
+        """
+        # 同步中的批次可能已包含這一筆，必須等該批次結束後才能判斷
+        if not self._sync_lock.acquire(timeout=timeout):
+            return None
+        try:
+            with self._lock:
+                cur = self._conn.execute("DELETE FROM journal WHERE seq = ?", (seq,))
+            return cur.rowcount > 0
+        finally:
+            self._sync_lock.release()
+
+    def pending(self, kind=None):
+        """尚未同步的項目 [(seq, kind, payload), ...]（由舊到新）"""
+        sql = "SELECT seq, kind, payload FROM journal"
+        args = ()
+        if kind is not None:
+            sql += " WHERE kind = ?"
+            args = (kind,)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY seq", args).fetchall()
+        return [(seq, k, json.loads(p)) for seq, k, p in rows]
+
+    def backlog(self):
+        """待同步狀態：{'depth': 筆數, 'oldest_age': 最舊一筆等待秒數, 'last_error', 'last_sync'}"""
+        with self._lock:
+            depth, oldest = self._conn.execute("SELECT COUNT(*), MIN(created_at) FROM journal").fetchone()
+        return {
+            "depth": depth,
+            "oldest_age": (time.time() - oldest) if oldest else 0.0,
+            "last_error": self.last_error,
+            "last_sync": self.last_sync,
+            "synced_total": self.synced_total,
+        }
+
+    # ------------------------------------------
+    # 同步
+    # ------------------------------------------
+    def sync_once(self):
+        """同步一批項目，回傳同步筆數（失敗時拋出例外）"""
+        with self._sync_lock:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, kind, payload FROM journal ORDER BY seq LIMIT ?", (self._batch_size,)
+                ).fetchall()
+            if not rows:
+                return 0
+            self._apply_batch([(kind, json.loads(payload)) for _, kind, payload in rows])
+            last_seq = rows[-1][0]
+            with self._lock:
+                self._conn.execute("DELETE FROM journal WHERE seq <= ?", (last_seq,))
+            self.synced_total += len(rows)
+            self.last_sync = time.time()
+            self.last_error = None
+            return len(rows)
+
+    def flush(self, timeout=30.0):
+        """
+        立即同步所有待同步項目（會連線伺服器，請勿在 UI 執行緒呼叫）
+
+        回傳:
+            是否已全部同步
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if self.sync_once() == 0:
+                    return True
+            except Exception as e:
+                self.last_error = str(e)
+                return False
+        return False
+
+    def start(self):
+        """啟動背景同步執行緒"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="WriteJournalSync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wakeup.wait(1.0)
+            self._wakeup.clear()
+            try:
+                # 有積壓時連續同步，直到清空
+                while not self._stop_event.is_set() and self.sync_once() > 0:
+                    pass
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                if self.last_error is None:
+                    print(f"⚠️ 本機日誌同步失敗，稍後重試：{e}")
+                self.last_error = str(e)
+                delay = min(self._max_backoff, 0.5 * (2 ** min(self._failures, 6)))
+                self._stop_event.wait(delay)